@@ -0,0 +1,84 @@
+"""
+Measures the time taken to import start_dbi, and checks that importing the
+package, loading a trace, and checking a trace against a compact model do not
+import sklearn or start_core.
+
+Usage:
+    python benchmarks/import_time.py [--budget SECONDS] [--repeat N]
+
+Exits with a non-zero status if the median import time exceeds the budget or
+if a forbidden module is imported.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# the maximum median time, in seconds, that `import start_dbi` may take
+IMPORT_TIME_BUDGET = 0.5
+
+# modules that must not be imported by start_dbi unless they are needed
+FORBIDDEN_MODULES = ('sklearn', 'start_core')
+
+MEASURE = r"""
+import json, sys, time
+time_start = time.time()
+import start_dbi
+elapsed = time.time() - time_start
+if len(sys.argv) > 1:
+    from start_dbi.trace import Trace
+    from start_dbi.model import Model
+    trace = Trace.from_file(sys.argv[1])
+    if len(sys.argv) > 2:
+        Model.from_file(sys.argv[2]).check(trace)
+modules = sorted(set(m.split('.')[0] for m in sys.modules))
+print(json.dumps({'elapsed': elapsed, 'modules': modules}))
+"""
+
+
+def measure(args):
+    # type: (List[str]) -> Dict[str, Any]
+    dir_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([dir_root, env.get('PYTHONPATH', '')])
+    output = subprocess.check_output([sys.executable, '-c', MEASURE] + args,
+                                     env=env)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', type=float, default=IMPORT_TIME_BUDGET,
+                        help="Maximum median import time, in seconds.")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Number of times to measure the import time.")
+    parser.add_argument('--trace', type=str,
+                        help="A trace file to load after importing.")
+    parser.add_argument('--model', type=str,
+                        help="A compact model file to check the trace against.")  # noqa: pycodestyle
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    extra = []
+    if args.trace:
+        extra.append(args.trace)
+        if args.model:
+            extra.append(args.model)
+
+    results = [measure(extra) for _ in range(args.repeat)]
+    times = sorted(r['elapsed'] for r in results)
+    median = times[len(times) // 2]
+    forbidden = [m for m in FORBIDDEN_MODULES if m in results[-1]['modules']]
+
+    print("import start_dbi: median %.3f s (min %.3f s, max %.3f s, budget %.3f s)"  # noqa: pycodestyle
+          % (median, times[0], times[-1], args.budget))
+    if forbidden:
+        print("forbidden modules imported: %s" % ', '.join(forbidden))
+    if median > args.budget or forbidden:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Runs the start_dbi benchmark suite against synthetic traces, and writes the
+results to a JSON file.
+
+Usage:
+    python benchmarks/run.py [--signals 1000,10000] [--traces 100,1000]
+                             [--benchmarks NAMES] [--output results.json]
+                             [--compare baseline.json]
+
+Each benchmark is run in a separate process for every combination of signals
+and traces, so that its peak memory usage can be measured.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DIR_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, DIR_ROOT)
+
+import numpy
+
+from start_dbi.trace import Trace
+from start_dbi.model import Model, LOF
+
+from synthetic import SyntheticTraces
+
+
+def _percentiles(latencies):
+    # type: (List[float]) -> Dict[str, float]
+    p50, p90, p99 = numpy.percentile(latencies, [50, 90, 99])
+    return {'p50': float(p50), 'p90': float(p90), 'p99': float(p99)}
+
+
+def _timed_each(func, items):
+    # type: (Callable[[Any], Any], Sequence[Any]) -> Tuple[float, List[float]]
+    latencies = []
+    time_start = time.time()
+    for item in items:
+        time_item = time.time()
+        func(item)
+        latencies.append(time.time() - time_item)
+    return time.time() - time_start, latencies
+
+
+def bench_trace_to_file(traces, args, binary):
+    dir_tmp = tempfile.mkdtemp('.bench', 'start')
+    try:
+        ext = '.btrace' if binary else '.trace'
+        filenames = [os.path.join(dir_tmp, '{}{}'.format(i, ext))
+                     for i in range(len(traces))]
+        items = list(zip(traces, filenames))
+        return _timed_each(lambda x: x[0].to_file(x[1], binary=binary), items)
+    finally:
+        shutil.rmtree(dir_tmp, ignore_errors=True)
+
+
+def bench_trace_from_file(traces, args, binary):
+    dir_tmp = tempfile.mkdtemp('.bench', 'start')
+    try:
+        ext = '.btrace' if binary else '.trace'
+        filenames = []
+        for (i, trace) in enumerate(traces):
+            filename = os.path.join(dir_tmp, '{}{}'.format(i, ext))
+            trace.to_file(filename, binary=binary)
+            filenames.append(filename)
+        # the values of each trace are summed so that memory-mapped values
+        # are actually read
+        return _timed_each(lambda fn: Trace.from_file(fn).array.sum(),
+                           filenames)
+    finally:
+        shutil.rmtree(dir_tmp, ignore_errors=True)
+
+
+def bench_model_build(traces, args):
+    time_start = time.time()
+    Model.build(traces)
+    return time.time() - time_start, None
+
+
+def bench_model_check(traces, args):
+    model = Model.build(traces)
+    return _timed_each(model.check, traces)
+
+
+def bench_model_check_many(traces, args):
+    model = Model.build(traces)
+    time_start = time.time()
+    model.check_many(traces)
+    return time.time() - time_start, None
+
+
+def bench_model_check_many_cascade(traces, args):
+    model = Model.build(traces, prefilter=True)
+    time_start = time.time()
+    model.check_many(traces)
+    return time.time() - time_start, None
+
+
+def bench_lof_build(traces, args):
+    time_start = time.time()
+    LOF.build(traces, neighbors=min(20, len(traces) - 1))
+    return time.time() - time_start, None
+
+
+def bench_lof_check_many(traces, args):
+    lof = LOF.build(traces, neighbors=min(20, len(traces) - 1))
+    time_start = time.time()
+    lof.check_many(traces)
+    return time.time() - time_start, None
+
+
+BENCHMARKS = {
+    'trace_to_file_text': lambda t, a: bench_trace_to_file(t, a, False),
+    'trace_to_file_binary': lambda t, a: bench_trace_to_file(t, a, True),
+    'trace_from_file_text': lambda t, a: bench_trace_from_file(t, a, False),
+    'trace_from_file_binary': lambda t, a: bench_trace_from_file(t, a, True),
+    'model_build': bench_model_build,
+    'model_check': bench_model_check,
+    'model_check_many': bench_model_check_many,
+    'model_check_many_cascade': bench_model_check_many_cascade,
+    'lof_build': bench_lof_build,
+    'lof_check_many': bench_lof_check_many
+}
+
+
+def run_case(name, num_signals, num_traces, args):
+    # type: (str, int, int, argparse.Namespace) -> Dict[str, Any]
+    """
+    Runs a single benchmark within the current process.
+    """
+    population = SyntheticTraces(num_signals, seed=args.seed)
+    traces = population.traces(num_traces)
+    rss_baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    seconds, latencies = BENCHMARKS[name](traces, args)
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    result = {
+        'benchmark': name,
+        'num_signals': num_signals,
+        'num_traces': num_traces,
+        'seconds': seconds,
+        'throughput': num_traces / seconds if seconds > 0 else None,
+        'peak_rss_bytes': rss_peak,
+        'baseline_rss_bytes': rss_baseline
+    }
+    if latencies:
+        result['latency'] = _percentiles(latencies)
+    return result
+
+
+def run_case_isolated(name, num_signals, num_traces, args):
+    # type: (str, int, int, argparse.Namespace) -> Dict[str, Any]
+    """
+    Runs a single benchmark within a separate process.
+    """
+    command = [sys.executable, os.path.abspath(__file__),
+               '--case', name,
+               '--signals', str(num_signals),
+               '--traces', str(num_traces),
+               '--seed', str(args.seed)]
+    output = subprocess.check_output(command)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def environment():
+    # type: () -> Dict[str, Any]
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                           cwd=DIR_ROOT,
+                                           stderr=subprocess.STDOUT)
+        revision = revision.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {'revision': revision,
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform()}
+
+
+def compare(results, filename_baseline):
+    # type: (List[Dict[str, Any]], str) -> None
+    """
+    Prints the change in time and peak memory usage for each benchmark
+    relative to a given set of baseline results.
+    """
+    with open(filename_baseline, 'r') as f:
+        baseline = json.load(f)['results']
+    index = {(r['benchmark'], r['num_signals'], r['num_traces']): r
+             for r in baseline}
+    for result in results:
+        key = (result['benchmark'], result['num_signals'], result['num_traces'])  # noqa: pycodestyle
+        if key not in index:
+            continue
+        before = index[key]
+        print("{:<24} {:>7} x {:<6} time {:+7.1%}  peak rss {:+7.1%}".format(
+            key[0], key[1], key[2],
+            result['seconds'] / before['seconds'] - 1.0,
+            float(result['peak_rss_bytes']) / before['peak_rss_bytes'] - 1.0))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--signals', type=str, default='1000,10000',
+                        help="Comma separated list of trace widths.")
+    parser.add_argument('--traces', type=str, default='100,1000',
+                        help="Comma separated list of corpus sizes.")
+    parser.add_argument('--benchmarks', type=str,
+                        default=','.join(sorted(BENCHMARKS)),
+                        help="Comma separated list of benchmarks to run.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='benchmark.json',
+                        help="File to which the results are written.")
+    parser.add_argument('--compare', type=str,
+                        help="Results of an earlier run to compare against.")
+    parser.add_argument('--case', type=str, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    # the loggers of start_dbi log at the debug level, and so the level is
+    # applied to the handler rather than to the root logger
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.WARNING)
+    logging.getLogger().addHandler(handler)
+    if args.case:
+        result = run_case(args.case, int(args.signals), int(args.traces), args)  # noqa: pycodestyle
+        print(json.dumps(result))
+        return
+
+    names = args.benchmarks.split(',')
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError("unknown benchmark: {}".format(name))
+    results = []
+    for num_signals in [int(x) for x in args.signals.split(',')]:
+        for num_traces in [int(x) for x in args.traces.split(',')]:
+            for name in names:
+                result = run_case_isolated(name, num_signals, num_traces, args)
+                results.append(result)
+                print("{:<24} {:>7} x {:<6} {:9.3f} s {:10.1f} traces/s {:8.1f} MiB".format(  # noqa: pycodestyle
+                    name, num_signals, num_traces, result['seconds'],
+                    result['throughput'] or 0.0,
+                    result['peak_rss_bytes'] / float(1 << 20)))
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f,
+                  indent=2)
+    print("wrote results to: {}".format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Generates synthetic execution traces that resemble those produced by the
+debgrind Valgrind tool, so that start_dbi can be benchmarked without running
+ArduPilot.
+"""
+import numpy
+
+from start_dbi.trace import Trace
+
+
+def signal_names(num_signals):
+    # type: (int) -> List[str]
+    return ['0x{:08x}'.format(0x400000 + 16 * i) for i in range(num_signals)]
+
+
+class SyntheticTraces(object):
+    """
+    Describes a population of synthetic traces with a fixed set of signals.
+    """
+    def __init__(self, num_signals, seed=0, anomaly_fraction=0.01):
+        # type: (int, int, float) -> None
+        """
+        Parameters:
+            num_signals: the number of distinct signals in the population.
+            seed: the seed for the random number generator.
+            anomaly_fraction: the fraction of signals affected by anomalies.
+        """
+        self.__rng = numpy.random.RandomState(seed)
+        rng = self.__rng
+        self.__signals = signal_names(num_signals)
+        # most signals are reported by almost every trace or by very few, and
+        # their typical counts are heavy-tailed
+        self.__probability = rng.beta(0.3, 0.3, size=num_signals)
+        self.__rate = numpy.ceil(rng.lognormal(mean=2.0, sigma=2.0,
+                                               size=num_signals))
+        num_affected = max(1, int(anomaly_fraction * num_signals))
+        self.__affected = rng.choice(num_signals, size=num_affected,
+                                     replace=False)
+
+    @property
+    def signals(self):
+        # type: () -> List[str]
+        return list(self.__signals)
+
+    def trace(self, anomalous=False):
+        # type: (bool) -> Trace
+        """
+        Generates a single trace. Only the signals that are reported by the
+        trace are included, in the order in which they are first executed.
+        """
+        rng = self.__rng
+        probability = self.__probability
+        rate = self.__rate
+        if anomalous:
+            probability = probability.copy()
+            rate = rate.copy()
+            probability[self.__affected] = 1.0
+            rate[self.__affected] *= rng.uniform(2.0, 10.0,
+                                                 size=len(self.__affected))
+        reported = numpy.flatnonzero(rng.random_sample(len(rate)) < probability)  # noqa: pycodestyle
+        counts = rng.poisson(rate[reported]) + 1
+        signals = [self.__signals[i] for i in reported]
+        return Trace.from_arrays(signals, counts.astype(numpy.float64))
+
+    def traces(self, num_traces, anomalous=False):
+        # type: (int, bool) -> List[Trace]
+        return [self.trace(anomalous=anomalous) for _ in range(num_traces)]
@@ -10,6 +10,9 @@ from start_core.test import execute
 from start_core.scenario import Scenario
 from start_dbi.trace import Trace
 from start_dbi.model import Model, LOF
+from start_dbi.store import TraceStore
+from start_dbi.builds import BuildCache
+from start_dbi.server import ScoringClient
 from sklearn.decomposition import PCA
 from sklearn.neighbors import LocalOutlierFactor
 from sklearn.preprocessing import MaxAbsScaler
@@ -29,16 +32,20 @@ logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s
 #
 ################################################################################
 # Run the binary a few times
-def run_multiple_times(scenario, num_iter):
+def run_multiple_times(scenario, num_iter, workers=1):
+    jobs = [dict(sitl=scenario.sitl,
+                 mission=scenario.mission,
+                 timeout_mission=600,
+                 timeout_connection=2000,
+                 timeout_liveness=30) for _ in range(num_iter)]
     traces = []
-    for i in range(num_iter):
-        logging.debug("Running iteration %d of %d" % (i, num_iter))
-        trace = Trace.generate(scenario.sitl,
-                               scenario.mission,
-                               timeout_mission=600,
-                               timeout_connection=2000,
-                               timeout_liveness=30)
-        traces.append(trace)
+    for result in Trace.generate_many(jobs, workers=workers):
+        logging.debug("Finished iteration %d of %d" % (result.index, num_iter))
+        if result.error:
+            print("Failed to run the trace.")
+            print(result.error)
+            continue
+        traces.append(result.trace)
     return traces
 
 ################################################################################
@@ -176,11 +183,32 @@ def parse_arguments():
     parser.add_argument('-p', '--test_patch', type=str,
                         default='no_patch',
                         help="Comma separated list of patches to test.")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of traces to generate concurrently')
     parser.add_argument('--use_existing_traces', type=bool)
     parser.add_argument('--trace_dir', type=str)
+    parser.add_argument('--trace_store', type=str,
+                        help="Directory of a TraceStore to load traces from.")
     parser.add_argument('--lof', action='store_true', default=False)
+    parser.add_argument('--lof_algorithm', type=str, default='auto',
+                        choices=['auto', 'brute', 'ball_tree', 'kd_tree', 'approximate'],
+                        help="Neighbor index used by the LOF model.")
+    parser.add_argument('--lof_components', type=int,
+                        help="Number of components to project signals onto before finding neighbors.")
     parser.add_argument('--plot', action='store_true', default=False)
     parser.add_argument('--patch_name_set', type=str, action="append")
+    parser.add_argument('--build_cache', type=str,
+                        help="Directory of a cache of patched ArduPilot builds.")
+    parser.add_argument('--server', type=str,
+                        help="Socket of a scoring server (start_dbi serve) to check patches with, rather than loading the model.")
+    parser.add_argument('--tune_attack_dir', type=str,
+                        help="Directory of attack traces; if given, the SVM parameters are tuned against them.")
+    parser.add_argument('--tune_holdout', type=float, default=0.2,
+                        help="Fraction of nominal traces held out when tuning.")
+    parser.add_argument('--chunk_size', type=int,
+                        help="If given, the model is built out of core, reading this many traces at a time.")
+    parser.add_argument('--prefilter', action='store_true', default=False,
+                        help="Fit a prefilter that resolves obviously nominal or anomalous traces before the SVM.")
     args = parser.parse_args()
     return args
 
@@ -192,92 +220,140 @@ def parse_arguments():
 def main():
     args = parse_arguments()
     nominal_traces = []
+    store = None
 
     scenarios = [os.path.join(scenarios_root, x) for x in
                  args.scenarios.split(',')]
 
-    try:
-        print("Trying to load model from file: %s" % args.filename)
-        model = Model.from_file(args.filename)
-    except:
-        print("building model")
-        if args.use_existing_traces:
-            if (os.path.isdir(args.trace_dir)):
-                trace_fns = [os.path.join(args.trace_dir, x) for x in
-                             os.listdir(args.trace_dir) if x.endswith('.trace')]
-                nominal_traces = [Trace.from_file(x) for x in trace_fns]
-                print("nominal_traces: %s" % nominal_traces)
+    if args.server:
+        model = ScoringClient(args.server)
+    else:
+        try:
+            print("Trying to load model from file: %s" % args.filename)
+            if args.lof:
+                model = LOF.from_file(args.filename)
+            else:
+                model = Model.from_file(args.filename)
+        except:
+            print("building model")
+            if args.trace_store:
+                store = TraceStore(args.trace_store, mode='r')
+                trace_fns = [store.name(i) for i in range(len(store))]
+                nominal_traces = store.traces()
+            elif args.use_existing_traces:
+                if (os.path.isdir(args.trace_dir)):
+                    trace_fns = [os.path.join(args.trace_dir, x) for x in
+                                 os.listdir(args.trace_dir) if x.endswith('.trace')]
+                    nominal_traces = [Trace.from_file(x) for x in trace_fns]
+                    print("nominal_traces: %s" % nominal_traces)
+                else:
+                    print("trace_dir %s is not a dir. exiting")
+                    exit()
+
+            else:
+                for fn_scenario in scenarios:
+                    logging.debug("Running scenario %s" % fn_scenario)
+                    scenario = Scenario.from_file(fn_scenario)
+                    nominal_traces += run_multiple_times(scenario, args.num_iter,
+                                                         args.workers)
+
+
+            if args.lof:
+                if args.chunk_size:
+                    lof = LOF.build_streaming(store if store is not None else nominal_traces,
+                                              chunk_size=args.chunk_size,
+                                              neighbors=5,
+                                              algorithm=args.lof_algorithm,
+                                              n_components=args.lof_components)
+                else:
+                    lof = LOF.build(nominal_traces, neighbors=5,
+                                    algorithm=args.lof_algorithm,
+                                    n_components=args.lof_components)
+                predictions = lof.labels
+                lof.to_file(args.filename)
+                model = lof
+                assert(len(predictions) == len(nominal_traces))
+                assert(len(trace_fns) == len(predictions))
+                zipped = zip(trace_fns, predictions)
+                print("*"*80)
+                print("Predictions")
+                print("*"*80)
+                zipped.sort(key=lambda x: x[0])
+
+                def patch_name(fn):
+                    scenario_name = fn.partition("scenario")[2]
+                    scenario_name = scenario_name.partition("_mission")[0]
+                    shorter = fn.rpartition(".diff")[0]
+                    shorter = shorter.rpartition("_")[2]
+                    return "%s_%s" % (scenario_name, shorter)
+                for trace_fn, pred in zipped:
+                    pred_word = "Compromised" if pred == -1 else "Not-Compromised"
+                    print("trace file: %s\nprediction: %s" %
+                          (patch_name(trace_fn), pred_word))
+
+                compromised_list = [ x for x in zipped if x[1] == -1]
+                not_compromised_list = [ x for x in zipped if x[1] == 1]
+                assert(len(compromised_list) + len(not_compromised_list) ==
+                       len(zipped))
+                print("Compromised: %s" % [ patch_name(x[0]) for x
+                                            in compromised_list])
+                print("Not compromised: %s" % [patch_name(x[0]) for x in
+                                               not_compromised_list])
+
+
+                #print("nominal traces shape: %s" % np.array(nominal_traces).shape)
+                #print(nominal_traces)
+                #print("predictions shape: %s" % np.array(predictions).shape)
+                #print(predictions)
+
+
+                if args.plot:
+                    indexes = []
+                    if args.patch_name_set:
+                        patch_name_sets = [x.split(',') for x in
+                                           args.patch_name_set]
+
+                        for patch_name_set in patch_name_sets:
+                            indexes_one = [ 1 if patch_name(x) in
+                                            patch_name_set else 0
+                                            for x in trace_fns ]
+                            indexes.append(indexes_one)
+                    plot(np.array([ x.values for x in nominal_traces]),
+                         np.array(predictions),
+                         lof, indexes=indexes)
+
+
+            elif args.tune_attack_dir:
+                nominal_traces = list(nominal_traces)
+                num_holdout = max(int(len(nominal_traces) * args.tune_holdout), 1)
+                attack_traces = [Trace.from_file(os.path.join(args.tune_attack_dir, x))
+                                 for x in os.listdir(args.tune_attack_dir)
+                                 if x.endswith('.trace')]
+                result = Model.tune(nominal_traces[num_holdout:],
+                                    nominal_traces[:num_holdout],
+                                    attack_traces,
+                                    workers=args.workers)
+                for row in result.table:
+                    print("%s: false positives %.3f, detections %.3f, auc %.3f" %
+                          (row['params'], row.get('false_positive_rate', float('nan')),
+                           row.get('detection_rate', float('nan')),
+                           row.get('auc', float('nan'))))
+                print("Best parameters: %s" % result.params)
+                model = result.model
+                model.to_file(args.filename)
+                logging.debug("saved model to: %s" % args.filename)
+
             else:
-                print("trace_dir %s is not a dir. exiting")
-                exit()
-
-        else:
-            for fn_scenario in scenarios:
-                logging.debug("Running scenario %s" % fn_scenario)
-                scenario = Scenario.from_file(fn_scenario)
-                nominal_traces += run_multiple_times(scenario, args.num_iter)
-
-
-        if args.lof:
-            lof = LOF()
-            predictions = lof.build(nominal_traces, neighbors=5)
-            assert(len(predictions) == len(nominal_traces))
-            assert(len(trace_fns) == len(predictions))
-            zipped = zip(trace_fns, predictions)
-            print("*"*80)
-            print("Predictions")
-            print("*"*80)
-            zipped.sort(key=lambda x: x[0])
-
-            def patch_name(fn):
-                scenario_name = fn.partition("scenario")[2]
-                scenario_name = scenario_name.partition("_mission")[0]
-                shorter = fn.rpartition(".diff")[0]
-                shorter = shorter.rpartition("_")[2]
-                return "%s_%s" % (scenario_name, shorter)
-            for trace_fn, pred in zipped:
-                pred_word = "Compromised" if pred == -1 else "Not-Compromised"
-                print("trace file: %s\nprediction: %s" %
-                      (patch_name(trace_fn), pred_word))
-
-            compromised_list = [ x for x in zipped if x[1] == -1]
-            not_compromised_list = [ x for x in zipped if x[1] == 1]
-            assert(len(compromised_list) + len(not_compromised_list) ==
-                   len(zipped))
-            print("Compromised: %s" % [ patch_name(x[0]) for x
-                                        in compromised_list])
-            print("Not compromised: %s" % [patch_name(x[0]) for x in
-                                           not_compromised_list])
-
-
-            #print("nominal traces shape: %s" % np.array(nominal_traces).shape)
-            #print(nominal_traces)
-            #print("predictions shape: %s" % np.array(predictions).shape)
-            #print(predictions)
-
-
-            if args.plot:
-                indexes = []
-                if args.patch_name_set:
-                    patch_name_sets = [x.split(',') for x in
-                                       args.patch_name_set]
-
-                    for patch_name_set in patch_name_sets:
-                        indexes_one = [ 1 if patch_name(x) in
-                                        patch_name_set else 0
-                                        for x in trace_fns ]
-                        indexes.append(indexes_one)
-                plot(np.array([ x.values for x in nominal_traces]),
-                     np.array(predictions),
-                     lof.get_model(), indexes=indexes)
-
-
-        else:
-            model = Model.build(nominal_traces)
-            logging.debug("created model: %s" % model)
-
-            model.to_file(args.filename)
-            logging.debug("saved model to: %s" % args.filename)
+                if args.chunk_size:
+                    model = Model.build_streaming(store if store is not None else nominal_traces,
+                                                  chunk_size=args.chunk_size)
+                else:
+                    model = Model.build(nominal_traces,
+                                        prefilter=args.prefilter)
+                logging.debug("created model: %s" % model)
+
+                model.to_file(args.filename)
+                logging.debug("saved model to: %s" % args.filename)
 
 
     if args.test_patch != 'no_patch':
@@ -289,8 +365,14 @@ def main():
                 for fn_scenario in scenarios:
                     scenario = Scenario.from_file(fn_scenario)
                     dir_ardupilot = "/usr0/home/dskatz/ardupilot_tmp/ardupilot/"
-                    with scenario.build(dir_ardupilot,
-                                        filename_patch=patch) as sitl:
+                    if args.build_cache:
+                        build_cache = BuildCache(args.build_cache, dir_ardupilot)
+                        build = build_cache.build(scenario,
+                                                  filename_patch=patch)
+                    else:
+                        build = scenario.build(dir_ardupilot,
+                                               filename_patch=patch)
+                    with build as sitl:
                         logging.debug("Testing patch %s with scenario %s" %
                                       (patch, scenario))
                         trace = Trace.generate(sitl,
@@ -1,4 +1,5 @@
 import argparse
+import functools
 import logging
 import os
 import uuid
@@ -7,6 +8,10 @@ from start_core.test import execute
 from start_core.scenario import Scenario
 from start_dbi.trace import Trace
 from start_dbi.model import Model
+from start_dbi.cache import TraceCache
+from start_dbi.builds import BuildCache
+from start_dbi.campaign import Campaign
+from start_dbi.parallel import ENV_WORKER_INDEX, isolate_ports
 
 scenarios_root='/usr0/home/dskatz/Documents/umich_demo/start/start-scenarios/'
 output_root='/usr0/home/dskatz/Documents/umich_demo/start_stack/start_dbi/cached_traces/'
@@ -18,63 +23,53 @@ logger.setLevel(logging.DEBUG)
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 ###############################################################################
 #
-# run_multiple_times
+# run_job
 #
 ################################################################################
-# Run the binary a few times
-def run_multiple_times(scenario, num_iter, to_attack, filename_base,
-                       patch=None):
-
-    if to_attack:
-        attack = scenario.attack
-    else:
-        attack = None
-    filenames = []
+# Run a single job of the campaign (i.e., one run of a scenario's mission,
+# with or without its attack, and optionally with a patch applied)
+def run_job(options, spec):
+    scenario = Scenario.from_file(spec['scenario'])
+    cache = None
+    if options['trace_cache']:
+        cache = TraceCache(options['trace_cache'],
+                           samples_per_key=options['samples_per_key'],
+                           max_bytes=options['trace_cache_size'])
+    attack = scenario.attack if spec['attack'] else None
+
+    def run(sitl):
+        # concurrent workers use distinct ports, offset by their index
+        job = isolate_ports(dict(sitl=sitl, attack=attack),
+                            int(os.environ.get(ENV_WORKER_INDEX, 0)),
+                            shared=options['workers'] > 1)
+        trace = Trace.generate(job['sitl'],
+                               scenario.mission,
+                               timeout_mission=600,
+                               timeout_connection=2000,
+                               timeout_liveness=30,
+                               attack=job['attack'],
+                               cache=cache,
+                               speedup=options['speedup'],
+                               normalize=options['normalize'])
+        uuid_tmp = (uuid.uuid4()).hex
+        filename = os.path.join(output_root,
+                                "%s_%s.trace" % (spec['filename_base'], uuid_tmp))
+        print("Filename: %s" % filename)
+        trace.to_file(filename)
+        return {'filename': filename}
+
+    patch = spec['patch']
     if patch:
-        with scenario.build(dir_ardupilot, filename_patch=patch) as sitl:
+        if options['build_cache']:
+            build_cache = BuildCache(options['build_cache'], dir_ardupilot,
+                                     max_bytes=options['build_cache_size'])
+            build = build_cache.build(scenario, filename_patch=patch)
+        else:
+            build = scenario.build(dir_ardupilot, filename_patch=patch)
+        with build as sitl:
             print("Testing patch %s with scenario %s" % (patch, scenario))
-            for i in range(num_iter):
-                logging.debug("Running iteration %d of %d" % (i, num_iter))
-                uuid_tmp = (uuid.uuid4()).hex
-                filename = os.path.join(output_root,
-                                        "%s_%s.trace" % (filename_base,
-                                                         uuid_tmp))
-                print("Filename: %s" % filename)
-                try:
-                    trace = Trace.generate(sitl,
-                                           scenario.mission,
-                                           timeout_mission=600,
-                                           timeout_connection=2000,
-                                           timeout_liveness=30,
-                                           attack=attack)
-                    trace.to_file(filename)
-                    filenames.append(filename)
-                except Exception as e:
-                    print("Failed to run the trace.")
-                    print(traceback.format_exc())
-
-    else:
-        for i in range(num_iter):
-            logging.debug("Running iteration %d of %d" % (i, num_iter))
-            uuid_tmp = (uuid.uuid4()).hex
-            filename = os.path.join(output_root,
-                                    "%s_%s.trace" % (filename_base, uuid_tmp))
-            print("Filename: %s" % filename)
-
-            try:
-                trace = Trace.generate(scenario.sitl,
-                                       scenario.mission,
-                                       timeout_mission=600,
-                                       timeout_connection=2000,
-                                       timeout_liveness=30,
-                                       attack=attack)
-            except Exception as e:
-                print("Failed to run the trace.")
-                print(traceback.format_exc())
-
-            trace.to_file(filename)
-            filenames.append(filename)
-    return filenames
+            return run(sitl)
+    return run(scenario.sitl)
 
 ################################################################################
 #
@@ -95,6 +90,29 @@ def parse_arguments():
                         help="Comma separated list of patches to test.")
     parser.add_argument("--num_patch", type=int, default=1,
                         help="Number of times to run each patch.")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Number of traces to generate concurrently')
+    parser.add_argument('--trace_cache', type=str,
+                        help="Directory of a cache of previously generated traces.")
+    parser.add_argument('--trace_cache_size', type=int,
+                        help="Maximum size of the trace cache, in bytes.")
+    parser.add_argument('--build_cache', type=str,
+                        help="Directory of a cache of patched ArduPilot builds.")
+    parser.add_argument('--build_cache_size', type=int,
+                        help="Disk budget for the build cache, in bytes.")
+    parser.add_argument('--speedup', type=float, default=1,
+                        help="Speedup at which the SITL is run.")
+    parser.add_argument('--normalize', action='store_true', default=False,
+                        help="Divide each signal by the sum of all signals.")
+    parser.add_argument('--campaign', type=str,
+                        default=os.path.join(output_root, 'campaign.db'),
+                        help="Database of the jobs of the campaign, which is resumed if it exists.")
+    parser.add_argument('--max_attempts', type=int, default=3,
+                        help="Maximum number of attempts for each job.")
+    parser.add_argument('--backoff', type=float, default=60.0,
+                        help="Seconds to wait before retrying a failed job (doubles per attempt).")
+    parser.add_argument('--retry_failed', action='store_true', default=False,
+                        help="Retry the jobs that failed in a previous run of the campaign.")
     args = parser.parse_args()
     return args
 
@@ -133,43 +151,76 @@ def main():
                  args.scenarios.split(',')]
     if not os.path.isdir(output_root):
         os.makedirs(output_root)
+    campaign = Campaign(args.campaign,
+                        max_attempts=args.max_attempts,
+                        backoff=args.backoff)
 
+    # the jobs are enumerated every time, but jobs that are already part of
+    # the campaign are skipped, and so an interrupted campaign is resumed
+    jobs = []
     for fn_scenario in scenarios:
         try:
             scenario = Scenario.from_file(fn_scenario)
-            scenario_name = (fn_scenario.split('/'))[-2]
-            print(scenario_name)
-            # Temporary till we get more missions
-            missions = [scenario.mission]
-
-            patches = get_patches(scenario_name)
-            print("Patches: %s" % patches)
-            for mission in missions:
-                mission_fn = (mission.filename).split('/')[-2]
-                print("**********MISSION_FN: %s*****************" % mission_fn)
-                for to_attack in "attack", "noattack":
-                    filename_base = "scenario%s_mission%s_%s" % (scenario_name,
-                                                                 mission_fn,
-                                                                 to_attack)
-                    attack = True if to_attack == "attack" else False
-
-                    run_multiple_times(scenario, args.num_iter, attack,
-                                       filename_base)
-
-                print ("****************************STARTING PATCHES****************")
-                for patch in patches:
-                    print("PATCH: %s" % patch)
-                    filename_base = ("scenario%s_mission%s_%s_patch%s" %
-                                     (scenario_name, mission_fn, "attack",
-                                      os.path.basename(patch)))
-                    run_multiple_times(scenario, args.num_patch, True,
-                                       filename_base,
-                                       patch=patch)
-
-
         except Exception as e:
             print("Failed to get the scenario for %s." % fn_scenario)
             print(traceback.format_exc())
+            continue
+        scenario_name = (fn_scenario.split('/'))[-2]
+        print(scenario_name)
+        # Temporary till we get more missions
+        missions = [scenario.mission]
+
+        patches = get_patches(scenario_name)
+        print("Patches: %s" % patches)
+        for mission in missions:
+            mission_fn = (mission.filename).split('/')[-2]
+            print("**********MISSION_FN: %s*****************" % mission_fn)
+            for to_attack in "attack", "noattack":
+                filename_base = "scenario%s_mission%s_%s" % (scenario_name,
+                                                             mission_fn,
+                                                             to_attack)
+                for i in range(args.num_iter):
+                    jobs.append(("%s/%d" % (filename_base, i),
+                                 dict(scenario=fn_scenario,
+                                      attack=(to_attack == "attack"),
+                                      patch=None,
+                                      filename_base=filename_base)))
+
+            for patch in patches:
+                filename_base = ("scenario%s_mission%s_%s_patch%s" %
+                                 (scenario_name, mission_fn, "attack",
+                                  os.path.basename(patch)))
+                for i in range(args.num_patch):
+                    jobs.append(("%s/%d" % (filename_base, i),
+                                 dict(scenario=fn_scenario,
+                                      attack=True,
+                                      patch=patch,
+                                      filename_base=filename_base)))
+
+    print("Added %d of %d jobs to campaign %s" %
+          (campaign.add_many(jobs), len(jobs), args.campaign))
+    if args.retry_failed:
+        print("Retrying %d failed jobs" % campaign.retry_failed())
+
+    options = dict(trace_cache=args.trace_cache,
+                   trace_cache_size=args.trace_cache_size,
+                   samples_per_key=max(args.num_iter, args.num_patch),
+                   build_cache=args.build_cache,
+                   build_cache_size=args.build_cache_size,
+                   speedup=args.speedup,
+                   normalize=args.normalize,
+                   workers=args.workers)
+    stats = campaign.run(functools.partial(run_job, options),
+                         workers=args.workers)
+    print("Campaign: %s" % stats)
+    for job in campaign.jobs(status='failed'):
+        print("Failed job %s after %d attempts:" % (job['key'], job['attempts']))
+        print(job['error'])
+
+    if args.trace_cache:
+        print("Trace cache: %s" % TraceCache(args.trace_cache).stats)
+    if args.build_cache:
+        print("Build cache: %s" % BuildCache(args.build_cache, dir_ardupilot).stats)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,41 @@
+import argparse
+import logging
+
+from start_dbi.trace import convert_traces
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+################################################################################
+#
+# parse_arguments
+#
+################################################################################
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('trace_dir', type=str,
+                        help="Directory containing the .trace files.")
+    parser.add_argument('-o', '--output_dir', type=str,
+                        help="Directory to write the .btrace files to.")
+    parser.add_argument('--remove', action='store_true', default=False,
+                        help="Remove each .trace file once converted.")
+    args = parser.parse_args()
+    return args
+
+
+################################################################################
+#
+# main
+#
+################################################################################
+def main():
+    args = parse_arguments()
+    filenames = convert_traces(args.trace_dir,
+                               output_directory=args.output_dir,
+                               remove=args.remove)
+    print("Converted %d traces." % len(filenames))
+
+if __name__ == '__main__':
+    main()
@@ -14,5 +14,8 @@ setuptools.setup(
         'sklearn',
         'scipy'
     ],
-    packages=['start_dbi']
+    packages=['start_dbi'],
+    entry_points={
+        'console_scripts': ['start_dbi = start_dbi.__main__:main']
+    }
 )
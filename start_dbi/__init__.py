@@ -1,18 +1,21 @@
 """
 This package provides an interface to START's DBI module.
 """
+from typing import List, TYPE_CHECKING
 import logging
 
-import numpy as np
-from start_core.scenario import Scenario
-from start_core.mission import Mission
-
 from .trace import Trace
 from .model import Model
 
 logger = logging.getLogger(__name__)  # type: logging.Logger
 logger.setLevel(logging.DEBUG)
 
+# start_core is only imported for the purposes of type checking, since it is
+# slow to import and is not needed to load traces or to check them.
+if TYPE_CHECKING:
+    from start_core.scenario import Scenario
+    from start_core.mission import Mission
+
 
 def learn(scenario, missions):
     # type: (Scenario, List[Mission]) -> Model
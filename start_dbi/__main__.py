@@ -0,0 +1,136 @@
+"""
+Provides the command-line interface for start_dbi.
+
+Usage:
+    start_dbi serve --socket PATH --model [NAME=]FILE [--model ...]
+    start_dbi serve --socket PATH --registry DIR
+    start_dbi generate --scenario FILE [--attack] --output FILE
+    start_dbi generate --job FILE --output FILE
+"""
+import argparse
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+
+def parse_model(spec):
+    # type: (str) -> Tuple[str, str]
+    """
+    Parses a model specification of the form [NAME=]FILE. If no name is
+    given, the model is named after its file.
+    """
+    name, sep, filename = spec.partition('=')
+    if not sep:
+        filename = spec
+        name = os.path.splitext(os.path.basename(spec))[0]
+    return name, filename
+
+
+def serve(args):
+    # type: (argparse.Namespace) -> None
+    from .server import ScoringServer
+    registry = None
+    if args.registry:
+        from .registry import ModelRegistry
+        registry = ModelRegistry(args.registry,
+                                 capacity=args.registry_capacity)
+    filenames = dict(parse_model(spec) for spec in args.model or [])
+    server = ScoringServer.from_files(args.socket,
+                                      filenames,
+                                      max_batch_size=args.max_batch_size,
+                                      max_delay=args.max_delay,
+                                      registry=registry)
+    server.serve_forever()
+
+
+def generate(args):
+    # type: (argparse.Namespace) -> None
+    """
+    Generates a single trace and saves it to a given file. The arguments for
+    Trace.generate are either read from a pickled job file (e.g., as written
+    by start_dbi.aio) or obtained from a scenario file.
+    """
+    import pickle
+    from .trace import Trace
+    if args.job:
+        with open(args.job, 'rb') as f:
+            kwargs = pickle.load(f)
+    else:
+        from start_core.scenario import Scenario
+        scenario = Scenario.from_file(args.scenario)
+        kwargs = dict(sitl=scenario.sitl,
+                      mission=scenario.mission,
+                      attack=scenario.attack if args.attack else None,
+                      timeout_mission=args.timeout_mission,
+                      timeout_connection=args.timeout_connection,
+                      timeout_liveness=args.timeout_liveness,
+                      speedup=args.speedup,
+                      normalize=args.normalize)
+    trace = Trace.generate(**kwargs)
+    trace.to_file(args.output)
+
+
+def parse_arguments(argv=None):
+    # type: (Optional[List[str]]) -> argparse.Namespace
+    parser = argparse.ArgumentParser(prog='start_dbi')
+    parser.add_argument('--verbose', action='store_true', default=False)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('serve',
+                              help="Serve verdicts for traces over a Unix socket.")  # noqa: pycodestyle
+    p.add_argument('-s', '--socket', type=str, default='start_dbi.sock',
+                   help="Path of the Unix socket.")
+    p.add_argument('-m', '--model', type=str, action='append',
+                   help="A model to serve, given as [NAME=]FILE.")
+    p.add_argument('-r', '--registry', type=str,
+                   help="Directory of a registry of models for each scenario and mission.")  # noqa: pycodestyle
+    p.add_argument('--registry_capacity', type=int, default=16,
+                   help="Maximum number of registered models held in memory.")  # noqa: pycodestyle
+    p.add_argument('--max_batch_size', type=int, default=64,
+                   help="Maximum number of traces scored in a single batch.")
+    p.add_argument('--max_delay', type=float, default=0.005,
+                   help="Maximum time, in seconds, to wait for a batch to fill.")  # noqa: pycodestyle
+    p.set_defaults(func=serve)
+
+    p = subparsers.add_parser('generate',
+                              help="Generate a single trace and save it to a file.")  # noqa: pycodestyle
+    p.add_argument('-o', '--output', type=str, required=True,
+                   help="File to which the trace is saved.")
+    p.add_argument('--job', type=str,
+                   help="Pickled keyword arguments for Trace.generate.")
+    p.add_argument('--scenario', type=str,
+                   help="Scenario file whose mission is executed.")
+    p.add_argument('--attack', action='store_true', default=False,
+                   help="Launch the attack of the scenario.")
+    p.add_argument('--timeout_mission', type=int, default=600)
+    p.add_argument('--timeout_connection', type=int, default=60)
+    p.add_argument('--timeout_liveness', type=int, default=15)
+    p.add_argument('--speedup', type=float, default=1)
+    p.add_argument('--normalize', action='store_true', default=False)
+    p.set_defaults(func=generate)
+    args = parser.parse_args(argv)
+    if args.command == 'serve' and not args.model and not args.registry:
+        parser.error("serve requires at least one --model or a --registry")
+    if args.command == 'generate' and not args.job and not args.scenario:
+        parser.error("generate requires either --job or --scenario")
+    return args
+
+
+def main(argv=None):
+    # type: (Optional[List[str]]) -> None
+    args = parse_arguments(argv)
+    # the loggers of start_dbi log at the debug level, and so the level is
+    # applied to the handler rather than to the root logger
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))  # noqa: pycodestyle
+    handler.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+    logging.getLogger().addHandler(handler)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+__all__ = ['drift', 'validate_speedup']
+
+from typing import Optional
+import logging
+
+import numpy
+
+from .trace import Trace
+from .features import Vocabulary
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+
+def drift(reference, accelerated, model=None):
+    # type: (Sequence[Trace], Sequence[Trace], Optional[Model]) -> Dict[str, float]  # noqa: pycodestyle
+    """
+    Measures how far a set of normalized traces that were generated at a
+    higher speedup drift from a set of normalized traces that were generated
+    in real time, and, if a model is given, how many of each are flagged.
+
+    Returns:
+        a dictionary of drift measures (see README.md).
+    """
+    if not reference or not accelerated:
+        raise ValueError("reference and accelerated traces must be given")
+    vocabulary = Vocabulary()
+    matrix_ref = vocabulary.fit_transform(reference)
+    matrix_acc = vocabulary.fit_transform(accelerated)
+    matrix_ref.resize((matrix_ref.shape[0], len(vocabulary)))
+    matrix_ref = matrix_ref.toarray()
+    matrix_acc = matrix_acc.toarray()
+
+    mean_ref = matrix_ref.mean(axis=0)
+    mean_acc = matrix_acc.mean(axis=0)
+    norm_ref = max(numpy.abs(mean_ref).sum(), 1e-12)
+
+    def deviation(matrix):
+        # type: (numpy.ndarray) -> float
+        return float(numpy.abs(matrix - mean_ref).sum(axis=1).mean() / norm_ref)  # noqa: pycodestyle
+
+    reported_ref = (matrix_ref != 0).any(axis=0)
+    reported_acc = (matrix_acc != 0).any(axis=0)
+    num_reported = max(int(reported_ref.sum()), 1)
+    norms = numpy.linalg.norm(mean_ref) * numpy.linalg.norm(mean_acc)
+    deviation_ref = deviation(matrix_ref)
+    deviation_acc = deviation(matrix_acc)
+    report = {
+        'relative_error': float(numpy.abs(mean_acc - mean_ref).sum() / norm_ref),  # noqa: pycodestyle
+        'cosine_similarity': float(mean_ref.dot(mean_acc) / norms) if norms > 0 else 0.0,  # noqa: pycodestyle
+        'missing_signals': float((reported_ref & ~reported_acc).sum()) / num_reported,  # noqa: pycodestyle
+        'extra_signals': float((reported_acc & ~reported_ref).sum()) / num_reported,  # noqa: pycodestyle
+        'deviation_reference': deviation_ref,
+        'deviation_accelerated': deviation_acc,
+        'drift_ratio': deviation_acc / deviation_ref if deviation_ref > 0 else float('inf')  # noqa: pycodestyle
+    }
+    if model is not None:
+        verdicts_ref, _ = model.check_many(reference)
+        verdicts_acc, _ = model.check_many(accelerated)
+        report['flagged_reference'] = float(verdicts_ref.mean())
+        report['flagged_accelerated'] = float(verdicts_acc.mean())
+    return report
+
+
+def validate_speedup(sitl,                  # type: SITL
+                     mission,               # type: Mission
+                     speedups=(2, 4, 8),    # type: Sequence[float]
+                     repeats=3,             # type: int
+                     model=None,            # type: Optional[Model]
+                     workers=1,             # type: Optional[int]
+                     **kwargs               # type: Any
+                     ):                     # type: (...) -> Dict[float, Dict[str, float]]  # noqa: pycodestyle
+    """
+    Generates a number of normalized traces for a given mission in real time
+    and at each of a number of speedups, using further keyword arguments for
+    Trace.generate, and measures the drift at each speedup (see drift).
+
+    Returns:
+        the drift report for each speedup.
+    """
+    if repeats < 2:
+        raise ValueError("at least two traces are required per speedup")
+    speedups = [1] + [s for s in speedups if s != 1]
+    jobs = []
+    for speedup in speedups:
+        for _ in range(repeats):
+            job = dict(kwargs)
+            job.update(sitl=sitl, mission=mission, speedup=speedup,
+                       normalize=True)
+            jobs.append(job)
+
+    traces = {s: [] for s in speedups}  # type: Dict[float, List[Trace]]
+    for result in Trace.generate_many(jobs, workers=workers):
+        speedup = result.job['speedup']
+        if result.error:
+            logger.warning("failed to generate trace at speedup %s: %s",
+                           speedup, result.error)
+            continue
+        traces[speedup].append(result.trace)
+
+    reports = {}  # type: Dict[float, Dict[str, float]]
+    for speedup in speedups[1:]:
+        if not traces[1] or not traces[speedup]:
+            logger.warning("no traces were generated for speedup %s", speedup)
+            continue
+        reports[speedup] = drift(traces[1], traces[speedup], model=model)
+        logger.debug("drift at speedup %s: %s", speedup, reports[speedup])
+    return reports
@@ -0,0 +1,190 @@
+"""
+Provides an asyncio interface for generating traces, which allows a single
+event loop to drive many concurrent instrumented runs. Requires Python 3.5 or
+later.
+"""
+__all__ = ['generate_async', 'generate_many_async']
+
+from typing import Optional
+import asyncio
+import logging
+import os
+import pickle
+import shutil
+import signal
+import sys
+import tempfile
+
+from .trace import Trace, BINARY_EXTENSION
+from .metrics import TraceMetrics
+from .parallel import TraceResult, isolate_ports
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the number of seconds that a generator process is given to exit once it
+# has been asked to terminate, before it is killed
+TERMINATE_GRACE = 10.0
+
+# the number of lines of the output of a failed generator process that are
+# reported in the resulting exception
+ERROR_TAIL_LINES = 20
+
+
+async def _terminate(process):
+    # type: (asyncio.subprocess.Process) -> None
+    """
+    Terminates a generator process together with any processes that it
+    launched (i.e., the SITL and Valgrind), which share its process group.
+    """
+    if process.returncode is not None:
+        return
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, sig)
+        except OSError:
+            return
+        try:
+            await asyncio.wait_for(process.wait(), TERMINATE_GRACE)
+            return
+        except asyncio.TimeoutError:
+            logger.warning("generator process %d did not exit after %s",
+                           process.pid, sig)
+
+
+def _tail(filename, num_lines=ERROR_TAIL_LINES):
+    # type: (str, int) -> str
+    try:
+        with open(filename, 'r') as f:
+            return ''.join(f.readlines()[-num_lines:])
+    except IOError:
+        return ''
+
+
+async def generate_async(sitl,                      # type: SITL
+                         mission,                   # type: Mission
+                         timeout=None,              # type: Optional[float]
+                         semaphore=None,            # type: Optional[asyncio.Semaphore]  # noqa: pycodestyle
+                         python=sys.executable,     # type: str
+                         **kwargs                   # type: Any
+                         ):                         # type: (...) -> Trace
+    """
+    Generates an execution trace without blocking the event loop, via
+    Trace.generate within a separate process that is terminated, along with
+    the SITL and Valgrind, if the coroutine is cancelled or times out.
+
+    Parameters:
+        timeout: the maximum number of seconds that the run may take, once
+            it has started. Also the default for timeout_mission.
+        semaphore: an optional semaphore that bounds concurrent runs.
+        python: the Python interpreter used to run the generator process.
+        kwargs: further picklable keyword arguments for Trace.generate.
+
+    Raises:
+        asyncio.TimeoutError: if the run did not finish within the timeout.
+        RuntimeError: if the generator process failed.
+    """
+    if 'timeout_mission' not in kwargs:
+        if timeout is None:
+            raise ValueError("either timeout or timeout_mission must be given")  # noqa: pycodestyle
+        kwargs['timeout_mission'] = int(timeout)
+    if semaphore is not None:
+        async with semaphore:
+            return await _generate(sitl, mission, timeout, python, kwargs)
+    return await _generate(sitl, mission, timeout, python, kwargs)
+
+
+async def _generate(sitl, mission, timeout, python, kwargs):
+    # type: (SITL, Mission, Optional[float], str, Dict[str, Any]) -> Trace
+    dir_tmp = tempfile.mkdtemp(prefix='start_dbi.aio.')
+    fn_job = os.path.join(dir_tmp, 'job.pickle')
+    fn_trace = os.path.join(dir_tmp, 'trace' + BINARY_EXTENSION)
+    fn_log = os.path.join(dir_tmp, 'generate.log')
+    process = None  # type: Optional[asyncio.subprocess.Process]
+    try:
+        job = dict(kwargs)
+        job.update(sitl=sitl, mission=mission)
+        with open(fn_job, 'wb') as f:
+            pickle.dump(job, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with open(fn_log, 'wb') as log:
+            # the process leads its own process group, so that the SITL and
+            # Valgrind can be terminated along with it
+            process = await asyncio.create_subprocess_exec(
+                python, '-m', 'start_dbi', 'generate',
+                '--job', fn_job, '--output', fn_trace,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                start_new_session=True)
+        logger.debug("started generator process %d for mission [%s]",
+                     process.pid, mission)
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("generator process %d exceeded timeout of %s seconds",  # noqa: pycodestyle
+                           process.pid, timeout)
+            raise
+        if process.returncode != 0:
+            msg = "generator process failed with code {}:\n{}"
+            raise RuntimeError(msg.format(process.returncode, _tail(fn_log)))
+
+        with open(fn_trace, 'rb') as f:
+            trace = Trace.from_bytes(f.read())
+        fn_metrics = TraceMetrics.filename_for(fn_trace)
+        if os.path.exists(fn_metrics):
+            trace.metrics = TraceMetrics.from_file(fn_metrics)
+        logger.debug("generator process %d finished", process.pid)
+        return trace
+    finally:
+        # the process is terminated if the run was cancelled or timed out
+        if process is not None and process.returncode is None:
+            await asyncio.shield(_terminate(process))
+        shutil.rmtree(dir_tmp, ignore_errors=True)
+
+
+async def generate_many_async(jobs,             # type: Iterable[Dict[str, Any]]
+                              concurrency=8,    # type: int
+                              timeout=None,     # type: Optional[float]
+                              isolate=None      # type: Optional[Callable[[SITL, int], SITL]]  # noqa: pycodestyle
+                              ):                # type: (...) -> List[TraceResult]
+    """
+    Generates an execution trace for each of a given sequence of jobs, each
+    given as a dictionary of keyword arguments for generate_async, running
+    at most a given number of jobs at once. Each concurrent run is given a
+    slot, whose index is used to isolate its ports as for
+    start_dbi.parallel.generate_many.
+
+    Returns:
+        the result of each job, in the order in which the jobs were given.
+        Failed jobs (including those that timed out) are reported via the
+        error of their result rather than raised.
+    """
+    jobs = list(jobs)
+    if jobs and isolate is None and concurrency > 1:
+        isolate_ports(jobs[0], 1)
+    slots = asyncio.Queue()  # type: asyncio.Queue
+    for slot in range(concurrency):
+        slots.put_nowait(slot)
+
+    async def run(index, job):
+        # type: (int, Dict[str, Any]) -> TraceResult
+        slot = await slots.get()
+        try:
+            kwargs = dict(job)
+            kwargs.setdefault('timeout', timeout)
+            if isolate is not None:
+                kwargs['sitl'] = isolate(kwargs['sitl'], slot)
+            else:
+                kwargs = isolate_ports(kwargs, slot, shared=concurrency > 1)
+            trace = await generate_async(**kwargs)
+            return TraceResult(index, job, trace, None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            logger.debug("job %d failed: %r", index, err)
+            return TraceResult(index, job, None, repr(err))
+        finally:
+            slots.put_nowait(slot)
+
+    return await asyncio.gather(*(run(i, j) for (i, j) in enumerate(jobs)))
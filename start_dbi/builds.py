@@ -0,0 +1,242 @@
+__all__ = ['BuildCache']
+
+from typing import Optional
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import subprocess
+import time
+
+from .cache import locked_json, _fingerprint
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+FN_INDEX = 'index.json'
+DIR_SOURCE = 'ardupilot'
+FN_SITL = 'sitl.pickle'
+
+
+def _disk_usage(directory):
+    # type: (str) -> int
+    """
+    Returns the number of bytes of disk space used by a given directory.
+    """
+    size = 0
+    for (root, _, filenames) in os.walk(directory):
+        for fn in filenames:
+            try:
+                stat = os.lstat(os.path.join(root, fn))
+            except OSError:
+                continue
+            size += stat.st_blocks * 512
+    return size
+
+
+class BuildCache(object):
+    """
+    Provides a cache of ArduPilot builds, keyed by the revision of a base
+    checkout, the contents of a patch and the scenario, each built within its
+    own copy of the checkout. Least recently used entries are evicted.
+    """
+    def __init__(self, directory, dir_ardupilot, max_bytes=None):
+        # type: (str, str, Optional[int]) -> None
+        """
+        Parameters:
+            directory: the directory that holds the cache.
+            dir_ardupilot: the base ArduPilot checkout.
+            max_bytes: the disk budget for the cache, if any.
+        """
+        self.__directory = directory
+        self.__dir_ardupilot = dir_ardupilot
+        self.__max_bytes = max_bytes
+        self.__fn_index = os.path.join(directory, FN_INDEX)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __index(self):
+        # type: () -> ContextManager[Dict[str, Any]]
+        def default():
+            stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+            return {'entries': {}, 'stats': stats}
+        return locked_json(self.__fn_index, default)
+
+    def revision(self):
+        # type: () -> str
+        """
+        Returns the revision of the base ArduPilot checkout.
+        """
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=self.__dir_ardupilot)
+        return output.decode('utf-8').strip()
+
+    @staticmethod
+    def key(revision, filename_patch=None, scenario=None):
+        # type: (str, Optional[str], Optional[Scenario]) -> str
+        """
+        Computes the cache key for a given base revision, patch and scenario.
+        """
+        h = hashlib.sha256()
+        h.update(revision.encode('utf-8'))
+        if filename_patch:
+            with open(filename_patch, 'rb') as f:
+                h.update(b'\0')
+                h.update(f.read())
+        if scenario is not None:
+            h.update(b'\0')
+            h.update(json.dumps(_fingerprint(scenario)).encode('utf-8'))
+        return h.hexdigest()
+
+    def __dir_entry(self, key):
+        # type: (str) -> str
+        return os.path.join(self.__directory, key)
+
+    def __prepare(self, key, revision):
+        # type: (str, str) -> str
+        """
+        Creates the source directory for a given entry, if needed, as a
+        (copy-on-write, where supported) copy of the base checkout.
+
+        Returns:
+            the source directory for the entry.
+        """
+        dir_source = os.path.join(self.__dir_entry(key), DIR_SOURCE)
+        if os.path.isdir(dir_source):
+            return dir_source
+
+        logger.debug("creating build directory: %s", dir_source)
+        dir_tmp = dir_source + '.tmp'
+        shutil.rmtree(dir_tmp, ignore_errors=True)
+        subprocess.check_call(['cp', '-a', '--reflink=auto',
+                               self.__dir_ardupilot, dir_tmp])
+        subprocess.check_call(['git', 'reset', '--hard', '--quiet', revision],
+                              cwd=dir_tmp)
+        subprocess.check_call(['git', 'submodule', '--quiet', 'update',
+                               '--recursive'],
+                              cwd=dir_tmp)
+        os.rename(dir_tmp, dir_source)
+        return dir_source
+
+    def __build(self, key, revision, scenario, filename_patch):
+        # type: (str, str, Scenario, Optional[str]) -> None
+        """
+        Builds the binary for a given entry and saves the resulting SITL,
+        which refers to the binary within the entry, for later uses.
+        """
+        dir_source = self.__prepare(key, revision)
+        fn_sitl = os.path.join(self.__dir_entry(key), FN_SITL)
+        fn_tmp = fn_sitl + '.tmp'
+        with scenario.build(dir_source, filename_patch=filename_patch) as sitl:
+            with open(fn_tmp, 'wb') as f:
+                pickle.dump(sitl, f)
+        os.rename(fn_tmp, fn_sitl)
+
+    @contextlib.contextmanager
+    def build(self, scenario, filename_patch=None):
+        # type: (Scenario, Optional[str]) -> Iterator[SITL]
+        """
+        Builds the ArduPilot binary for a given scenario and (optional) patch,
+        unless it has already been built, and provides the resulting SITL.
+        The entry is locked exclusively whilst it is built, and is shared
+        with other users of the same build whilst in use.
+
+        Example:
+            with cache.build(scenario, filename_patch=patch) as sitl:
+                trace = Trace.generate(sitl, scenario.mission, ...)
+        """
+        revision = self.revision()
+        key = self.key(revision, filename_patch, scenario)
+        dir_entry = self.__dir_entry(key)
+        fn_sitl = os.path.join(dir_entry, FN_SITL)
+
+        with open(dir_entry + '.lock', 'a') as lock:
+            try:
+                while True:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    hit = os.path.exists(fn_sitl)
+                    with self.__index() as index:
+                        index['stats']['hits' if hit else 'misses'] += 1
+                        entry = index['entries'].setdefault(key, {
+                            'revision': revision,
+                            'patch': os.path.basename(filename_patch) if filename_patch else None,  # noqa: pycodestyle
+                            'size': 0,
+                        })
+                        entry['last_used'] = time.time()
+                    logger.debug("build cache %s for patch [%s]: %s",
+                                 "hit" if hit else "miss", filename_patch, key)
+                    if not hit:
+                        if not os.path.isdir(dir_entry):
+                            os.makedirs(dir_entry)
+                        self.__build(key, revision, scenario, filename_patch)
+                    fcntl.flock(lock, fcntl.LOCK_SH)
+                    # the lock is released whilst it is converted, during
+                    # which the entry may have been evicted
+                    if os.path.exists(fn_sitl):
+                        break
+
+                with open(fn_sitl, 'rb') as f:
+                    sitl = pickle.load(f)
+                yield sitl
+
+                size = _disk_usage(dir_entry)
+                with self.__index() as index:
+                    entry = index['entries'].get(key)
+                    if entry is not None:
+                        entry['size'] = size
+                        entry['last_used'] = time.time()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        # type: (Optional[str]) -> None
+        """
+        Evicts the least recently used entries, other than those that are in
+        use or are given by keep, until the cache is within its disk budget.
+        """
+        if self.__max_bytes is None:
+            return
+        with self.__index() as index:
+            entries = index['entries']
+            size = sum(e['size'] for e in entries.values())
+            lru = sorted((k for k in entries if k != keep),
+                         key=lambda k: entries[k]['last_used'])
+            for key in lru:
+                if size <= self.__max_bytes:
+                    break
+                dir_entry = self.__dir_entry(key)
+                with open(dir_entry + '.lock', 'a') as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except (IOError, OSError):
+                        logger.debug("skipping eviction of entry in use: %s",
+                                     key)
+                        continue
+                    try:
+                        logger.debug("evicting entry from build cache: %s",
+                                     key)
+                        shutil.rmtree(dir_entry, ignore_errors=True)
+                        size -= entries[key]['size']
+                        del entries[key]
+                        index['stats']['evictions'] += 1
+                    finally:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @property
+    def stats(self):
+        # type: () -> Dict[str, int]
+        """
+        Returns the number of hits, misses and evictions for this cache,
+        together with the number of entries and bytes that it holds.
+        """
+        with self.__index() as index:
+            stats = dict(index['stats'])
+            stats['entries'] = len(index['entries'])
+            stats['bytes'] = sum(e['size'] for e in index['entries'].values())
+        return stats
@@ -0,0 +1,282 @@
+__all__ = ['TraceCache', 'locked_json']
+
+from typing import Optional
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from .trace import Trace, BINARY_EXTENSION
+from .parallel import is_port
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+FN_INDEX = 'index.json'
+
+# maps (filename, mtime, size) to the digest of the contents of that file, to
+# avoid repeatedly hashing large files (e.g., SITL binaries).
+_file_digests = {}  # type: Dict[Tuple[str, float, int], str]
+
+# objects that are nested more deeply than this cannot be fingerprinted
+MAX_FINGERPRINT_DEPTH = 8
+
+
+@contextlib.contextmanager
+def locked_json(filename, default):
+    # type: (str, Callable[[], Any]) -> Iterator[Any]
+    """
+    Provides exclusive access, across processes, to the contents of a given
+    JSON file. If the file does not exist, its contents are given by calling
+    default. Any changes made to the contents are saved upon exit.
+    """
+    with open(filename + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(filename):
+                with open(filename, 'r') as f:
+                    contents = json.load(f)
+            else:
+                contents = default()
+            yield contents
+            fn_tmp = filename + '.tmp'
+            with open(fn_tmp, 'w') as f:
+                json.dump(contents, f)
+            os.rename(fn_tmp, filename)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _file_digest(filename):
+    # type: (str) -> str
+    stat = os.stat(filename)
+    memo = (os.path.abspath(filename), stat.st_mtime, stat.st_size)
+    digest = _file_digests.get(memo)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        _file_digests[memo] = digest
+    return digest
+
+
+def _fingerprint(obj, depth=0, seen=None):
+    # type: (Any, int, Optional[Set[int]]) -> Any
+    """
+    Produces a JSON-serialisable fingerprint of a given object, in which
+    existing files are replaced by a digest of their contents and objects by
+    their type and attributes, other than ports. Unlike a repr, the
+    fingerprint never includes the address of an object, and so it is the
+    same in every process.
+
+    Raises:
+        ValueError: if the object is nested too deeply.
+    """
+    if seen is None:
+        seen = set()
+    if obj is None or isinstance(obj, (bool, int, float)):
+        return obj
+    if isinstance(obj, str):
+        if os.path.isfile(obj):
+            return {'file': _file_digest(obj)}
+        return obj
+    if isinstance(obj, bytes):
+        return {'bytes': hashlib.sha256(obj).hexdigest()}
+    if id(obj) in seen:
+        # a reference to an enclosing object, which is already covered
+        return {'cycle': type(obj).__name__}
+    if depth > MAX_FINGERPRINT_DEPTH:
+        raise ValueError("cannot fingerprint object nested more than {} levels deep: {}".format(MAX_FINGERPRINT_DEPTH, type(obj).__name__))  # noqa: pycodestyle
+    seen = seen | {id(obj)}
+    if isinstance(obj, (list, tuple)):
+        return [_fingerprint(x, depth + 1, seen) for x in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted((_fingerprint(x, depth + 1, seen) for x in obj),
+                      key=lambda f: json.dumps(f, sort_keys=True))
+    if isinstance(obj, dict):
+        return [[str(k), _fingerprint(v, depth + 1, seen)]
+                for (k, v) in sorted(obj.items(), key=lambda kv: str(kv[0]))]
+    if hasattr(obj, '__dict__'):
+        attributes = {k: v for (k, v) in vars(obj).items() if not is_port(k)}
+    else:
+        # e.g., objects with __slots__, which are described by their public
+        # data attributes
+        attributes = {}
+        for name in dir(obj):
+            if name.startswith('_') or is_port(name):
+                continue
+            value = getattr(obj, name, None)
+            if not callable(value):
+                attributes[name] = value
+    return [type(obj).__name__, _fingerprint(attributes, depth + 1, seen)]
+
+
+class TraceCache(object):
+    """
+    Provides a content-addressed, on-disk cache of execution traces, keyed
+    by the conditions under which they were generated, which may be shared
+    by several processes. Least recently used keys are evicted.
+    """
+    def __init__(self, directory, samples_per_key=1, max_bytes=None):
+        # type: (str, int, Optional[int]) -> None
+        """
+        Parameters:
+            directory: the directory that holds the cache.
+            samples_per_key: the number of traces collected for each key
+                before lookups for that key are served from the cache.
+            max_bytes: the maximum size of the cache, if any.
+        """
+        if samples_per_key < 1:
+            raise ValueError("samples_per_key must be positive")
+        self.__directory = directory
+        self.__samples_per_key = samples_per_key
+        self.__max_bytes = max_bytes
+        self.__fn_index = os.path.join(directory, FN_INDEX)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(sitl,                   # type: SITL
+            mission,                # type: Mission
+            attack,                 # type: Optional[Attack]
+            valgrind_binary,        # type: str
+            valgrind_flags,         # type: str
+            timeout_mission,        # type: int
+            timeout_connection,     # type: int
+            timeout_liveness,       # type: int
+            speedup=1,              # type: float
+            normalize=False         # type: bool
+            ):                      # type: (...) -> str
+        """
+        Computes the cache key for a given set of trace generation
+        parameters.
+        """
+        description = {
+            'sitl': _fingerprint(sitl),
+            'mission': _fingerprint(mission),
+            'attack': _fingerprint(attack),
+            'valgrind_binary': _fingerprint(valgrind_binary),
+            'valgrind_flags': valgrind_flags,
+            'timeout_mission': timeout_mission,
+            'timeout_connection': timeout_connection,
+            'timeout_liveness': timeout_liveness
+        }
+        # the speedup and normalization are only included when they differ
+        # from their defaults, so that existing keys remain valid; traces
+        # were once normalized by duration rather than by their total
+        if speedup != 1:
+            description['speedup'] = speedup
+        if normalize:
+            description['normalize'] = 'total'
+        contents = json.dumps(description, sort_keys=True)
+        return hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
+    def __index(self):
+        # type: () -> ContextManager[Dict[str, Any]]
+        """
+        Provides exclusive access to the index of the cache. Any changes made
+        to the index are saved upon exit.
+        """
+        def default():
+            stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+            return {'entries': {}, 'stats': stats}
+        return locked_json(self.__fn_index, default)
+
+    def __dir_entry(self, key):
+        # type: (str) -> str
+        return os.path.join(self.__directory, key[:2], key)
+
+    def lookup(self, key):
+        # type: (str) -> Optional[Trace]
+        """
+        Returns a cached trace for a given key, or None if fewer than the
+        required number of samples have been collected for that key. When
+        several samples are held, they are returned in rotation.
+        """
+        with self.__index() as index:
+            entry = index['entries'].get(key)
+            if entry is None or len(entry['samples']) < self.__samples_per_key:  # noqa: pycodestyle
+                index['stats']['misses'] += 1
+                logger.debug("trace cache miss: %s", key)
+                return None
+            index['stats']['hits'] += 1
+            entry['last_used'] = time.time()
+            sample = entry['samples'][entry['hits'] % len(entry['samples'])]
+            entry['hits'] += 1
+        logger.debug("trace cache hit: %s", key)
+        return Trace.from_file(os.path.join(self.__dir_entry(key), sample))
+
+    def add(self, key, trace):
+        # type: (str, Trace) -> None
+        """
+        Adds a trace to the cache as a sample for a given key, provided that
+        the required number of samples has not yet been collected.
+        """
+        with self.__index() as index:
+            entry = index['entries'].setdefault(
+                key, {'samples': [], 'size': 0, 'hits': 0, 'last_used': 0.0})
+            if len(entry['samples']) >= self.__samples_per_key:
+                return
+            dir_entry = self.__dir_entry(key)
+            if not os.path.isdir(dir_entry):
+                os.makedirs(dir_entry)
+            sample = "{}{}".format(len(entry['samples']), BINARY_EXTENSION)
+            fn_sample = os.path.join(dir_entry, sample)
+            trace.to_file(fn_sample, binary=True)
+            entry['samples'].append(sample)
+            entry['size'] += os.path.getsize(fn_sample)
+            entry['last_used'] = time.time()
+            logger.debug("added sample %d of %d to trace cache: %s",
+                         len(entry['samples']), self.__samples_per_key, key)
+            self.__evict(index, keep=key)
+
+    def __evict(self, index, keep):
+        # type: (Dict[str, Any], str) -> None
+        """
+        Evicts the least recently used keys, other than a given key, until
+        the size of the cache is within its limit.
+        """
+        if self.__max_bytes is None:
+            return
+        entries = index['entries']
+        size = sum(e['size'] for e in entries.values())
+        lru = sorted((k for k in entries if k != keep),
+                     key=lambda k: entries[k]['last_used'])
+        for key in lru:
+            if size <= self.__max_bytes:
+                break
+            logger.debug("evicting key from trace cache: %s", key)
+            size -= entries[key]['size']
+            del entries[key]
+            shutil.rmtree(self.__dir_entry(key), ignore_errors=True)
+            index['stats']['evictions'] += 1
+
+    @property
+    def stats(self):
+        # type: () -> Dict[str, int]
+        """
+        Returns the number of hits, misses and evictions for this cache,
+        together with the number of keys and bytes that it holds.
+        """
+        with self.__index() as index:
+            stats = dict(index['stats'])
+            stats['keys'] = len(index['entries'])
+            stats['bytes'] = sum(e['size'] for e in index['entries'].values())
+        return stats
+
+    def clear(self):
+        # type: () -> None
+        """
+        Removes all traces from this cache and resets its statistics.
+        """
+        with self.__index() as index:
+            for key in list(index['entries']):
+                shutil.rmtree(self.__dir_entry(key), ignore_errors=True)
+            index['entries'] = {}
+            index['stats'] = {'hits': 0, 'misses': 0, 'evictions': 0}
@@ -0,0 +1,435 @@
+__all__ = ['Campaign', 'JOB_STATES']
+
+from typing import Optional
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import time
+import traceback
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+JOB_STATES = ('pending', 'running', 'done', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    spec TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before);
+"""
+
+# the number of seconds that idle workers wait before checking for jobs that
+# have become claimable (e.g., once a backoff has elapsed)
+POLL_INTERVAL = 5.0
+
+# the number of seconds between checks for worker processes that have exited
+REAP_INTERVAL = 1.0
+
+
+def _owner():
+    # type: () -> str
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def _is_dead(owner):
+    # type: (Optional[str]) -> bool
+    """
+    Determines whether the process that claimed a job is known to have
+    exited. Zombie processes are dead; processes on other hosts are assumed
+    to be alive.
+    """
+    if not owner:
+        return True
+    host, _, pid = owner.rpartition(':')
+    if host != socket.gethostname():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except OSError:
+        return True
+    except ValueError:
+        return False
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            # the state follows the parenthesised name of the executable
+            return f.read().rpartition(')')[2].split()[0] == 'Z'
+    except (IOError, OSError, IndexError):
+        return False
+
+
+class Campaign(object):
+    """
+    Provides a crash-safe queue of trace collection jobs, backed by an SQLite
+    database that may be shared by several processes. A campaign is resumed
+    by enumerating its jobs again; failed jobs are retried with backoff.
+    """
+    def __init__(self, filename, max_attempts=3, backoff=60.0, lease=7200.0):
+        # type: (str, int, float, float) -> None
+        """
+        Parameters:
+            filename: the name of the database file.
+            max_attempts: the maximum number of times that a job is attempted.
+            backoff: the delay before the first retry, which then doubles.
+            lease: the number of seconds for which a job is claimed.
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be positive")
+        # workers reconnect to the database, possibly from another directory
+        self.__filename = os.path.abspath(filename)
+        self.__max_attempts = max_attempts
+        self.__backoff = backoff
+        self.__lease = lease
+        self.__connection = None  # type: Optional[sqlite3.Connection]
+        self.__connect().executescript(SCHEMA)
+
+    def __getstate__(self):
+        # type: () -> Dict[str, Any]
+        # connections are not carried across processes
+        state = dict(self.__dict__)
+        state['_Campaign__connection'] = None
+        return state
+
+    @property
+    def filename(self):
+        # type: () -> str
+        return self.__filename
+
+    def __connect(self):
+        # type: () -> sqlite3.Connection
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.__filename,
+                                                timeout=60.0,
+                                                isolation_level=None)
+            self.__connection.execute('PRAGMA journal_mode=WAL')
+            self.__connection.execute('PRAGMA synchronous=NORMAL')
+        return self.__connection
+
+    def __transaction(self):
+        # type: () -> _Transaction
+        return _Transaction(self.__connect())
+
+    def close(self):
+        # type: () -> None
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
+
+    def add(self, key, spec):
+        # type: (str, Dict[str, Any]) -> bool
+        """
+        Adds a job with a given key, described by a given JSON-serialisable
+        specification, unless a job with that key already exists.
+
+        Returns:
+            True if the job was added, or False if it already existed.
+        """
+        return self.add_many([(key, spec)]) == 1
+
+    def add_many(self, jobs):
+        # type: (Iterable[Tuple[str, Dict[str, Any]]]) -> int
+        """
+        Adds a sequence of jobs, each given by its key and specification,
+        skipping those whose keys already exist.
+
+        Returns:
+            the number of jobs that were added.
+        """
+        now = time.time()
+        with self.__transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs (key, spec, created, updated) "
+                "VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(spec, sort_keys=True), now, now)
+                 for (key, spec) in jobs])
+            added = db.total_changes - before
+        logger.debug("added %d jobs to campaign: %s", added, self.__filename)
+        return added
+
+    def __recover(self, db, now):
+        # type: (sqlite3.Connection, float) -> None
+        """
+        Releases the jobs whose workers have exited or whose leases have
+        expired. Jobs that have exhausted their attempts are marked as
+        failed.
+        """
+        rows = db.execute("SELECT id, owner, lease_expires, attempts FROM jobs "  # noqa: pycodestyle
+                          "WHERE status = 'running'").fetchall()
+        for (id_job, owner, lease_expires, attempts) in rows:
+            if lease_expires >= now and not _is_dead(owner):
+                continue
+            logger.warning("recovering job %d from worker %s", id_job, owner)
+            if attempts >= self.__max_attempts:
+                db.execute("UPDATE jobs SET status = 'failed', owner = NULL, "
+                           "error = ?, updated = ? WHERE id = ?",
+                           ("worker exited or lease expired", now, id_job))
+            else:
+                db.execute("UPDATE jobs SET status = 'pending', owner = NULL, "
+                           "updated = ? WHERE id = ?", (now, id_job))
+
+    def claim(self):
+        # type: () -> Optional[Tuple[int, str, Dict[str, Any]]]
+        """
+        Claims the next job that is ready to run.
+
+        Returns:
+            the ID, key and specification of the claimed job, or None if no
+            job is ready to run.
+        """
+        now = time.time()
+        with self.__transaction() as db:
+            self.__recover(db, now)
+            row = db.execute("SELECT id, key, spec FROM jobs "
+                             "WHERE status = 'pending' AND not_before <= ? "
+                             "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET status = 'running', "
+                       "attempts = attempts + 1, owner = ?, "
+                       "lease_expires = ?, updated = ? WHERE id = ?",
+                       (_owner(), now + self.__lease, now, row[0]))
+        return row[0], row[1], json.loads(row[2])
+
+    def complete(self, id_job, result=None):
+        # type: (int, Optional[Any]) -> None
+        """
+        Records that a given job has succeeded, together with its result.
+        """
+        with self.__transaction() as db:
+            db.execute("UPDATE jobs SET status = 'done', owner = NULL, "
+                       "result = ?, error = NULL, updated = ? WHERE id = ?",
+                       (json.dumps(result), time.time(), id_job))
+
+    def fail(self, id_job, error):
+        # type: (int, str) -> None
+        """
+        Records that an attempt of a given job has failed. The job is retried
+        after a delay, unless it has exhausted its attempts.
+        """
+        now = time.time()
+        with self.__transaction() as db:
+            attempts, = db.execute("SELECT attempts FROM jobs WHERE id = ?",
+                                   (id_job,)).fetchone()
+            if attempts >= self.__max_attempts:
+                status, not_before = 'failed', now
+            else:
+                status = 'pending'
+                not_before = now + self.__backoff * 2 ** (attempts - 1)
+            db.execute("UPDATE jobs SET status = ?, owner = NULL, error = ?, "
+                       "not_before = ?, updated = ? WHERE id = ?",
+                       (status, error, not_before, now, id_job))
+        logger.debug("job %d failed (attempt %d of %d)", id_job, attempts,
+                     self.__max_attempts)
+
+    def release(self, id_job):
+        # type: (int) -> None
+        """
+        Returns a claimed job to the queue without counting the attempt
+        (e.g., when the worker is interrupted).
+        """
+        with self.__transaction() as db:
+            db.execute("UPDATE jobs SET status = 'pending', owner = NULL, "
+                       "attempts = MAX(attempts - 1, 0), updated = ? "
+                       "WHERE id = ? AND status = 'running'",
+                       (time.time(), id_job))
+
+    def retry_failed(self):
+        # type: () -> int
+        """
+        Returns every failed job to the queue with a fresh set of attempts.
+
+        Returns:
+            the number of jobs that were returned to the queue.
+        """
+        with self.__transaction() as db:
+            cursor = db.execute("UPDATE jobs SET status = 'pending', "
+                                "attempts = 0, not_before = 0, updated = ? "
+                                "WHERE status = 'failed'", (time.time(),))
+            return cursor.rowcount
+
+    def stats(self):
+        # type: () -> Dict[str, int]
+        """
+        Returns the number of jobs in each state.
+        """
+        stats = {s: 0 for s in JOB_STATES}
+        with self.__transaction() as db:
+            for (status, count) in db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):  # noqa: pycodestyle
+                stats[status] = count
+        return stats
+
+    def jobs(self, status=None):
+        # type: (Optional[str]) -> List[Dict[str, Any]]
+        """
+        Returns a description of every job, or of every job in a given state.
+        """
+        query = "SELECT id, key, spec, status, attempts, result, error FROM jobs"  # noqa: pycodestyle
+        args = ()  # type: Tuple[Any, ...]
+        if status is not None:
+            query += " WHERE status = ?"
+            args = (status,)
+        with self.__transaction() as db:
+            rows = db.execute(query + " ORDER BY id", args).fetchall()
+        return [{'id': r[0],
+                 'key': r[1],
+                 'spec': json.loads(r[2]),
+                 'status': r[3],
+                 'attempts': r[4],
+                 'result': json.loads(r[5]) if r[5] is not None else None,
+                 'error': r[6]} for r in rows]
+
+    def __next_ready(self):
+        # type: () -> Optional[float]
+        """
+        Returns the number of seconds until a job may become ready, or None
+        if every job has finished.
+        """
+        now = time.time()
+        with self.__transaction() as db:
+            pending, = db.execute("SELECT MIN(not_before) FROM jobs "
+                                  "WHERE status = 'pending'").fetchone()
+            running, = db.execute("SELECT COUNT(*) FROM jobs "
+                                  "WHERE status = 'running'").fetchone()
+        if pending is None and running == 0:
+            return None
+        if pending is None:
+            return POLL_INTERVAL
+        return min(max(pending - now, 0.0), POLL_INTERVAL)
+
+    def work(self, execute):
+        # type: (Callable[[Dict[str, Any]], Any]) -> int
+        """
+        Claims and executes jobs, via a function that returns the result of a
+        job given its specification, until every job has finished.
+
+        Returns:
+            the number of jobs executed by this worker.
+        """
+        num_executed = 0
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                delay = self.__next_ready()
+                if delay is None:
+                    return num_executed
+                time.sleep(delay)
+                continue
+
+            id_job, key, spec = claimed
+            logger.info("running job %d: %s", id_job, key)
+            try:
+                result = execute(spec)
+            except (KeyboardInterrupt, SystemExit):
+                self.release(id_job)
+                raise
+            except Exception:
+                logger.exception("job %d failed: %s", id_job, key)
+                self.fail(id_job, traceback.format_exc())
+            else:
+                self.complete(id_job, result)
+                logger.info("finished job %d: %s", id_job, key)
+            num_executed += 1
+
+    def run(self, execute, workers=1, dir_work=None):
+        # type: (Callable[[Dict[str, Any]], Any], int, Optional[str]) -> Dict[str, int]  # noqa: pycodestyle
+        """
+        Executes the jobs of this campaign (see work) using a given number of
+        worker processes, set up as for start_dbi.parallel.generate_many, and
+        returns the number of jobs in each state. The execute function must
+        be picklable if more than one worker is used.
+        """
+        if workers <= 1:
+            self.work(execute)
+            return self.stats()
+
+        using_temporary_dir = not dir_work
+        if using_temporary_dir:
+            dir_work = tempfile.mkdtemp(prefix='start_dbi.campaign.')
+        indices = multiprocessing.Queue()
+        for i in range(workers):
+            indices.put(i)
+        # each worker is a separate process, rather than a member of a pool,
+        # so that a worker that crashes does not stall the others: the job
+        # that it held is recovered by the remaining workers.
+        # the connection is closed, rather than inherited, since an SQLite
+        # connection must not be used across a fork.
+        self.close()
+        processes = [multiprocessing.Process(target=_work,
+                                             args=(indices, dir_work, self,
+                                                   execute, workers))
+                     for _ in range(workers)]
+        try:
+            for process in processes:
+                process.start()
+            # workers are reaped as soon as they exit, rather than in order,
+            # so that the other workers promptly recover the jobs that they
+            # held (see _is_dead).
+            running = list(processes)
+            while running:
+                time.sleep(REAP_INTERVAL)
+                for process in [p for p in running if not p.is_alive()]:
+                    running.remove(process)
+                    if process.exitcode != 0:
+                        logger.warning("campaign worker exited with code %s",
+                                       process.exitcode)
+        except BaseException:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            raise
+        finally:
+            for process in processes:
+                if process.pid is not None:
+                    process.join()
+            if using_temporary_dir:
+                shutil.rmtree(dir_work, ignore_errors=True)
+        return self.stats()
+
+
+def _work(indices, dir_work, campaign, execute, workers):
+    # type: (multiprocessing.Queue, str, Campaign, Callable[[Dict[str, Any]], Any], int) -> None  # noqa: pycodestyle
+    from .parallel import _initialize_worker
+    _initialize_worker(indices, dir_work, None, workers > 1)
+    try:
+        campaign.work(execute)
+    finally:
+        campaign.close()
+
+
+class _Transaction(object):
+    """
+    Executes a block within an immediate transaction, which is committed if
+    the block succeeds and rolled back otherwise.
+    """
+    def __init__(self, connection):
+        # type: (sqlite3.Connection) -> None
+        self.__connection = connection
+
+    def __enter__(self):
+        # type: () -> sqlite3.Connection
+        self.__connection.execute('BEGIN IMMEDIATE')
+        return self.__connection
+
+    def __exit__(self, exc_type, *args):
+        # type: (Any, *Any) -> None
+        if exc_type is None:
+            self.__connection.execute('COMMIT')
+        else:
+            self.__connection.execute('ROLLBACK')
@@ -0,0 +1,360 @@
+__all__ = ['SupportVectorScorer', 'save', 'load', 'is_compact', 'write', 'read',
+           'pack_features', 'unpack_features', 'kernel_matrix']
+
+from typing import Optional
+import json
+import logging
+import os
+import struct
+
+import numpy
+from scipy import sparse
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# Compact model files consist of a fixed-size header, followed by a JSON
+# description of the model, followed by a sequence of raw arrays. The JSON
+# description gives the parameters of the model together with the dtype,
+# shape and offset of each array. Each array begins at an aligned offset so
+# that it may be memory-mapped directly.
+MAGIC = b'STDBIMDL'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQ')  # magic, version, flags, #bytes in description
+ALIGNMENT = 64
+
+
+def _as_dense(matrix):
+    # type: (Any) -> numpy.ndarray
+    if sparse.issparse(matrix):
+        return matrix.toarray()
+    return numpy.asarray(matrix)
+
+
+def _dot(x, y):
+    # type: (Any, Any) -> numpy.ndarray
+    """
+    Computes x . y^T as a dense array, where either matrix may be sparse.
+    """
+    if sparse.issparse(y):
+        product = y.dot(x.T).T
+    else:
+        product = x.dot(numpy.asarray(y).T)
+    return _as_dense(product)
+
+
+def _squared_norms(matrix):
+    # type: (Any) -> numpy.ndarray
+    if sparse.issparse(matrix):
+        return numpy.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+    return numpy.einsum('ij,ij->i', matrix, matrix)
+
+
+def kernel_matrix(x,                     # type: Any
+                  y,                     # type: Any
+                  kernel='rbf',          # type: str
+                  gamma=1.0,             # type: float
+                  coef0=0.0,             # type: float
+                  degree=3,              # type: int
+                  y_squared_norms=None   # type: Optional[numpy.ndarray]
+                  ):                     # type: (...) -> numpy.ndarray
+    """
+    Computes the kernel between each row of x and each row of y, in the same
+    manner as libsvm, where either matrix may be sparse.
+
+    Parameters:
+        y_squared_norms: the squared norms of the rows of y, if known, which
+            are used by the RBF kernel.
+    """
+    product = _dot(x, y)
+    if kernel == 'linear':
+        return product
+    if kernel == 'poly':
+        return (gamma * product + coef0) ** degree
+    if kernel == 'sigmoid':
+        return numpy.tanh(gamma * product + coef0)
+    if kernel != 'rbf':
+        raise ValueError("unsupported kernel: {}".format(kernel))
+    if y_squared_norms is None:
+        y_squared_norms = _squared_norms(y)
+    distances = _squared_norms(x)[:, None] + y_squared_norms[None, :] \
+        - 2.0 * product
+    numpy.maximum(distances, 0.0, out=distances)
+    return numpy.exp(-gamma * distances)
+
+
+class SupportVectorScorer(object):
+    """
+    Evaluates the decision function of a trained one-class SVM using NumPy,
+    given its support vectors, dual coefficients, intercept and kernel
+    parameters. Provides the same predict and decision_function interface as
+    sklearn's OneClassSVM, but does not depend on sklearn.
+    """
+    @staticmethod
+    def from_svm(svm):
+        # type: (svm.OneClassSVM) -> SupportVectorScorer
+        """
+        Extracts a scorer from a trained sklearn OneClassSVM.
+        """
+        support_vectors = svm.support_vectors_
+        if sparse.issparse(support_vectors):
+            support_vectors = sparse.csr_matrix(support_vectors)
+        return SupportVectorScorer(
+            support_vectors=support_vectors,
+            dual_coef=_as_dense(svm.dual_coef_).ravel(),
+            intercept=float(numpy.ravel(svm.intercept_)[0]),
+            kernel=svm.kernel,
+            gamma=float(getattr(svm, '_gamma', svm.gamma)),
+            coef0=float(svm.coef0),
+            degree=int(svm.degree),
+            nu=float(svm.nu))
+
+    def __init__(self,
+                 support_vectors,   # type: Any
+                 dual_coef,         # type: numpy.ndarray
+                 intercept,         # type: float
+                 kernel='rbf',      # type: str
+                 gamma=1.0,         # type: float
+                 coef0=0.0,         # type: float
+                 degree=3,          # type: int
+                 nu=0.5             # type: float
+                 ):                 # type: (...) -> None
+        if kernel not in ('linear', 'poly', 'rbf', 'sigmoid'):
+            raise ValueError("unsupported kernel: {}".format(kernel))
+        self.support_vectors_ = support_vectors
+        self.dual_coef_ = numpy.asarray(dual_coef, dtype=numpy.float64)
+        self.intercept_ = numpy.array([intercept])
+        self.kernel = kernel
+        self.gamma = gamma
+        self.coef0 = coef0
+        self.degree = degree
+        self.nu = nu
+        self.__sv_squared_norms = None  # type: Optional[numpy.ndarray]
+
+    def estimator(self):
+        # type: () -> svm.OneClassSVM
+        """
+        Returns an untrained sklearn OneClassSVM with the same parameters as
+        the SVM from which this scorer was obtained.
+        """
+        from sklearn.svm import OneClassSVM
+        return OneClassSVM(kernel=self.kernel,
+                           gamma=self.gamma,
+                           coef0=self.coef0,
+                           degree=self.degree,
+                           nu=self.nu)
+
+    def kernel_matrix(self, matrix):
+        # type: (Any) -> numpy.ndarray
+        """
+        Computes the kernel between each row of a given matrix and each
+        support vector.
+        """
+        if self.kernel == 'rbf' and self.__sv_squared_norms is None:
+            self.__sv_squared_norms = _squared_norms(self.support_vectors_)
+        return kernel_matrix(matrix, self.support_vectors_,
+                             kernel=self.kernel,
+                             gamma=self.gamma,
+                             coef0=self.coef0,
+                             degree=self.degree,
+                             y_squared_norms=self.__sv_squared_norms)
+
+    def decision_function(self, matrix):
+        # type: (Any) -> numpy.ndarray
+        return self.kernel_matrix(matrix).dot(self.dual_coef_) \
+            + self.intercept_[0]
+
+    def predict(self, matrix):
+        # type: (Any) -> numpy.ndarray
+        return numpy.where(self.decision_function(matrix) > 0, 1, -1)
+
+
+def is_compact(filename):
+    # type: (str) -> bool
+    """
+    Determines whether a given file holds a compact model.
+    """
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def save(filename,              # type: str
+         scorer,                # type: SupportVectorScorer
+         vocabulary=None,       # type: Optional[Sequence[str]]
+         preprocessor=None,     # type: Optional[Dict[str, Optional[numpy.ndarray]]]  # noqa: pycodestyle
+         extra=None             # type: Optional[Dict[str, numpy.ndarray]]
+         ):                     # type: (...) -> None
+    """
+    Saves a model, given by its scorer, its signals and the named arrays of
+    its preprocessor and of anything else (if any), in the compact format.
+    """
+    arrays = {}  # type: Dict[str, numpy.ndarray]
+    sv = scorer.support_vectors_
+    if sparse.issparse(sv):
+        sv = sparse.csr_matrix(sv)
+        arrays['sv.data'] = sv.data
+        arrays['sv.indices'] = sv.indices
+        arrays['sv.indptr'] = sv.indptr
+    else:
+        arrays['sv'] = numpy.asarray(sv)
+    arrays['dual_coef'] = scorer.dual_coef_
+    description = {
+        'kernel': scorer.kernel,
+        'gamma': scorer.gamma,
+        'coef0': scorer.coef0,
+        'degree': scorer.degree,
+        'nu': scorer.nu,
+        'intercept': float(scorer.intercept_[0]),
+        'sv_shape': list(sv.shape),
+    }
+    pack_features(description, arrays, vocabulary, preprocessor, extra)
+    write(filename, description, arrays)
+
+
+def pack_features(description,     # type: Dict[str, Any]
+                  arrays,          # type: Dict[str, numpy.ndarray]
+                  vocabulary,      # type: Optional[Sequence[str]]
+                  preprocessor,    # type: Optional[Dict[str, Optional[numpy.ndarray]]]  # noqa: pycodestyle
+                  extra=None       # type: Optional[Dict[str, numpy.ndarray]]
+                  ):               # type: (...) -> None
+    """
+    Adds the vocabulary, preprocessing stage and any further arrays of a
+    model to the description and arrays that are written to a compact file.
+    """
+    if vocabulary is not None:
+        names = '\n'.join(vocabulary).encode('utf-8')
+        arrays['vocabulary'] = numpy.frombuffer(names, dtype=numpy.uint8)
+    for (name, array) in (preprocessor or {}).items():
+        if array is not None:
+            arrays['preprocessor.' + name] = array
+    for (name, array) in (extra or {}).items():
+        arrays['extra.' + name] = array
+    description['has_vocabulary'] = vocabulary is not None
+    description['num_signals'] = len(vocabulary) if vocabulary is not None else None  # noqa: pycodestyle
+
+
+def unpack_features(description, arrays):
+    # type: (Dict[str, Any], Dict[str, numpy.ndarray]) -> Tuple[Optional[List[str]], Optional[Dict[str, numpy.ndarray]], Dict[str, numpy.ndarray]]  # noqa: pycodestyle
+    """
+    Obtains the vocabulary, preprocessing stage and any further arrays of a
+    model from the description and arrays that were read from a compact file.
+    """
+    vocabulary = None
+    if description['has_vocabulary']:
+        if description['num_signals'] == 0:
+            vocabulary = []
+        else:
+            vocabulary = arrays['vocabulary'].tobytes().decode('utf-8').split('\n')  # noqa: pycodestyle
+
+    preprocessor = None
+    prefix = 'preprocessor.'
+    if any(n.startswith(prefix) for n in arrays):
+        preprocessor = {n[len(prefix):]: a for (n, a) in arrays.items()
+                        if n.startswith(prefix)}
+
+    prefix = 'extra.'
+    extra = {n[len(prefix):]: a for (n, a) in arrays.items()
+             if n.startswith(prefix)}
+    return vocabulary, preprocessor, extra
+
+
+def write(filename, description, arrays):
+    # type: (str, Dict[str, Any], Dict[str, numpy.ndarray]) -> None
+    """
+    Writes a given JSON description and set of named arrays to a given file
+    in the compact format. The dtype, shape and offset of each array are
+    added to the description.
+    """
+    description = dict(description)
+    description['arrays'] = {}
+    arrays = {n: numpy.ascontiguousarray(a) for (n, a) in arrays.items()}
+
+    # since the offsets of the arrays are recorded within the description,
+    # space is reserved for the description before the offsets are assigned,
+    # and the description is padded to fill that space.
+    size_reserved = len(json.dumps(description)) + 128 * len(arrays) + 256
+    while True:
+        offset = HEADER.size + size_reserved
+        for name in sorted(arrays):
+            offset += -offset % ALIGNMENT
+            description['arrays'][name] = {'dtype': arrays[name].dtype.str,
+                                           'shape': list(arrays[name].shape),
+                                           'offset': offset}
+            offset += arrays[name].nbytes
+        encoded = json.dumps(description).encode('utf-8')
+        if len(encoded) <= size_reserved:
+            break
+        size_reserved = len(encoded) + 256
+    encoded += b' ' * (size_reserved - len(encoded))
+
+    # the model is written to a temporary file that then replaces the given
+    # file, since the given file may be memory-mapped by a loaded model.
+    fn_tmp = filename + '.tmp'
+    with open(fn_tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(encoded)))
+        f.write(encoded)
+        for name in sorted(arrays):
+            position = description['arrays'][name]['offset']
+            f.write(b'\0' * (position - f.tell()))
+            f.write(arrays[name].tobytes())
+    os.rename(fn_tmp, filename)
+
+
+def read(filename):
+    # type: (str) -> Tuple[Dict[str, Any], Dict[str, numpy.ndarray]]
+    """
+    Reads the JSON description and the named arrays from a given file in the
+    compact format. Arrays are memory-mapped rather than read into memory.
+    """
+    with open(filename, 'rb') as f:
+        magic, version, _, size_description = HEADER.unpack(f.read(HEADER.size))  # noqa: pycodestyle
+        if magic != MAGIC:
+            raise ValueError("not a compact model file: {}".format(filename))
+        if version != VERSION:
+            raise ValueError("unsupported compact model version: {}".format(version))  # noqa: pycodestyle
+        description = json.loads(f.read(size_description).decode('utf-8'))
+
+    arrays = {}  # type: Dict[str, numpy.ndarray]
+    for (name, info) in description['arrays'].items():
+        dtype = numpy.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        if int(numpy.prod(shape)) == 0:
+            arrays[name] = numpy.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = numpy.memmap(filename, dtype=dtype, mode='r',
+                                        offset=info['offset'], shape=shape)
+    return description, arrays
+
+
+def load(filename):
+    # type: (str) -> Tuple[SupportVectorScorer, Optional[List[str]], Optional[Dict[str, numpy.ndarray]], Dict[str, numpy.ndarray]]  # noqa: pycodestyle
+    """
+    Loads a model from a given file in the compact format, memory-mapping
+    its arrays.
+
+    Returns:
+        a tuple of the form (scorer, vocabulary, preprocessor, extra).
+    """
+    description, arrays = read(filename)
+    kind = description.get('kind', 'svm')
+    if kind != 'svm':
+        raise ValueError("compact model file does not hold an SVM ({}): {}".format(kind, filename))  # noqa: pycodestyle
+
+    if 'sv' in arrays:
+        sv = arrays['sv']
+    else:
+        sv = sparse.csr_matrix((arrays['sv.data'],
+                                arrays['sv.indices'],
+                                arrays['sv.indptr']),
+                               shape=tuple(description['sv_shape']))
+    scorer = SupportVectorScorer(support_vectors=sv,
+                                 dual_coef=arrays['dual_coef'],
+                                 intercept=description['intercept'],
+                                 kernel=description['kernel'],
+                                 gamma=description['gamma'],
+                                 coef0=description['coef0'],
+                                 degree=description['degree'],
+                                 nu=description['nu'])
+
+    vocabulary, preprocessor, extra = unpack_features(description, arrays)
+    return scorer, vocabulary, preprocessor, extra
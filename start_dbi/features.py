@@ -0,0 +1,413 @@
+__all__ = ['Vocabulary', 'FeatureStatistics', 'Reservoir', 'Preprocessor',
+           'DEFAULT_RESERVOIR_SIZE']
+
+from typing import Optional
+import logging
+
+import numpy
+from scipy import sparse
+
+from .trace import Trace
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the number of training rows that are retained by a model (see Model.update)
+DEFAULT_RESERVOIR_SIZE = 2000
+
+
+class Vocabulary(object):
+    """
+    Maps the names of signals to the columns of a feature matrix, allowing
+    traces that report different sets of signals, or report signals in a
+    different order, to be aligned with one another.
+    """
+    def __init__(self, signals=None):
+        # type: (Optional[Sequence[str]]) -> None
+        self.__signals = []  # type: List[str]
+        self.__signal_to_column = {}  # type: Dict[str, int]
+        for name in (signals or []):
+            self.add(name)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.__signals)
+
+    def __contains__(self, name):
+        # type: (str) -> bool
+        return name in self.__signal_to_column
+
+    @property
+    def signals(self):
+        # type: () -> List[str]
+        """
+        Returns the names of the signals within this vocabulary, in column
+        order.
+        """
+        return list(self.__signals)
+
+    def add(self, name):
+        # type: (str) -> int
+        """
+        Adds a signal to this vocabulary, if it is not already present.
+
+        Returns:
+            the column for the given signal.
+        """
+        column = self.__signal_to_column.get(name)
+        if column is None:
+            column = len(self.__signals)
+            self.__signal_to_column[name] = column
+            self.__signals.append(name)
+        return column
+
+    def columns(self, signals, grow=False):
+        # type: (Sequence[str], bool) -> numpy.ndarray
+        """
+        Returns the columns for a given sequence of signals. Signals that do
+        not belong to the vocabulary are either added to the vocabulary, if
+        grow is True, or else given a column of -1.
+        """
+        if grow:
+            return numpy.fromiter((self.add(n) for n in signals),
+                                  dtype=numpy.intp, count=len(signals))
+        get = self.__signal_to_column.get
+        return numpy.fromiter((get(n, -1) for n in signals),
+                              dtype=numpy.intp, count=len(signals))
+
+    def __transform(self, traces, grow):
+        # type: (Iterable[Trace], bool) -> sparse.csr_matrix
+        data = []  # type: List[numpy.ndarray]
+        indices = []  # type: List[numpy.ndarray]
+        indptr = [0]
+
+        # traces produced by the same binary tend to report the same signals
+        # in the same order, so the columns for the most recent ordering of
+        # signals are reused where possible.
+        last_signals = None  # type: Optional[List[str]]
+        last_columns = None  # type: Optional[numpy.ndarray]
+        num_unknown = 0
+
+        for trace in traces:
+            signals = trace.signals
+            if signals != last_signals:
+                last_signals = signals
+                last_columns = self.columns(signals, grow=grow)
+            values = trace.array
+            nonzero = numpy.flatnonzero(values)
+            columns = last_columns[nonzero]
+            values = values[nonzero]
+            if not grow:
+                known = columns >= 0
+                num_unknown += len(columns) - int(known.sum())
+                columns = columns[known]
+                values = values[known]
+            data.append(numpy.asarray(values, dtype=numpy.float64))
+            indices.append(columns)
+            indptr.append(indptr[-1] + len(columns))
+
+        if num_unknown > 0:
+            logger.debug("ignored %d non-zero values for signals outside of vocabulary", num_unknown)  # noqa: pycodestyle
+
+        shape = (len(indptr) - 1, len(self.__signals))
+        if data:
+            data = numpy.concatenate(data)
+            indices = numpy.concatenate(indices)
+        else:
+            data = numpy.zeros(0, dtype=numpy.float64)
+            indices = numpy.zeros(0, dtype=numpy.intp)
+        matrix = sparse.csr_matrix((data, indices, numpy.array(indptr)),
+                                   shape=shape)
+        matrix.sort_indices()
+        return matrix
+
+    def fit_transform(self, traces):
+        # type: (Iterable[Trace]) -> sparse.csr_matrix
+        """
+        Extends this vocabulary with the signals of a given sequence of traces,
+        in a single pass, and returns their sparse feature matrix.
+        """
+        return self.__transform(traces, grow=True)
+
+    def transform(self, traces):
+        # type: (Iterable[Trace]) -> sparse.csr_matrix
+        """
+        Returns the sparse feature matrix for a given sequence of traces.
+        Signals that do not belong to this vocabulary are ignored.
+        """
+        return self.__transform(traces, grow=False)
+
+
+class FeatureStatistics(object):
+    """
+    Accumulates the column statistics needed to fit a Preprocessor, one
+    chunk of rows at a time. Columns missing from earlier chunks are zero.
+    """
+    def __init__(self):
+        # type: () -> None
+        self.__num_rows = 0
+        self.__sum = numpy.zeros(0)
+        self.__sum_sq = numpy.zeros(0)
+        self.__max_abs = numpy.zeros(0)
+
+    @property
+    def num_rows(self):
+        # type: () -> int
+        return self.__num_rows
+
+    @property
+    def num_columns(self):
+        # type: () -> int
+        return len(self.__sum)
+
+    @property
+    def mean(self):
+        # type: () -> numpy.ndarray
+        return self.__sum / max(self.__num_rows, 1)
+
+    @property
+    def mean_sq(self):
+        # type: () -> numpy.ndarray
+        return self.__sum_sq / max(self.__num_rows, 1)
+
+    @property
+    def max_abs(self):
+        # type: () -> numpy.ndarray
+        return self.__max_abs
+
+    def __grow(self, num_columns):
+        # type: (int) -> None
+        extra = num_columns - len(self.__sum)
+        if extra > 0:
+            self.__sum = numpy.concatenate([self.__sum, numpy.zeros(extra)])
+            self.__sum_sq = numpy.concatenate([self.__sum_sq, numpy.zeros(extra)])  # noqa: pycodestyle
+            self.__max_abs = numpy.concatenate([self.__max_abs, numpy.zeros(extra)])  # noqa: pycodestyle
+
+    def update(self, matrix):
+        # type: (Any) -> None
+        """
+        Adds the rows of a given feature matrix to these statistics.
+        """
+        num_columns = matrix.shape[1]
+        self.__grow(num_columns)
+        if sparse.issparse(matrix):
+            matrix = sparse.csr_matrix(matrix)
+            total = numpy.asarray(matrix.sum(axis=0)).ravel()
+            total_sq = numpy.asarray(matrix.multiply(matrix).sum(axis=0)).ravel()  # noqa: pycodestyle
+            max_abs = abs(matrix).max(axis=0).toarray().ravel()
+        else:
+            matrix = numpy.asarray(matrix, dtype=numpy.float64)
+            total = matrix.sum(axis=0)
+            total_sq = (matrix * matrix).sum(axis=0)
+            max_abs = numpy.abs(matrix).max(axis=0) if len(matrix) else 0.0
+        self.__num_rows += matrix.shape[0]
+        self.__sum[:num_columns] += total
+        self.__sum_sq[:num_columns] += total_sq
+        self.__max_abs[:num_columns] = \
+            numpy.maximum(self.__max_abs[:num_columns], max_abs)
+
+
+class Reservoir(object):
+    """
+    Holds a uniform random sample, of at most a fixed number of rows, of the
+    rows of a feature matrix that grows over time (i.e., reservoir sampling).
+    """
+    def __init__(self, size=DEFAULT_RESERVOIR_SIZE, matrix=None, num_seen=0):
+        # type: (int, Optional[Any], int) -> None
+        if size < 1:
+            raise ValueError("reservoir size must be positive")
+        self.__size = size
+        self.__matrix = matrix
+        self.__num_seen = num_seen
+
+    @staticmethod
+    def from_arrays(arrays):
+        # type: (Dict[str, numpy.ndarray]) -> Optional[Reservoir]
+        """
+        Reconstructs a reservoir from the arrays given by its arrays property,
+        or returns None if no arrays are given.
+        """
+        if not arrays:
+            return None
+        if 'dense' in arrays:
+            matrix = numpy.asarray(arrays['dense'])
+        else:
+            matrix = sparse.csr_matrix((arrays['data'],
+                                        arrays['indices'],
+                                        arrays['indptr']),
+                                       shape=tuple(arrays['shape']))
+        return Reservoir(int(arrays['size'][0]), matrix,
+                         int(arrays['num_seen'][0]))
+
+    @property
+    def size(self):
+        # type: () -> int
+        return self.__size
+
+    @property
+    def num_seen(self):
+        # type: () -> int
+        """
+        The number of rows that have been added to this reservoir.
+        """
+        return self.__num_seen
+
+    @property
+    def matrix(self):
+        # type: () -> Any
+        return self.__matrix
+
+    @property
+    def arrays(self):
+        # type: () -> Dict[str, numpy.ndarray]
+        arrays = {'size': numpy.array([self.__size]),
+                  'num_seen': numpy.array([self.__num_seen])}
+        matrix = self.__matrix
+        if sparse.issparse(matrix):
+            matrix = sparse.csr_matrix(matrix)
+            arrays['data'] = matrix.data
+            arrays['indices'] = matrix.indices
+            arrays['indptr'] = matrix.indptr
+            arrays['shape'] = numpy.array(matrix.shape)
+        else:
+            arrays['dense'] = numpy.asarray(matrix)
+        return arrays
+
+    def resize(self, num_columns):
+        # type: (int) -> None
+        """
+        Extends the (sparse) rows of this reservoir with zero-valued columns.
+        """
+        matrix = sparse.csr_matrix(self.__matrix)
+        matrix.resize((matrix.shape[0], num_columns))
+        self.__matrix = matrix
+
+    def add(self, matrix):
+        # type: (Any) -> None
+        """
+        Adds the rows of a given feature matrix to this reservoir, each of
+        which replaces a random member once it is full (i.e., Algorithm R).
+        """
+        num_rows = matrix.shape[0]
+        # the sample depends only on the rows that have been seen
+        rng = numpy.random.RandomState(self.__num_seen % (2 ** 32))
+        if self.__matrix is None:
+            stacked = matrix
+            num_held = 0
+        elif sparse.issparse(self.__matrix) or sparse.issparse(matrix):
+            stacked = sparse.vstack([self.__matrix, matrix], format='csr')
+            num_held = self.__matrix.shape[0]
+        else:
+            stacked = numpy.vstack([self.__matrix, matrix])
+            num_held = self.__matrix.shape[0]
+
+        # rows are appended until the reservoir is full
+        num_taken = min(num_rows, self.__size - num_held)
+        source = numpy.arange(num_held + num_taken)
+        seen = self.__num_seen + numpy.arange(num_taken, num_rows) + 1
+        slots = (rng.random_sample(len(seen)) * seen).astype(numpy.int64)
+        for (row, slot) in zip(range(num_taken, num_rows), slots):
+            if slot < self.__size:
+                source[slot] = num_held + row
+        self.__matrix = stacked[source]
+        self.__num_seen += num_rows
+
+
+class Preprocessor(object):
+    """
+    Drops (almost) constant signals, scales the rest by their maximum
+    absolute value, and optionally projects them onto fewer components.
+    """
+    @staticmethod
+    def fit(matrix, min_variance=0.0, n_components=None):
+        # type: (Any, float, Optional[int]) -> Preprocessor
+        """
+        Fits a preprocessor to a given feature matrix, dropping signals
+        whose scaled variance does not exceed min_variance, and projecting
+        onto n_components components via truncated SVD, if given.
+        """
+        logger.debug("fitting preprocessor to %d traces and %d signals",
+                     matrix.shape[0], matrix.shape[1])
+        statistics = FeatureStatistics()
+        statistics.update(matrix)
+        preprocessor = Preprocessor.from_statistics(statistics, min_variance)
+        keep = preprocessor.keep
+        if n_components:
+            n_components = min(n_components, len(keep) - 1, matrix.shape[0] - 1)  # noqa: pycodestyle
+        # too few signals or traces remain to be projected
+        if n_components and n_components > 0:
+            from sklearn.decomposition import TruncatedSVD
+            scaled = preprocessor.transform(matrix)
+            svd = TruncatedSVD(n_components=n_components)
+            svd.fit(scaled)
+            preprocessor = Preprocessor(keep, preprocessor.scale,
+                                        svd.components_)
+            logger.debug("preprocessor projects signals onto %d components",
+                         n_components)
+        return preprocessor
+
+    @staticmethod
+    def from_statistics(statistics, min_variance=0.0):
+        # type: (FeatureStatistics, float) -> Preprocessor
+        """
+        Constructs a preprocessor, without a projection, from the statistics
+        of a feature matrix (see Preprocessor.fit).
+        """
+        mean = statistics.mean
+        max_abs = statistics.max_abs
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            variance = numpy.maximum(statistics.mean_sq - mean * mean, 0.0) / (max_abs * max_abs)  # noqa: pycodestyle
+        keep = numpy.flatnonzero((max_abs > 0) & (variance > max(min_variance, 1e-12)))  # noqa: pycodestyle
+        if len(keep) == 0 and statistics.num_columns > 0:
+            # every signal is (almost) constant, so the signal with the
+            # greatest variance, or else magnitude, is kept
+            order = numpy.lexsort((max_abs, numpy.nan_to_num(variance)))
+            keep = order[-1:]
+            logger.warning("every signal is constant or almost constant: keeping signal %d", keep[0])  # noqa: pycodestyle
+        scale = 1.0 / numpy.where(max_abs[keep] > 0, max_abs[keep], 1.0)
+        logger.debug("preprocessor keeps %d of %d signals",
+                     len(keep), statistics.num_columns)
+        return Preprocessor(keep, scale)
+
+    def __init__(self, keep, scale, components=None):
+        # type: (numpy.ndarray, numpy.ndarray, Optional[numpy.ndarray]) -> None
+        """
+        Parameters:
+            keep: the columns of the signals that are retained.
+            scale: the factor by which each retained signal is multiplied.
+            components: an optional projection, with a row per component.
+        """
+        self.__keep = numpy.asarray(keep, dtype=numpy.intp)
+        self.__scale = numpy.asarray(scale, dtype=numpy.float64)
+        self.__components = components
+
+    @property
+    def keep(self):
+        # type: () -> numpy.ndarray
+        return self.__keep
+
+    @property
+    def scale(self):
+        # type: () -> numpy.ndarray
+        return self.__scale
+
+    @property
+    def components(self):
+        # type: () -> Optional[numpy.ndarray]
+        return self.__components
+
+    def transform(self, matrix):
+        # type: (Any) -> Any
+        """
+        Applies this preprocessor to a given feature matrix. Sparse matrices
+        remain sparse unless they are projected.
+        """
+        if sparse.issparse(matrix):
+            matrix = sparse.csr_matrix(matrix)[:, self.__keep]
+            matrix = sparse.csr_matrix(matrix.multiply(self.__scale))
+        else:
+            matrix = numpy.asarray(matrix, dtype=numpy.float64)
+            matrix = matrix[:, self.__keep] * self.__scale
+        if self.__components is not None:
+            matrix = numpy.asarray(matrix.dot(self.__components.T))
+        return matrix
@@ -0,0 +1,410 @@
+__all__ = ['KernelCache', 'kernel_params', 'fit_precomputed']
+
+from typing import Optional
+import hashlib
+import json
+import logging
+import os
+
+import numpy
+from scipy import sparse
+
+from .cache import locked_json
+from .features import Vocabulary, Preprocessor
+from . import compact
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+FN_FEATURES = 'features.model'
+FN_INDEX = 'index.json'
+
+# the factor by which the capacity of a Gram matrix grows when it is full,
+# which avoids copying the matrix whenever a few traces are added
+GRAM_GROWTH = 1.5
+
+# the number of rows of a Gram matrix that are computed at once
+GRAM_BLOCK_SIZE = 1024
+
+
+def kernel_params(kernel='rbf', gamma='scale', coef0=0.0, degree=3,
+                  num_features=None, variance=None):
+    # type: (str, Union[str, float], float, int, Optional[int], Optional[float]) -> Dict[str, Any]  # noqa: pycodestyle
+    """
+    Returns the parameters of a kernel in a canonical form, resolving a gamma
+    of 'auto' or 'scale' as sklearn.svm.OneClassSVM does, given the number of
+    features and (for 'scale') the variance of the training matrix.
+    """
+    if kernel not in ('linear', 'poly', 'rbf', 'sigmoid'):
+        raise ValueError("unsupported kernel: {}".format(kernel))
+    if gamma in ('auto', 'scale'):
+        if not num_features:
+            raise ValueError("number of features is required to resolve gamma")  # noqa: pycodestyle
+        if gamma == 'auto':
+            gamma = 1.0 / num_features
+        elif variance is None:
+            raise ValueError("variance is required to resolve gamma='scale'")  # noqa: pycodestyle
+        else:
+            gamma = 1.0 / (num_features * variance) if variance != 0 else 1.0
+    elif isinstance(gamma, str):
+        raise ValueError("unsupported gamma: {}".format(gamma))
+    return {'kernel': kernel,
+            'gamma': float(gamma),
+            'coef0': float(coef0),
+            'degree': int(degree)}
+
+
+def _variance(matrix):
+    # type: (Any) -> float
+    """
+    Returns the variance of every value of a given matrix, as used by
+    sklearn to resolve gamma='scale'.
+    """
+    if sparse.issparse(matrix):
+        mean = matrix.mean()
+        return float(matrix.multiply(matrix).mean() - mean * mean)
+    return float(numpy.asarray(matrix).var())
+
+
+def fit_precomputed(gram, support_features, params, nu=0.5):
+    # type: (numpy.ndarray, Callable[[numpy.ndarray], Any], Dict[str, Any], float) -> compact.SupportVectorScorer  # noqa: pycodestyle
+    """
+    Fits a one-class SVM to a precomputed Gram matrix, and returns a scorer
+    that evaluates the SVM on feature matrices, given a function that returns
+    the features of given training rows.
+    """
+    from sklearn.svm import OneClassSVM
+    svm = OneClassSVM(kernel='precomputed', nu=nu)
+    svm.fit(numpy.asarray(gram))
+    return compact.SupportVectorScorer(
+        support_vectors=support_features(svm.support_),
+        dual_coef=compact._as_dense(svm.dual_coef_).ravel(),
+        intercept=float(numpy.ravel(svm.intercept_)[0]),
+        nu=nu,
+        **params)
+
+
+class KernelCache(object):
+    """
+    Provides an on-disk cache, which may be shared by several processes, of
+    the Gram matrix for a growing corpus of traces for each set of kernel
+    parameters, within the fixed feature space of the initial traces.
+    """
+    @staticmethod
+    def create(directory, traces, min_variance=0.0, n_components=None):
+        # type: (str, Sequence[Trace], float, Optional[int]) -> KernelCache
+        """
+        Creates a cache in a given directory, whose feature space is fit to a
+        given sequence of traces (see Preprocessor.fit), and adds the traces.
+        """
+        traces = list(traces)
+        if os.path.exists(os.path.join(directory, FN_FEATURES)):
+            raise ValueError("kernel cache already exists: {}".format(directory))  # noqa: pycodestyle
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        vocabulary = Vocabulary()
+        matrix = vocabulary.fit_transform(traces)
+        preprocessor = Preprocessor.fit(matrix,
+                                        min_variance=min_variance,
+                                        n_components=n_components)
+        # gamma='scale' is resolved once, from the traces with which the cache
+        # is created, so that its Gram matrix can be extended as traces are
+        # added rather than recomputed
+        description = {'kind': 'features',
+                       'variance': _variance(preprocessor.transform(matrix))}  # type: Dict[str, Any]  # noqa: pycodestyle
+        arrays = {}  # type: Dict[str, numpy.ndarray]
+        compact.pack_features(description, arrays, vocabulary.signals,
+                              {'keep': preprocessor.keep,
+                               'scale': preprocessor.scale,
+                               'components': preprocessor.components})
+        compact.write(os.path.join(directory, FN_FEATURES),
+                      description, arrays)
+        cache = KernelCache(directory)
+        cache.add(traces)
+        return cache
+
+    def __init__(self, directory):
+        # type: (str) -> None
+        """
+        Opens the cache in a given directory (see KernelCache.create).
+        """
+        description, arrays = compact.read(os.path.join(directory, FN_FEATURES))  # noqa: pycodestyle
+        if description.get('kind') != 'features':
+            raise ValueError("not a kernel cache: {}".format(directory))
+        signals, preprocessor, _ = compact.unpack_features(description, arrays)  # noqa: pycodestyle
+        self.__directory = directory
+        self.__fn_index = os.path.join(directory, FN_INDEX)
+        self.__vocabulary = Vocabulary(signals)
+        self.__preprocessor = Preprocessor(**preprocessor)
+        self.__variance = description.get('variance')  # type: Optional[float]
+        # the rows of features for each segment, indexed by filename
+        self.__segments = {}  # type: Dict[str, Any]
+
+    @property
+    def directory(self):
+        # type: () -> str
+        return self.__directory
+
+    @property
+    def vocabulary(self):
+        # type: () -> Vocabulary
+        return self.__vocabulary
+
+    @property
+    def preprocessor(self):
+        # type: () -> Preprocessor
+        return self.__preprocessor
+
+    @property
+    def num_features(self):
+        # type: () -> int
+        if self.__preprocessor.components is not None:
+            return self.__preprocessor.components.shape[0]
+        return len(self.__preprocessor.keep)
+
+    def __index(self):
+        # type: () -> ContextManager[Dict[str, Any]]
+        return locked_json(self.__fn_index,
+                           lambda: {'digests': [], 'segments': [], 'grams': {}})  # noqa: pycodestyle
+
+    def __len__(self):
+        # type: () -> int
+        if not os.path.exists(self.__fn_index):
+            return 0
+        with open(self.__fn_index, 'r') as f:
+            return len(json.load(f)['digests'])
+
+    def transform(self, traces):
+        # type: (Iterable[Trace]) -> Any
+        """
+        Returns the feature matrix for a given sequence of traces.
+        """
+        return self.__preprocessor.transform(self.__vocabulary.transform(traces))  # noqa: pycodestyle
+
+    def add(self, traces):
+        # type: (Iterable[Trace]) -> numpy.ndarray
+        """
+        Adds a given sequence of traces to this cache, skipping traces that
+        are already present, and returns the row of each trace. Gram
+        matrices are extended lazily, when they are next requested.
+        """
+        traces = list(traces)
+        digests = [t.digest() for t in traces]
+        with self.__index() as index:
+            row_of = {d: i for (i, d) in enumerate(index['digests'])}
+            new = []  # type: List[int]
+            for (i, digest) in enumerate(digests):
+                if digest not in row_of:
+                    row_of[digest] = len(index['digests'])
+                    index['digests'].append(digest)
+                    new.append(i)
+            if new:
+                start = row_of[digests[new[0]]]
+                filename = 'rows-{:09d}.model'.format(start)
+                self.__write_segment(filename,
+                                     self.transform([traces[i] for i in new]))
+                index['segments'].append({'filename': filename,
+                                          'start': start,
+                                          'size': len(new)})
+                logger.debug("added %d of %d traces to kernel cache: %s",
+                             len(new), len(traces), self.__directory)
+        return numpy.array([row_of[d] for d in digests], dtype=numpy.intp)
+
+    def __write_segment(self, filename, matrix):
+        # type: (str, Any) -> None
+        arrays = {}  # type: Dict[str, numpy.ndarray]
+        if sparse.issparse(matrix):
+            matrix = sparse.csr_matrix(matrix)
+            arrays.update({'data': matrix.data,
+                           'indices': matrix.indices,
+                           'indptr': matrix.indptr})
+        else:
+            arrays['rows'] = numpy.asarray(matrix, dtype=numpy.float64)
+        compact.write(os.path.join(self.__directory, filename),
+                      {'kind': 'rows', 'shape': list(matrix.shape)},
+                      arrays)
+
+    def __read_segment(self, filename):
+        # type: (str) -> Any
+        segment = self.__segments.get(filename)
+        if segment is None:
+            description, arrays = compact.read(os.path.join(self.__directory,
+                                                            filename))
+            if 'rows' in arrays:
+                segment = arrays['rows']
+            else:
+                segment = sparse.csr_matrix((arrays['data'],
+                                             arrays['indices'],
+                                             arrays['indptr']),
+                                            shape=tuple(description['shape']))  # noqa: pycodestyle
+            self.__segments[filename] = segment
+        return segment
+
+    def __features(self, segments, rows=None):
+        # type: (List[Dict[str, Any]], Optional[numpy.ndarray]) -> Any
+        matrices = [self.__read_segment(s['filename']) for s in segments]
+        if not matrices:
+            return sparse.csr_matrix((0, self.num_features))
+        if sparse.issparse(matrices[0]):
+            matrix = sparse.vstack(matrices, format='csr')
+        else:
+            matrix = numpy.vstack(matrices)
+        if rows is not None:
+            matrix = matrix[rows]
+        return matrix
+
+    def features(self, rows=None):
+        # type: (Optional[Sequence[int]]) -> Any
+        """
+        Returns the feature matrix for the given rows of this cache, or for
+        every row if no rows are given.
+        """
+        with self.__index() as index:
+            segments = list(index['segments'])
+        if rows is not None:
+            rows = numpy.asarray(rows, dtype=numpy.intp)
+        return self.__features(segments, rows)
+
+    @property
+    def variance(self):
+        # type: () -> float
+        """
+        The variance of the features of the traces with which this cache was
+        created, from which gamma='scale' is resolved.
+        """
+        if self.__variance is None:
+            # caches created by earlier versions do not record the variance,
+            # but their first segment holds the traces they were created with
+            with self.__index() as index:
+                segments = index['segments'][:1]
+            self.__variance = _variance(self.__features(segments))
+        return self.__variance
+
+    def params(self, kernel='rbf', gamma='scale', coef0=0.0, degree=3):
+        # type: (str, Union[str, float], float, int) -> Dict[str, Any]
+        """
+        Returns the canonical parameters of a kernel (see kernel_params)
+        within the feature space of this cache.
+        """
+        variance = self.variance if gamma == 'scale' else None
+        return kernel_params(kernel, gamma, coef0, degree, self.num_features,
+                             variance)
+
+    def gram(self,
+             rows=None,         # type: Optional[Sequence[int]]
+             kernel='rbf',      # type: str
+             gamma='scale',     # type: Union[str, float]
+             coef0=0.0,         # type: float
+             degree=3           # type: int
+             ):                 # type: (...) -> numpy.ndarray
+        """
+        Returns the kernel (see KernelCache.params) between every pair of
+        the given rows of this cache, or of every row, computing only what
+        has not yet been computed.
+        """
+        params = self.params(kernel, gamma, coef0, degree)
+        key = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]  # noqa: pycodestyle
+        with self.__index() as index:
+            if key not in index['grams']:
+                self.__remove_superseded(index, params, gamma)
+            entry = index['grams'].setdefault(key, {
+                'params': params,
+                'gamma': gamma,
+                'filename': 'gram-{}.npy'.format(key),
+                'size': 0,
+                'capacity': 0
+            })
+            matrix = self.__extend(entry, index['segments'],
+                                   len(index['digests']))
+        if rows is None:
+            return numpy.array(matrix[:entry['size'], :entry['size']])
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        return matrix[numpy.ix_(rows, rows)]
+
+    def cross(self,
+              traces,           # type: Iterable[Trace]
+              rows=None,        # type: Optional[Sequence[int]]
+              kernel='rbf',     # type: str
+              gamma='scale',    # type: Union[str, float]
+              coef0=0.0,        # type: float
+              degree=3          # type: int
+              ):                # type: (...) -> numpy.ndarray
+        """
+        Returns the kernel (see KernelCache.params) between each of a given
+        sequence of traces, which are not added, and each of the given rows.
+        """
+        params = self.params(kernel, gamma, coef0, degree)
+        features = self.features(rows)
+        matrix = self.transform(traces)
+        values = [compact.kernel_matrix(matrix[block:block + GRAM_BLOCK_SIZE],
+                                        features,
+                                        **params)
+                  for block in range(0, matrix.shape[0], GRAM_BLOCK_SIZE)]
+        if not values:
+            return numpy.zeros((0, features.shape[0]))
+        return numpy.vstack(values)
+
+    def __remove_superseded(self, index, params, gamma):
+        # type: (Dict[str, Any], Dict[str, Any], Union[str, float]) -> None
+        """
+        Removes the Gram matrices for the same kernel and gamma as given
+        parameters whose gamma was resolved to a different value.
+        """
+        for (key, entry) in list(index['grams'].items()):
+            if entry.get('gamma', entry['params']['gamma']) != gamma:
+                continue
+            if any(entry['params'][n] != params[n]
+                   for n in ('kernel', 'coef0', 'degree')):
+                continue
+            logger.debug("removing superseded Gram matrix: %s",
+                         entry['filename'])
+            del index['grams'][key]
+            try:
+                os.remove(os.path.join(self.__directory, entry['filename']))
+            except OSError:
+                pass
+
+    def __extend(self, entry, segments, size):
+        # type: (Dict[str, Any], List[Dict[str, Any]], int) -> numpy.ndarray
+        """
+        Extends the Gram matrix described by a given index entry to cover a
+        given number of rows, and returns the matrix.
+        """
+        filename = os.path.join(self.__directory, entry['filename'])
+        if entry['size'] == size:
+            return numpy.load(filename, mmap_mode='r')
+
+        start = entry['size']
+        if size > entry['capacity']:
+            capacity = max(size, int(entry['capacity'] * GRAM_GROWTH))
+            fn_tmp = filename + '.tmp'
+            matrix = numpy.lib.format.open_memmap(fn_tmp, mode='w+',
+                                                  dtype=numpy.float64,
+                                                  shape=(capacity, capacity))
+            if start > 0:
+                previous = numpy.load(filename, mmap_mode='r')
+                matrix[:start, :start] = previous[:start, :start]
+                del previous
+            matrix.flush()
+            os.rename(fn_tmp, filename)
+            entry['capacity'] = capacity
+            logger.debug("grew Gram matrix to a capacity of %d rows: %s",
+                         capacity, filename)
+        matrix = numpy.lib.format.open_memmap(filename, mode='r+')
+
+        features = self.__features(segments)
+        params = entry['params']
+        squared_norms = compact._squared_norms(features)
+        for block in range(start, size, GRAM_BLOCK_SIZE):
+            end = min(block + GRAM_BLOCK_SIZE, size)
+            values = compact.kernel_matrix(features[block:end],
+                                           features[:end],
+                                           y_squared_norms=squared_norms[:end],  # noqa: pycodestyle
+                                           **params)
+            matrix[block:end, :end] = values
+            matrix[:end, block:end] = values.T
+        matrix.flush()
+        logger.debug("computed %d new rows of Gram matrix (%d rows in total): %s",  # noqa: pycodestyle
+                     size - start, size, filename)
+        entry['size'] = size
+        return matrix
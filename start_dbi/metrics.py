@@ -0,0 +1,336 @@
+__all__ = ['Phase', 'TraceMetrics', 'ChildWatcher', 'METRICS_SUFFIX']
+
+from typing import Optional
+import collections
+import contextlib
+import json
+import logging
+import resource
+import threading
+import time
+
+from .process import find_processes, process_usage, socket_states
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the suffix given to the metrics file that is saved next to a trace
+METRICS_SUFFIX = '.metrics.json'
+
+# describes the wall time, CPU time (in seconds) and peak resident set size
+# (in bytes) for a single phase of trace generation. The source of a phase
+# indicates whether its CPU time and peak RSS were measured for this process
+# ('self') or for the instrumented SITL ('valgrind').
+Phase = collections.namedtuple('Phase',
+                               ['name', 'wall_time', 'cpu_time', 'peak_rss',
+                                'source'])
+
+# the events that are observed for the instrumented SITL, in the order in
+# which they are expected to occur, together with the phase that each event
+# concludes. The phase that follows the final event is the flight.
+CHILD_EVENTS = [('launched', 'launch'),
+                ('listening', 'instrumentation'),
+                ('connected', 'connection')]
+PHASE_FLIGHT = 'flight'
+
+
+def _self_usage():
+    # type: () -> Tuple[float, int]
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * 1024
+
+
+class ChildWatcher(object):
+    """
+    Watches the instrumented SITL, located via its command line, and records
+    when it is launched, starts listening and accepts a connection, together
+    with its CPU time and peak RSS at each of those times.
+    """
+    def __init__(self, marker, interval=0.25):
+        # type: (str, float) -> None
+        """
+        Parameters:
+            marker: a string that only appears in the command line of the
+                SITL (e.g., the name of the signals file).
+            interval: the number of seconds between samples.
+        """
+        self.__marker = marker
+        self.__interval = interval
+        self.__pids = []  # type: List[int]
+        self.__usage = {}  # type: Dict[int, Dict[str, float]]
+        self.__events = {}  # type: Dict[str, Tuple[float, float, int]]
+        self.__stopped = threading.Event()
+        self.__thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def events(self):
+        # type: () -> Dict[str, Tuple[float, float, int]]
+        """
+        The time at which each observed event occurred, together with the
+        total CPU time and peak RSS of the SITL at that time.
+        """
+        return dict(self.__events)
+
+    @property
+    def pids(self):
+        # type: () -> List[int]
+        return list(self.__pids)
+
+    def usage(self):
+        # type: () -> Tuple[float, int]
+        """
+        Returns the total CPU time and the peak RSS of the processes that
+        belong to the SITL, as of their most recent sample.
+        """
+        cpu_time = sum(u['cpu_time'] for u in self.__usage.values())
+        peak_rss = max([int(u['peak_rss']) for u in self.__usage.values()] or [0])  # noqa: pycodestyle
+        return cpu_time, peak_rss
+
+    def __sample(self):
+        # type: () -> None
+        now = time.time()
+        if not self.__pids:
+            self.__pids = find_processes(self.__marker)
+            if not self.__pids:
+                return
+            logger.debug("found instrumented SITL processes: %s", self.__pids)
+
+        states = set()  # type: Set[str]
+        for pid in self.__pids:
+            usage = process_usage(pid)
+            if usage is not None:
+                self.__usage[pid] = usage
+                states |= socket_states(pid)
+
+        observed = {'launched': True,
+                    'listening': 'LISTEN' in states or 'ESTABLISHED' in states,  # noqa: pycodestyle
+                    'connected': 'ESTABLISHED' in states}
+        cpu_time, peak_rss = self.usage()
+        for (event, _) in CHILD_EVENTS:
+            if observed[event] and event not in self.__events:
+                self.__events[event] = (now, cpu_time, peak_rss)
+
+    def __watch(self):
+        # type: () -> None
+        while not self.__stopped.is_set():
+            try:
+                self.__sample()
+            except Exception:
+                logger.exception("failed to sample instrumented SITL")
+            self.__stopped.wait(self.__interval)
+
+    def start(self):
+        # type: () -> None
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__watch)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        # type: () -> None
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+
+class TraceMetrics(object):
+    """
+    Records the wall time, CPU time and peak RSS of each phase of the
+    generation of a trace and of the instrumented SITL (see ChildWatcher).
+    Callbacks may be registered via on_phase.
+    """
+    @staticmethod
+    def filename_for(filename_trace):
+        # type: (str) -> str
+        """
+        Returns the name of the metrics file for a given trace file.
+        """
+        return filename_trace + METRICS_SUFFIX
+
+    @staticmethod
+    def from_dict(contents):
+        # type: (Dict[str, Any]) -> TraceMetrics
+        metrics = TraceMetrics()
+        metrics.__phases = [Phase(**p) for p in contents['phases']]
+        metrics.__valgrind = contents.get('valgrind')
+        metrics.__cached = contents.get('cached', False)
+        metrics.__speedup = contents.get('speedup', 1.0)
+        # metrics were once saved with an unqualified simulated duration
+        duration = contents.get('simulated_duration')
+        metrics.__estimated_simulated_duration = \
+            contents.get('estimated_simulated_duration', duration)
+        return metrics
+
+    @staticmethod
+    def from_file(filename):
+        # type: (str) -> TraceMetrics
+        with open(filename, 'r') as f:
+            return TraceMetrics.from_dict(json.load(f))
+
+    def __init__(self):
+        # type: () -> None
+        self.__phases = []  # type: List[Phase]
+        self.__valgrind = None  # type: Optional[Dict[str, Any]]
+        self.__cached = False
+        self.__speedup = 1.0
+        self.__estimated_simulated_duration = None  # type: Optional[float]
+        self.__callbacks = []  # type: List[Callable[[Phase], None]]
+
+    def __getstate__(self):
+        # type: () -> Dict[str, Any]
+        # callbacks are not carried across processes
+        state = dict(self.__dict__)
+        state['_TraceMetrics__callbacks'] = []
+        return state
+
+    @property
+    def phases(self):
+        # type: () -> List[Phase]
+        return list(self.__phases)
+
+    @property
+    def cached(self):
+        # type: () -> bool
+        """
+        True if the trace was obtained from a trace cache.
+        """
+        return self.__cached
+
+    @cached.setter
+    def cached(self, cached):
+        # type: (bool) -> None
+        self.__cached = cached
+
+    @property
+    def speedup(self):
+        # type: () -> float
+        """
+        The speedup at which the SITL was run.
+        """
+        return self.__speedup
+
+    @speedup.setter
+    def speedup(self, speedup):
+        # type: (float) -> None
+        self.__speedup = speedup
+
+    @property
+    def estimated_simulated_duration(self):
+        # type: () -> Optional[float]
+        """
+        An estimate of the duration of the mission in simulated time, in
+        seconds, if known: the wall time of the flight multiplied by the
+        speedup. This is an upper bound, since the SITL may fall behind the
+        requested speedup (e.g., under Valgrind).
+        """
+        return self.__estimated_simulated_duration
+
+    @estimated_simulated_duration.setter
+    def estimated_simulated_duration(self, duration):
+        # type: (Optional[float]) -> None
+        self.__estimated_simulated_duration = duration
+
+    def flight_time(self):
+        # type: () -> Optional[float]
+        """
+        Returns the wall time of the flight, if the connection to the SITL was
+        observed, or else the wall time of the mission as a whole. Returns
+        None if neither phase was recorded.
+        """
+        flight = [p for p in self.__phases
+                  if p.name == PHASE_FLIGHT and p.source == 'valgrind']
+        connected = [p for p in self.__phases
+                     if p.name == 'connection' and p.source == 'valgrind']
+        if flight and connected:
+            return flight[-1].wall_time
+        mission = [p for p in self.__phases if p.name == 'mission']
+        if mission:
+            return mission[-1].wall_time
+        return None
+
+    @property
+    def wall_time(self):
+        # type: () -> float
+        """
+        The total wall time of the phases measured for this process.
+        """
+        return sum(p.wall_time for p in self.__phases if p.source == 'self')
+
+    def on_phase(self, callback):
+        # type: (Callable[[Phase], None]) -> None
+        """
+        Registers a callback that is called with each phase once it has been
+        recorded.
+        """
+        self.__callbacks.append(callback)
+
+    def record(self, phase):
+        # type: (Phase) -> None
+        self.__phases.append(phase)
+        logger.debug("phase [%s] took %.3f s (cpu: %.3f s; peak rss: %d bytes)",  # noqa: pycodestyle
+                     phase.name, phase.wall_time, phase.cpu_time,
+                     phase.peak_rss)
+        for callback in self.__callbacks:
+            try:
+                callback(phase)
+            except Exception:
+                logger.exception("metrics callback failed for phase: %s",
+                                 phase.name)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # type: (str) -> Iterator[None]
+        """
+        Measures the wall time, CPU time and peak RSS of this process for the
+        duration of the block, and records it as a phase with a given name.
+        The phase is recorded even if the block raises an exception.
+        """
+        time_start = time.time()
+        cpu_start, _ = _self_usage()
+        try:
+            yield
+        finally:
+            cpu_end, peak_rss = _self_usage()
+            self.record(Phase(name,
+                              time.time() - time_start,
+                              cpu_end - cpu_start,
+                              peak_rss,
+                              'self'))
+
+    def record_child(self, watcher, time_start, time_end):
+        # type: (ChildWatcher, float, float) -> None
+        """
+        Records the phases of the instrumented SITL, as observed by a given
+        watcher between two given times. Phases whose concluding event was
+        not observed are merged into the phase that follows them.
+        """
+        events = watcher.events
+        last_time, last_cpu = time_start, 0.0
+        for (event, name) in CHILD_EVENTS:
+            if event not in events:
+                continue
+            t, cpu_time, peak_rss = events[event]
+            self.record(Phase(name, t - last_time, cpu_time - last_cpu,
+                              peak_rss, 'valgrind'))
+            last_time, last_cpu = t, cpu_time
+        cpu_time, peak_rss = watcher.usage()
+        self.record(Phase(PHASE_FLIGHT, max(time_end - last_time, 0.0),
+                          max(cpu_time - last_cpu, 0.0), peak_rss, 'valgrind'))
+        self.__valgrind = {'pids': watcher.pids,
+                           'cpu_time': cpu_time,
+                           'peak_rss': peak_rss}
+
+    def to_dict(self):
+        # type: () -> Dict[str, Any]
+        return {'phases': [dict(p._asdict()) for p in self.__phases],
+                'valgrind': self.__valgrind,
+                'cached': self.__cached,
+                'speedup': self.__speedup,
+                'estimated_simulated_duration': self.__estimated_simulated_duration,  # noqa: pycodestyle
+                'wall_time': self.wall_time}
+
+    def to_file(self, filename):
+        # type: (str) -> None
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -1,57 +1,401 @@
-__all__ = ['Model']
+__all__ = ['Model', 'LOF']
 
+from typing import TYPE_CHECKING
 import logging
 
 import numpy
-from sklearn import svm as svm_module
-from sklearn import externals
-from sklearn.neighbors import LocalOutlierFactor
+from scipy import sparse
 
 from .trace import Trace
+from .features import Vocabulary, Preprocessor, Reservoir, \
+    DEFAULT_RESERVOIR_SIZE
+from .neighbors import NeighborIndex, RandomProjectionIndex
+from .prefilter import Prefilter, NOMINAL, ANOMALOUS, AMBIGUOUS
+from .streaming import DEFAULT_CHUNK_SIZE, reduce_traces
+from . import compact
+
+if TYPE_CHECKING:
+    from .kernels import KernelCache
+    from .store import TraceStore
+    from .tuning import TuningResult
 
 logger = logging.getLogger(__name__)  # type: logging.Logger
 logger.setLevel(logging.DEBUG)
 
+# the prefix of the names of the arrays of a prefilter within the extra arrays
+# of a compact model file
+PREFILTER_PREFIX = 'prefilter.'
+
+# the prefix of the names of the arrays of the training reservoir of a model
+RESERVOIR_PREFIX = 'reservoir.'
+
+# LOF models built from at least this many traces use approximate neighbor
+# search, unless an algorithm is specified
+LOF_APPROXIMATE_THRESHOLD = 10000
+
+# sklearn is slow to import and is only needed to train models (or to load
+# models that were saved as joblib pickles), and so it is imported lazily.
+# Models that are loaded from the compact format are scored without sklearn.
+
 
 # NOTE in the future, you can implement different subclasses of Model
 class Model(object):
     # type: (List[Trace]) -> Model
     @staticmethod
-    def build(traces):
+    def build(traces,                                   # type: Iterable[Trace]
+              min_variance=0.0,                         # type: float
+              n_components=None,                        # type: Optional[int]
+              kernel_cache=None,                        # type: Optional[KernelCache]  # noqa: pycodestyle
+              prefilter=False,                          # type: bool
+              reservoir_size=DEFAULT_RESERVOIR_SIZE,    # type: Optional[int]
+              **params                                  # type: Any
+              ):                                        # type: (...) -> Model
         """
-        Constructs a model from a set of execution traces.
+        Constructs a model from a set of execution traces, which are aligned
+        to a vocabulary of their signals and preprocessed (see
+        start_dbi.features) before the SVM is fit.
+
+        Parameters:
+            traces: the execution traces.
+            min_variance: signals whose scaled variance does not exceed this
+                threshold are dropped (see Preprocessor.fit).
+            n_components: if given, the scaled signals are projected onto this
+                many components.
+            kernel_cache: an optional kernel cache (see start_dbi.kernels),
+                whose Gram matrix and features are used.
+            prefilter: if True, a prefilter (see start_dbi.prefilter) is
+                applied before the SVM. Requires an rbf or linear kernel.
+            reservoir_size: the number of training traces sampled for
+                Model.update, or None.
+            params: any parameters for sklearn.svm.OneClassSVM (e.g., nu,
+                gamma and kernel, as found by Model.tune).
         """
+        if kernel_cache is not None:
+            if prefilter:
+                raise ValueError("a prefilter cannot be fit with a kernel cache")  # noqa: pycodestyle
+            return Model._build_precomputed(traces, kernel_cache,
+                                            reservoir_size=reservoir_size,
+                                            **params)
         logging.debug("building model from provided traces.")
-        matrix = numpy.array([t.values for t in traces])
-        svm = svm_module.OneClassSVM()
-        svm.fit(matrix)
-        model = Model(svm)
+        vocabulary = Vocabulary()
+        matrix = vocabulary.fit_transform(traces)
+        logging.debug("built feature matrix: %d traces, %d signals, %d non-zero values",  # noqa: pycodestyle
+                      matrix.shape[0], matrix.shape[1], matrix.nnz)
+        preprocessor = Preprocessor.fit(matrix,
+                                        min_variance=min_variance,
+                                        n_components=n_components)
+        features = preprocessor.transform(matrix)
+        from sklearn import svm as svm_module
+        svm = svm_module.OneClassSVM(**params)
+        svm.fit(features)
+        model = Model(svm, vocabulary, preprocessor,
+                      reservoir=Model._sample(features, reservoir_size))
+        if prefilter:
+            model.__prefilter = Prefilter.fit(matrix, svm, preprocessor)
         logging.debug("built model from provided traces.")
         return model
 
+    @staticmethod
+    def _sample(features, reservoir_size):
+        # type: (Any, Optional[int]) -> Optional[Reservoir]
+        if not reservoir_size:
+            return None
+        reservoir = Reservoir(reservoir_size)
+        reservoir.add(features)
+        return reservoir
+
+    @staticmethod
+    def _build_precomputed(traces,                  # type: Iterable[Trace]
+                           kernel_cache,            # type: KernelCache
+                           nu=0.5,                  # type: float
+                           reservoir_size=None,     # type: Optional[int]
+                           **kernel                 # type: Any
+                           ):                       # type: (...) -> Model
+        from .kernels import fit_precomputed
+        rows = kernel_cache.add(traces)
+        params = kernel_cache.params(**kernel)
+        gram = kernel_cache.gram(rows, **kernel)
+        logging.debug("fitting model to precomputed kernel for %d traces",
+                      len(rows))
+        scorer = fit_precomputed(gram,
+                                 lambda i: kernel_cache.features(rows[i]),
+                                 params,
+                                 nu=nu)
+        reservoir = None
+        if reservoir_size:
+            reservoir = Model._sample(kernel_cache.features(rows), reservoir_size)  # noqa: pycodestyle
+        model = Model(scorer, kernel_cache.vocabulary, kernel_cache.preprocessor,  # noqa: pycodestyle
+                      reservoir=reservoir)
+        logging.debug("built model from precomputed kernel.")
+        return model
+
+    @staticmethod
+    def build_streaming(source,                                 # type: Union[TraceStore, Callable[[], Iterable[Trace]], Iterable[Trace]]  # noqa: pycodestyle
+                        chunk_size=DEFAULT_CHUNK_SIZE,          # type: int
+                        min_variance=0.0,                       # type: float
+                        n_components=None,                      # type: Optional[int]
+                        rows=None,                              # type: Optional[Sequence[int]]  # noqa: pycodestyle
+                        reservoir_size=DEFAULT_RESERVOIR_SIZE,  # type: Optional[int]  # noqa: pycodestyle
+                        **params                                # type: Any
+                        ):                                      # type: (...) -> Model  # noqa: pycodestyle
+        """
+        Constructs a model from a corpus of execution traces that is read
+        one chunk at a time (see start_dbi.streaming.reduce_traces), with
+        any parameters for sklearn.svm.OneClassSVM.
+        """
+        vocabulary, preprocessor, matrix = \
+            reduce_traces(source,
+                          chunk_size=chunk_size,
+                          min_variance=min_variance,
+                          n_components=n_components,
+                          rows=rows)
+        from sklearn import svm as svm_module
+        svm = svm_module.OneClassSVM(**params)
+        svm.fit(matrix)
+        logging.debug("built model from %d streamed traces.", matrix.shape[0])
+        return Model(svm, vocabulary, preprocessor,
+                     reservoir=Model._sample(matrix, reservoir_size))
+
+    @staticmethod
+    def tune(nominal,           # type: Iterable[Trace]
+             holdout,           # type: Iterable[Trace]
+             attack_traces,     # type: Iterable[Trace]
+             grid=None,         # type: Optional[Dict[str, Sequence[Any]]]
+             workers=None,      # type: Optional[int]
+             **kwargs           # type: Any
+             ):                 # type: (...) -> TuningResult
+        """
+        Searches a grid of SVM parameters, in parallel, for the best model.
+        See start_dbi.tuning.tune.
+        """
+        from .tuning import tune
+        return tune(nominal, holdout, attack_traces,
+                    grid=grid, workers=workers, **kwargs)
+
     @staticmethod
     def from_file(filename):
         # type: (str) -> Model
+        """
+        Loads a model from a given file in the compact format (see
+        start_dbi.compact), or from a joblib pickle saved by earlier versions.
+        """
         logging.debug("loading model from file: %s", filename)
         try:
-            svm = svm_module.OneClassSVM()
-            svm = externals.joblib.load(filename)
-            model = Model(svm)
+            if compact.is_compact(filename):
+                scorer, signals, arrays, extra = compact.load(filename)
+                vocabulary = None
+                if signals is not None:
+                    vocabulary = Vocabulary(signals)
+                preprocessor = None
+                if arrays is not None:
+                    preprocessor = Preprocessor(**arrays)
+                prefilter = Prefilter.from_arrays(
+                    {n[len(PREFILTER_PREFIX):]: a for (n, a) in extra.items()
+                     if n.startswith(PREFILTER_PREFIX)})
+                reservoir = Reservoir.from_arrays(
+                    {n[len(RESERVOIR_PREFIX):]: a for (n, a) in extra.items()
+                     if n.startswith(RESERVOIR_PREFIX)})
+                model = Model(scorer, vocabulary, preprocessor, prefilter,
+                              reservoir)
+            else:
+                model = Model._from_joblib_file(filename)
         except Exception:
             logging.exception("an unexpected error occurred whilst loading model from file: %s", filename)
             raise
         logging.debug("loaded model from file: %s", filename)
         return model
 
-    def __init__(self, model):
-        # type: (svm.OneClassSVM) -> None
-        self.__model = model  # type: svm.OneClassSVM
+    @staticmethod
+    def _from_joblib_file(filename):
+        # type: (str) -> Model
+        from sklearn import externals
+        contents = externals.joblib.load(filename)
+        # models that were saved prior to the introduction of vocabularies
+        # consist solely of the SVM
+        if not isinstance(contents, dict):
+            return Model(contents)
+        vocabulary = Vocabulary(contents['vocabulary'])
+        preprocessor = None
+        if contents.get('preprocessor'):
+            preprocessor = Preprocessor(**contents['preprocessor'])
+        return Model(contents['svm'], vocabulary, preprocessor)
+
+    def __init__(self, model, vocabulary=None, preprocessor=None, prefilter=None, reservoir=None):  # noqa: pycodestyle
+        # type: (Union[svm.OneClassSVM, compact.SupportVectorScorer], Optional[Vocabulary], Optional[Preprocessor], Optional[Prefilter], Optional[Reservoir]) -> None
+        self.__model = model  # type: Union[svm.OneClassSVM, compact.SupportVectorScorer]
+        self.__vocabulary = vocabulary  # type: Optional[Vocabulary]
+        self.__preprocessor = preprocessor  # type: Optional[Preprocessor]
+        self.__prefilter = prefilter  # type: Optional[Prefilter]
+        self.__reservoir = reservoir  # type: Optional[Reservoir]
+        self.__cascade_counts = {'prefilter_nominal': 0,
+                                 'prefilter_anomalous': 0,
+                                 'svm': 0}
+
+    @property
+    def vocabulary(self):
+        # type: () -> Optional[Vocabulary]
+        """
+        The vocabulary of signals used by this model, or None if this model
+        predates the introduction of vocabularies and instead relies on the
+        position of each signal within a trace.
+        """
+        return self.__vocabulary
+
+    @property
+    def preprocessor(self):
+        # type: () -> Optional[Preprocessor]
+        """
+        The preprocessing stage that is applied to traces before they are
+        passed to the SVM, if any.
+        """
+        return self.__preprocessor
+
+    @property
+    def prefilter(self):
+        # type: () -> Optional[Prefilter]
+        """
+        The prefilter that is used as the first stage of a cascade when
+        traces are checked against this model, if any.
+        """
+        return self.__prefilter
+
+    @property
+    def cascade_stats(self):
+        # type: () -> Dict[str, int]
+        """
+        The number of traces checked against this model that were resolved
+        by each stage of its cascade: deemed nominal by the prefilter, deemed
+        anomalous by the prefilter, or scored by the SVM.
+        """
+        return dict(self.__cascade_counts)
+
+    def fit_prefilter(self, traces, nominal_z=None):
+        # type: (Iterable[Trace], Optional[float]) -> None
+        """
+        Fits a prefilter for this model to a set of nominal traces, replacing
+        any existing prefilter.
+        """
+        if self.__vocabulary is None:
+            raise ValueError("a prefilter requires a model with a vocabulary")  # noqa: pycodestyle
+        matrix = self.__vocabulary.transform(traces)
+        self.__prefilter = Prefilter.fit(matrix, self.__model,
+                                         self.__preprocessor,
+                                         nominal_z=nominal_z)
+
+    def __cascade(self, traces):
+        # type: (Sequence[Trace]) -> Tuple[numpy.ndarray, numpy.ndarray, Any]
+        """
+        Applies the prefilter of this model to a given sequence of traces.
+
+        Returns:
+            the verdict of the prefilter for each trace, and the indices and
+            features of the ambiguous traces, which the SVM must score.
+        """
+        matrix = self.__vocabulary.transform(traces)
+        stages = self.__prefilter.classify(matrix)
+        ambiguous = numpy.flatnonzero(stages == AMBIGUOUS)
+        features = matrix[ambiguous]
+        if self.__preprocessor is not None:
+            features = self.__preprocessor.transform(features)
+        counts = self.__cascade_counts
+        counts['prefilter_nominal'] += int((stages == NOMINAL).sum())
+        counts['prefilter_anomalous'] += int((stages == ANOMALOUS).sum())
+        counts['svm'] += len(ambiguous)
+        return stages, ambiguous, features
+
+    def _features(self, traces):
+        # type: (Sequence[Trace]) -> Any
+        """
+        Returns the feature matrix for a given sequence of traces.
+        """
+        if self.__vocabulary is None:
+            return numpy.array([t.values for t in traces])
+        matrix = self.__vocabulary.transform(traces)
+        if self.__preprocessor is not None:
+            matrix = self.__preprocessor.transform(matrix)
+        return matrix
+
+    def update(self, traces, filename=None):
+        # type: (Iterable[Trace], Optional[str]) -> None
+        """
+        Folds a set of new nominal execution traces into this model by adding
+        them to its reservoir (see Model.build) and refitting the SVM on it,
+        and optionally saves the updated model to a given file.
+        """
+        logging.debug("updating model with provided traces.")
+        if self.__vocabulary is None:
+            additions = numpy.array([t.values for t in traces])
+        elif self.__preprocessor is not None:
+            additions = self._features(traces)
+        else:
+            # signals that are new to the vocabulary are added to it
+            additions = self.__vocabulary.fit_transform(traces)
+
+        if self.__reservoir is not None:
+            if self.__preprocessor is None and self.__vocabulary is not None:
+                self.__reservoir.resize(len(self.__vocabulary))
+            self.__reservoir.add(additions)
+            matrix = self.__reservoir.matrix
+            logging.debug("refitting model on a reservoir of %d of %d traces",
+                          matrix.shape[0], self.__reservoir.num_seen)
+        else:
+            logger.warning("refitting model without a reservoir: the boundary of the model tightens with each update")  # noqa: pycodestyle
+            support = self.__model.support_vectors_
+            if self.__vocabulary is not None and self.__preprocessor is None:
+                support = sparse.csr_matrix(support)
+                support.resize((support.shape[0], len(self.__vocabulary)))
+            if sparse.issparse(support) or sparse.issparse(additions):
+                matrix = sparse.vstack([support, additions], format='csr')
+            else:
+                matrix = numpy.vstack([support, additions])
+            logging.debug("refitting model on %d support vectors and %d new traces",  # noqa: pycodestyle
+                          support.shape[0], additions.shape[0])
+        if isinstance(self.__model, compact.SupportVectorScorer):
+            svm = self.__model.estimator()
+        else:
+            # the gamma that was resolved when the SVM was fit (e.g., from
+            # 'scale') is kept, as it is when the model is saved
+            from sklearn.base import clone
+            svm = clone(self.__model)
+            gamma = getattr(self.__model, '_gamma', self.__model.gamma)
+            svm.set_params(gamma=float(gamma))
+        svm.fit(matrix)
+        self.__model = svm
+        if self.__preprocessor is None:
+            self.__prefilter = None
+        elif self.__prefilter is not None:
+            self.__prefilter = self.__prefilter.refit(svm, self.__preprocessor)
+        logging.debug("updated model with provided traces.")
+
+        if filename:
+            self.to_file(filename)
 
     def to_file(self, filename):
         # type: (str) -> None
+        """
+        Saves this model to a given file in the compact format.
+        """
         logging.debug("saving model to file: %s", filename)
         try:
-            externals.joblib.dump(self.__model, filename)
+            scorer = self.__model
+            if not isinstance(scorer, compact.SupportVectorScorer):
+                scorer = compact.SupportVectorScorer.from_svm(scorer)
+            signals = None
+            if self.__vocabulary is not None:
+                signals = self.__vocabulary.signals
+            arrays = None
+            if self.__preprocessor is not None:
+                arrays = {'keep': self.__preprocessor.keep,
+                          'scale': self.__preprocessor.scale,
+                          'components': self.__preprocessor.components}
+            extra = {}
+            if self.__prefilter is not None:
+                extra.update((PREFILTER_PREFIX + n, a)
+                             for (n, a) in self.__prefilter.arrays.items())
+            if self.__reservoir is not None:
+                extra.update((RESERVOIR_PREFIX + n, a)
+                             for (n, a) in self.__reservoir.arrays.items())
+            compact.save(filename, scorer, signals, arrays, extra)
         except Exception:
             logging.exception("an unexpected error occurred whilst saving model to file: %s", filename)
             raise
@@ -68,36 +412,414 @@ class Model(object):
             False.
         """
         logging.debug("determining whether execution trace belongs to a compromised binary")  # noqa: pycodestyle
-        arr = numpy.array(trace.values).reshape(1, -1)
+        if self.__prefilter is not None:
+            stages, ambiguous, arr = self.__cascade([trace])
+            if stages[0] == ANOMALOUS:
+                logging.debug("execution trace deemed to belong to a compromised binary by prefilter")  # noqa: pycodestyle
+                return [True, numpy.array([-1])]
+            if stages[0] == NOMINAL:
+                logging.debug("execution trace deemed nominal by prefilter")
+                return False
+        else:
+            arr = self._features([trace])
 
         dist = self.__model.predict(arr)
-        logging.debug("type(self.__model.predict(arr): %s" %
-                      type(self.__model.predict(arr)))
+        logging.debug("type(self.__model.predict(arr): %s" % type(dist))
 
-        if self.__model.predict(arr) == -1:
+        if dist == -1:
             logging.debug("execution trace believed to belong to a compromised binary")  # noqa: pycodestyle
             return [True, dist]
 
         logging.debug("determined that execution trace does not belong to a compromised binary")  # noqa: pycodestyle
         return False
 
+    def check_async(self, trace, executor=None):
+        # type: (Trace, Optional[concurrent.futures.Executor]) -> Awaitable[[bool, float]]  # noqa: pycodestyle
+        """
+        Returns a future that checks a given trace within a given executor,
+        or the default executor of the event loop, so that scoring does not
+        block the event loop.
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(executor, self.check, trace)
+
+    def check_many(self, traces, chunk_size=None):
+        # type: (Iterable[Trace], Optional[int]) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """
+        Determines whether each of a given sequence of execution traces is
+        deemed to have been produced by a compromised binary, scoring them
+        together, or in chunks of at most chunk_size traces.
+
+        Returns:
+            a tuple of two arrays, holding the verdict and the score of each
+            trace. Negative scores indicate outliers.
+        """
+        logging.debug("determining whether execution traces belong to compromised binaries")  # noqa: pycodestyle
+        if chunk_size is None:
+            chunks = [list(traces)]
+        else:
+            chunks = _chunked(traces, chunk_size)
+
+        verdicts = []  # type: List[numpy.ndarray]
+        scores = []  # type: List[numpy.ndarray]
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if self.__prefilter is None:
+                arr = self._features(chunk)
+                verdicts.append(self.__model.predict(arr) == -1)
+                scores.append(numpy.ravel(self.__model.decision_function(arr)))  # noqa: pycodestyle
+                continue
+            stages, ambiguous, arr = self.__cascade(chunk)
+            chunk_verdicts = stages == ANOMALOUS
+            chunk_scores = numpy.where(chunk_verdicts, -numpy.inf, numpy.inf)
+            if len(ambiguous) > 0:
+                chunk_verdicts[ambiguous] = self.__model.predict(arr) == -1
+                chunk_scores[ambiguous] = numpy.ravel(self.__model.decision_function(arr))  # noqa: pycodestyle
+            verdicts.append(chunk_verdicts)
+            scores.append(chunk_scores)
+
+        if not verdicts:
+            return numpy.zeros(0, dtype=bool), numpy.zeros(0)
+        verdicts = numpy.concatenate(verdicts)
+        scores = numpy.concatenate(scores)
+        logging.debug("determined that %d of %d execution traces belong to compromised binaries",  # noqa: pycodestyle
+                      int(verdicts.sum()), len(verdicts))
+        return verdicts, scores
+
+
+def _chunked(items, size):
+    # type: (Iterable[Any], int) -> Iterator[List[Any]]
+    """
+    Splits a given iterable into a sequence of lists of a given maximum size.
+    """
+    if size < 1:
+        raise ValueError("chunk size must be positive")
+    chunk = []  # type: List[Any]
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 class Svm(Model):
     def __init__(self, model):
         Model.__init__(self, model)
 
 class LOF(object):
-
-    def build(self, traces, neighbors=20):
+    """
+    Detects anomalous execution traces using their local outlier factor
+    (LOF) with respect to a set of nominal traces, whose neighbors are found
+    once via an index (see start_dbi.neighbors).
+    """
+    @staticmethod
+    def build(traces,                # type: Iterable[Trace]
+              neighbors=20,          # type: int
+              algorithm='auto',      # type: str
+              min_variance=0.0,      # type: float
+              n_components=None,     # type: Optional[int]
+              contamination='auto',  # type: Union[str, float]
+              dimensions=32,         # type: int
+              candidates=4,          # type: int
+              seed=0,                # type: int
+              eps=1.0                # type: float
+              ):                     # type: (...) -> LOF
         """
-        Constructs a LOF model from a set of execution traces.
-        This model trains and predicts on a single set of data,
-        that contains both nominal data and outliers.
+        Constructs a LOF model from a set of nominal execution traces.
+
+        Parameters:
+            traces: the execution traces.
+            neighbors: the number of neighbors used to compute the LOF.
+            algorithm: the index used to find neighbors (see
+                NeighborIndex.create), or 'auto'.
+            min_variance: see Model.build.
+            n_components: see Model.build.
+            contamination: the expected fraction of outliers, or 'auto'.
+            dimensions, candidates, seed, eps: see RandomProjectionIndex.
         """
         logging.debug("building an LOF model from a set of execution traces")
-        matrix = numpy.array([t.values for t in traces])
-        lof = LocalOutlierFactor(n_neighbors=neighbors)
-        labels = lof.fit_predict(matrix)
-        self.__model = lof
-        return labels
-    def get_model(self):
-        return self.__model
+        vocabulary = Vocabulary()
+        matrix = vocabulary.fit_transform(traces)
+        preprocessor = Preprocessor.fit(matrix,
+                                        min_variance=min_variance,
+                                        n_components=n_components)
+        matrix = preprocessor.transform(matrix)
+        return LOF._fit(matrix, vocabulary, preprocessor,
+                        neighbors=neighbors,
+                        algorithm=algorithm,
+                        contamination=contamination,
+                        dimensions=dimensions,
+                        candidates=candidates,
+                        seed=seed,
+                        eps=eps)
+
+    @staticmethod
+    def build_streaming(source,                             # type: Union[TraceStore, Callable[[], Iterable[Trace]], Iterable[Trace]]  # noqa: pycodestyle
+                        chunk_size=DEFAULT_CHUNK_SIZE,      # type: int
+                        min_variance=0.0,                   # type: float
+                        n_components=None,                  # type: Optional[int]
+                        rows=None,                          # type: Optional[Sequence[int]]  # noqa: pycodestyle
+                        **kwargs                            # type: Any
+                        ):                                  # type: (...) -> LOF
+        """
+        Constructs a LOF model from a corpus of nominal execution traces that
+        is read one chunk at a time, as for Model.build_streaming, with any
+        further parameters for LOF.build.
+        """
+        vocabulary, preprocessor, matrix = \
+            reduce_traces(source,
+                          chunk_size=chunk_size,
+                          min_variance=min_variance,
+                          n_components=n_components,
+                          rows=rows)
+        return LOF._fit(matrix, vocabulary, preprocessor, **kwargs)
+
+    @staticmethod
+    def _fit(matrix,                # type: Any
+             vocabulary,            # type: Vocabulary
+             preprocessor,          # type: Preprocessor
+             neighbors=20,          # type: int
+             algorithm='auto',      # type: str
+             contamination='auto',  # type: Union[str, float]
+             dimensions=32,         # type: int
+             candidates=4,          # type: int
+             seed=0,                # type: int
+             eps=1.0                # type: float
+             ):                     # type: (...) -> LOF
+        """
+        Constructs a LOF model from the preprocessed feature matrix of a set
+        of nominal traces.
+        """
+        if matrix.shape[0] < 2:
+            raise ValueError("at least two traces are required to build a LOF model")  # noqa: pycodestyle
+        if algorithm == 'auto':
+            if matrix.shape[0] >= LOF_APPROXIMATE_THRESHOLD:
+                algorithm = 'approximate'
+            else:
+                algorithm = 'brute'
+        if algorithm in ('ball_tree', 'kd_tree'):
+            matrix = compact._as_dense(matrix)
+        neighbors = min(neighbors, matrix.shape[0] - 1)
+
+        parameters = {}  # type: Dict[str, Any]
+        if algorithm == 'approximate':
+            parameters = {'dimensions': dimensions,
+                          'candidates': candidates,
+                          'seed': seed,
+                          'eps': eps}
+        index = NeighborIndex.create(matrix, algorithm, **parameters)
+        distances, indices = index.query(matrix, neighbors, exclude_self=True)
+        k_distance = distances[:, -1]
+        lrd = _local_reachability_density(distances, indices, k_distance)
+        scores = -(lrd[indices].mean(axis=1) / lrd)
+
+        if contamination == 'auto':
+            offset = -1.5
+        else:
+            offset = float(numpy.percentile(scores, 100.0 * contamination))
+
+        lof = LOF(matrix, k_distance, lrd, offset, neighbors, algorithm,
+                  vocabulary, preprocessor, index)
+        lof.__labels = numpy.where(scores < offset, -1, 1)
+        logging.debug("built an LOF model from %d execution traces using %s neighbor search",  # noqa: pycodestyle
+                      matrix.shape[0], algorithm)
+        return lof
+
+    @staticmethod
+    def from_file(filename):
+        # type: (str) -> LOF
+        """
+        Loads a LOF model from a given file in the compact format.
+        """
+        logging.debug("loading LOF model from file: %s", filename)
+        description, arrays = compact.read(filename)
+        if description.get('kind') != 'lof':
+            raise ValueError("compact model file does not hold a LOF model: {}".format(filename))  # noqa: pycodestyle
+        if 'train' in arrays:
+            matrix = arrays['train']
+        else:
+            matrix = sparse.csr_matrix((arrays['train.data'],
+                                        arrays['train.indices'],
+                                        arrays['train.indptr']),
+                                       shape=tuple(description['train_shape']))  # noqa: pycodestyle
+        signals, preprocessor, _ = compact.unpack_features(description, arrays)
+        vocabulary = Vocabulary(signals)
+        preprocessor = Preprocessor(**preprocessor)
+        index = None
+        if description['algorithm'] == 'approximate':
+            # files saved before the index held a tree searched it exactly
+            index = RandomProjectionIndex(matrix,
+                                          candidates=description['candidates'],  # noqa: pycodestyle
+                                          projection=arrays['projection'],
+                                          eps=description.get('eps', 0.0))
+        return LOF(matrix,
+                   arrays['k_distance'],
+                   arrays['lrd'],
+                   description['offset'],
+                   description['neighbors'],
+                   description['algorithm'],
+                   vocabulary,
+                   preprocessor,
+                   index)
+
+    def __init__(self,
+                 matrix,        # type: Any
+                 k_distance,    # type: numpy.ndarray
+                 lrd,           # type: numpy.ndarray
+                 offset,        # type: float
+                 neighbors,     # type: int
+                 algorithm,     # type: str
+                 vocabulary,    # type: Vocabulary
+                 preprocessor,  # type: Preprocessor
+                 index=None     # type: Optional[NeighborIndex]
+                 ):             # type: (...) -> None
+        self.__matrix = matrix
+        self.__k_distance = k_distance
+        self.__lrd = lrd
+        self.__offset = offset
+        self.__neighbors = neighbors
+        self.__algorithm = algorithm
+        self.__vocabulary = vocabulary
+        self.__preprocessor = preprocessor
+        self.__index = index
+        self.__labels = None  # type: Optional[numpy.ndarray]
+
+    @property
+    def labels(self):
+        # type: () -> Optional[numpy.ndarray]
+        """
+        The labels of the traces from which this model was built, where -1
+        indicates an outlier and 1 indicates an inlier, or None if the model
+        was loaded from a file.
+        """
+        return self.__labels
+
+    @property
+    def algorithm(self):
+        # type: () -> str
+        return self.__algorithm
+
+    @property
+    def vocabulary(self):
+        # type: () -> Vocabulary
+        return self.__vocabulary
+
+    @property
+    def preprocessor(self):
+        # type: () -> Preprocessor
+        return self.__preprocessor
+
+    def _features(self, traces):
+        # type: (Sequence[Trace]) -> Any
+        matrix = self.__preprocessor.transform(self.__vocabulary.transform(traces))  # noqa: pycodestyle
+        if self.__algorithm in ('ball_tree', 'kd_tree'):
+            matrix = compact._as_dense(matrix)
+        return matrix
+
+    def decision_function(self, matrix):
+        # type: (Any) -> numpy.ndarray
+        """
+        Computes the negative LOF of each row of a given feature matrix,
+        shifted by the threshold of this model, such that negative scores
+        indicate outliers.
+        """
+        if self.__index is None:
+            self.__index = NeighborIndex.create(self.__matrix, self.__algorithm)  # noqa: pycodestyle
+        distances, indices = self.__index.query(matrix, self.__neighbors)
+        lrd = _local_reachability_density(distances, indices,
+                                          self.__k_distance)
+        return -(self.__lrd[indices].mean(axis=1) / lrd) - self.__offset
+
+    def check(self, trace):
+        # type: (Trace) -> [bool, float]
+        """
+        Determines whether a given execution trace is deemed to have been
+        produced by a compromised binary.
+
+        Returns:
+            [True, score] if the trace is believed to belong to a compromised
+            binary, else False.
+        """
+        score = self.decision_function(self._features([trace]))[0]
+        if score < 0:
+            logging.debug("execution trace believed to belong to a compromised binary")  # noqa: pycodestyle
+            return [True, score]
+        return False
+
+    def check_async(self, trace, executor=None):
+        # type: (Trace, Optional[concurrent.futures.Executor]) -> Awaitable[[bool, float]]  # noqa: pycodestyle
+        """
+        Returns a future that checks a given trace within a given executor,
+        or the default executor of the event loop, so that scoring does not
+        block the event loop.
+        """
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(executor, self.check, trace)
+
+    def check_many(self, traces, chunk_size=None):
+        # type: (Iterable[Trace], Optional[int]) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """
+        Determines whether each of a given sequence of execution traces is
+        deemed to have been produced by a compromised binary, in the same
+        manner as Model.check_many.
+        """
+        if chunk_size is None:
+            chunks = [list(traces)]
+        else:
+            chunks = _chunked(traces, chunk_size)
+        scores = [self.decision_function(self._features(chunk))
+                  for chunk in chunks if chunk]
+        if not scores:
+            return numpy.zeros(0, dtype=bool), numpy.zeros(0)
+        scores = numpy.concatenate(scores)
+        return scores < 0, scores
+
+    def to_file(self, filename):
+        # type: (str) -> None
+        """
+        Saves this model to a given file in the compact format.
+        """
+        logging.debug("saving LOF model to file: %s", filename)
+        arrays = {'k_distance': numpy.asarray(self.__k_distance),
+                  'lrd': numpy.asarray(self.__lrd)}
+        matrix = self.__matrix
+        if sparse.issparse(matrix):
+            matrix = sparse.csr_matrix(matrix)
+            arrays['train.data'] = matrix.data
+            arrays['train.indices'] = matrix.indices
+            arrays['train.indptr'] = matrix.indptr
+        else:
+            arrays['train'] = numpy.asarray(matrix)
+        description = {'kind': 'lof',
+                       'neighbors': self.__neighbors,
+                       'algorithm': self.__algorithm,
+                       'offset': self.__offset,
+                       'train_shape': list(matrix.shape)}
+        if isinstance(self.__index, RandomProjectionIndex):
+            arrays['projection'] = self.__index.projection
+            description['candidates'] = self.__index.candidates
+            description['eps'] = self.__index.eps
+        preprocessor = {'keep': self.__preprocessor.keep,
+                        'scale': self.__preprocessor.scale,
+                        'components': self.__preprocessor.components}
+        compact.pack_features(description, arrays,
+                              self.__vocabulary.signals, preprocessor)
+        compact.write(filename, description, arrays)
+        logging.debug("saved LOF model to file: %s", filename)
+
+
+def _local_reachability_density(distances, indices, k_distance):
+    # type: (numpy.ndarray, numpy.ndarray, numpy.ndarray) -> numpy.ndarray
+    """
+    Computes the local reachability density of a set of points, given the
+    distances to and indices of their neighbors, and the k-distance of each
+    indexed point.
+    """
+    reach = numpy.maximum(distances, k_distance[indices])
+    # a small constant avoids division by zero when a point has more
+    # duplicates than neighbors
+    return 1.0 / (reach.mean(axis=1) + 1e-10)
@@ -0,0 +1,287 @@
+__all__ = ['Snapshot', 'Monitor', 'EarlyAbortMonitor', 'build_partial_models']
+
+from typing import Optional
+import collections
+import logging
+import os
+import threading
+import time
+
+from .trace import Trace
+from .model import Model
+from .process import find_processes, terminate
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# a partial trace, taken a given number of seconds into a mission
+Snapshot = collections.namedtuple('Snapshot', ['elapsed', 'trace'])
+
+
+def _read_partial_trace(filename):
+    # type: (str) -> Optional[Trace]
+    """
+    Reads a (possibly incomplete) text trace file that is in the process of
+    being written. Any trailing partial line is ignored.
+    """
+    with open(filename, 'r') as f:
+        contents = f.read()
+    contents = contents[:contents.rfind('\n') + 1]
+    if not contents:
+        return None
+    signal_to_value = collections.OrderedDict()
+    for line in contents.splitlines():
+        name, val_as_string = line.split()
+        signal_to_value[name] = float(val_as_string)
+    return Trace(signal_to_value)
+
+
+class Monitor(object):
+    """
+    Takes a snapshot of the partial trace each time that the signals file
+    changes during a mission (see Trace.generate). Subclasses may override
+    on_snapshot to abort the mission.
+    """
+    def __init__(self, interval=5.0, record=True):
+        # type: (float, bool) -> None
+        """
+        Parameters:
+            interval: the number of seconds between checks of the file.
+            record: if True, every snapshot is kept, rather than the latest.
+        """
+        self.__interval = interval
+        self.__record = record
+        self.__snapshots = []  # type: List[Snapshot]
+        self.__latest = None  # type: Optional[Snapshot]
+        self.__aborted = False
+        self.__fn_signals = None  # type: Optional[str]
+        self.__stopped = threading.Event()
+        self.__thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def snapshots(self):
+        # type: () -> List[Snapshot]
+        """
+        The snapshots that have been recorded by this monitor.
+        """
+        return list(self.__snapshots)
+
+    @property
+    def latest(self):
+        # type: () -> Optional[Snapshot]
+        """
+        The most recent snapshot taken by this monitor, if any.
+        """
+        return self.__latest
+
+    @property
+    def aborted(self):
+        # type: () -> bool
+        """
+        Indicates whether this monitor aborted the mission.
+        """
+        return self.__aborted
+
+    def start(self, fn_signals):
+        # type: (str) -> None
+        """
+        Begins watching a given signals file.
+        """
+        logger.debug("monitoring signals file: %s", fn_signals)
+        self.__fn_signals = fn_signals
+        self.__snapshots = []
+        self.__latest = None
+        self.__aborted = False
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        # type: () -> None
+        """
+        Stops watching the signals file.
+        """
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        logger.debug("stopped monitoring signals file: %s", self.__fn_signals)
+
+    def abort(self):
+        # type: () -> None
+        """
+        Aborts the mission by terminating the instrumented SITL.
+        """
+        logger.debug("aborting mission")
+        self.__aborted = True
+        terminate(find_processes(self.__fn_signals))
+
+    def on_snapshot(self, snapshot):
+        # type: (Snapshot) -> bool
+        """
+        Called each time that a snapshot is taken.
+
+        Returns:
+            True if the mission should be aborted, else False.
+        """
+        return False
+
+    def __run(self):
+        # type: () -> None
+        time_start = time.time()
+        last_stat = None
+        while not self.__stopped.wait(self.__interval):
+            try:
+                stat = os.stat(self.__fn_signals)
+            except OSError:
+                continue
+            if (stat.st_mtime, stat.st_size) == last_stat:
+                continue
+            last_stat = (stat.st_mtime, stat.st_size)
+
+            try:
+                trace = _read_partial_trace(self.__fn_signals)
+            except Exception:
+                logger.debug("failed to read snapshot of signals file: %s",
+                             self.__fn_signals)
+                continue
+            if trace is None:
+                continue
+
+            snapshot = Snapshot(time.time() - time_start, trace)
+            logger.debug("took snapshot after %.1f seconds", snapshot.elapsed)
+            self.__latest = snapshot
+            if self.__record:
+                self.__snapshots.append(snapshot)
+            if self.on_snapshot(snapshot):
+                self.abort()
+                return
+
+
+class EarlyAbortMonitor(Monitor):
+    """
+    Aborts a mission once the scores of a number of consecutive snapshots
+    fall beyond a threshold. Snapshots should be scored by models of partial
+    traces (see build_partial_models).
+    """
+    def __init__(self,
+                 models,                    # type: Union[Model, Sequence[Tuple[float, Model]]]  # noqa: pycodestyle
+                 threshold=0.0,             # type: float
+                 threshold_nominal=None,    # type: Optional[float]
+                 patience=2,                # type: int
+                 interval=5.0,              # type: float
+                 record=False               # type: bool
+                 ):                         # type: (...) -> None
+        """
+        Parameters:
+            models: a single model, or a sequence of (elapsed, model) pairs.
+            threshold: the mission is deemed compromised below -threshold.
+            threshold_nominal: if given, the mission is deemed nominal above
+                this threshold.
+            patience: the number of consecutive snapshots that must exceed a
+                threshold.
+        """
+        Monitor.__init__(self, interval=interval, record=record)
+        if isinstance(models, Model):
+            models = [(0.0, models)]
+        self.__models = sorted(models, key=lambda m: m[0])
+        self.__threshold = threshold
+        self.__threshold_nominal = threshold_nominal
+        self.__patience = patience
+        self.__verdict = None  # type: Optional[bool]
+        self.__scores = []  # type: List[Tuple[float, float]]
+        self.__streak_compromised = 0
+        self.__streak_nominal = 0
+
+    @property
+    def verdict(self):
+        # type: () -> Optional[bool]
+        """
+        True if the mission was deemed to be compromised, False if it was
+        deemed to be nominal, or None if no confident verdict was reached.
+        """
+        return self.__verdict
+
+    @property
+    def scores(self):
+        # type: () -> List[Tuple[float, float]]
+        """
+        The (elapsed, score) pair for each snapshot that was scored.
+        """
+        return list(self.__scores)
+
+    def start(self, fn_signals):
+        # type: (str) -> None
+        self.__verdict = None
+        self.__scores = []
+        self.__streak_compromised = 0
+        self.__streak_nominal = 0
+        Monitor.start(self, fn_signals)
+
+    def __model_for(self, elapsed):
+        # type: (float) -> Optional[Model]
+        model = None
+        for (checkpoint, m) in self.__models:
+            if checkpoint > elapsed:
+                break
+            model = m
+        return model
+
+    def on_snapshot(self, snapshot):
+        # type: (Snapshot) -> bool
+        model = self.__model_for(snapshot.elapsed)
+        if model is None:
+            return False
+        _, scores = model.check_many([snapshot.trace])
+        score = float(scores[0])
+        self.__scores.append((snapshot.elapsed, score))
+        logger.debug("scored snapshot after %.1f seconds: %f",
+                     snapshot.elapsed, score)
+
+        if score < -self.__threshold:
+            self.__streak_compromised += 1
+        else:
+            self.__streak_compromised = 0
+        nominal = self.__threshold_nominal is not None \
+            and score > self.__threshold_nominal
+        self.__streak_nominal = self.__streak_nominal + 1 if nominal else 0
+
+        if self.__streak_compromised >= self.__patience:
+            logger.debug("mission deemed to be compromised after %.1f seconds",  # noqa: pycodestyle
+                         snapshot.elapsed)
+            self.__verdict = True
+            return True
+        if self.__streak_nominal >= self.__patience:
+            logger.debug("mission deemed to be nominal after %.1f seconds",
+                         snapshot.elapsed)
+            self.__verdict = False
+            return True
+        return False
+
+
+def build_partial_models(runs, checkpoints):
+    # type: (Sequence[Sequence[Snapshot]], Sequence[float]) -> List[Tuple[float, Model]]  # noqa: pycodestyle
+    """
+    Builds a model for each checkpoint (in seconds) from the latest snapshot
+    of each nominal run (e.g., recorded by Monitor(record=True)) taken by
+    that checkpoint, for use with EarlyAbortMonitor.
+
+    Returns:
+        a list of (checkpoint, model) pairs.
+    """
+    models = []
+    for checkpoint in sorted(checkpoints):
+        traces = []
+        for snapshots in runs:
+            taken = [s for s in snapshots if s.elapsed <= checkpoint]
+            if taken:
+                traces.append(taken[-1].trace)
+        if not traces:
+            logger.debug("no snapshots available for checkpoint: %.1f",
+                         checkpoint)
+            continue
+        logger.debug("building partial model for checkpoint %.1f from %d snapshots",  # noqa: pycodestyle
+                     checkpoint, len(traces))
+        models.append((checkpoint, Model.build(traces)))
+    return models
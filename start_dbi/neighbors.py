@@ -0,0 +1,244 @@
+__all__ = ['NeighborIndex', 'BruteForceIndex', 'TreeIndex',
+           'RandomProjectionIndex', 'ALGORITHMS']
+
+from typing import Optional
+import logging
+
+import numpy
+from scipy import sparse
+
+from .compact import _as_dense, _dot, _squared_norms
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+ALGORITHMS = ('brute', 'ball_tree', 'kd_tree', 'approximate')
+
+# the maximum number of query rows whose distances to the indexed rows are
+# computed at once, which bounds the memory used by brute-force searches
+QUERY_BLOCK_SIZE = 1024
+
+# the maximum number of (query, candidate) pairs whose exact distances are
+# computed at once by approximate searches
+RERANK_BLOCK_SIZE = 65536
+
+
+def _squared_distances(queries, rows, rows_squared_norms):
+    # type: (Any, Any, numpy.ndarray) -> numpy.ndarray
+    distances = _squared_norms(queries)[:, None] + rows_squared_norms[None, :] \
+        - 2.0 * _dot(queries, rows)
+    numpy.maximum(distances, 0.0, out=distances)
+    return distances
+
+
+def _smallest(distances, k, exclude=None):
+    # type: (numpy.ndarray, int, Optional[numpy.ndarray]) -> Tuple[numpy.ndarray, numpy.ndarray]  # noqa: pycodestyle
+    """
+    Returns the k smallest squared distances within each row of a given
+    matrix, in ascending order, together with their columns. If exclude is
+    given, the column given by exclude for each row is ignored.
+    """
+    if exclude is not None:
+        distances[numpy.arange(len(exclude)), exclude] = numpy.inf
+    k = min(k, distances.shape[1])
+    columns = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+    selected = numpy.take_along_axis(distances, columns, axis=1)
+    order = numpy.argsort(selected, axis=1)
+    return (numpy.take_along_axis(selected, order, axis=1),
+            numpy.take_along_axis(columns, order, axis=1))
+
+
+def _drop_self(distances, indices, k, own=None):
+    # type: (numpy.ndarray, numpy.ndarray, int, Optional[numpy.ndarray]) -> Tuple[numpy.ndarray, numpy.ndarray]  # noqa: pycodestyle
+    """
+    Removes each query row from its own k + 1 nearest neighbors, where the
+    query rows are the indexed rows given by own (by default, every row).
+    """
+    if own is None:
+        own = numpy.arange(len(indices))
+    keep = indices != own[:, None]
+    # rows whose own index did not appear (i.e., because of duplicates) drop
+    # their furthest neighbor
+    keep[keep.all(axis=1), -1] = False
+    return (distances[keep].reshape(len(indices), k),
+            indices[keep].reshape(len(indices), k))
+
+
+class NeighborIndex(object):
+    """
+    Finds the nearest neighbors, by Euclidean distance, of a set of query
+    rows among a fixed set of indexed rows.
+    """
+    @staticmethod
+    def create(matrix, algorithm='brute', **kwargs):
+        # type: (Any, str, **Any) -> NeighborIndex
+        """
+        Constructs an index for a given matrix, where algorithm is 'brute',
+        'ball_tree', 'kd_tree' or 'approximate' (see RandomProjectionIndex).
+        """
+        if algorithm == 'brute':
+            return BruteForceIndex(matrix)
+        if algorithm in ('ball_tree', 'kd_tree'):
+            return TreeIndex(matrix, algorithm)
+        if algorithm == 'approximate':
+            return RandomProjectionIndex(matrix, **kwargs)
+        raise ValueError("unsupported neighbor algorithm: {}".format(algorithm))  # noqa: pycodestyle
+
+    def query(self, matrix, k, exclude_self=False):
+        # type: (Any, int, bool) -> Tuple[numpy.ndarray, numpy.ndarray]
+        """
+        Finds the k nearest indexed rows for each row of a given matrix. If
+        exclude_self is True, the query rows are the indexed rows themselves.
+
+        Returns:
+            a tuple of two arrays that give the (ascending) distances to the
+            neighbors of each row and their indices.
+        """
+        raise NotImplementedError
+
+
+class BruteForceIndex(NeighborIndex):
+    """
+    Finds exact nearest neighbors by computing the distance between every
+    query row and every indexed row, a block of query rows at a time. Sparse
+    and dense matrices are both supported, and sklearn is not required.
+    """
+    def __init__(self, matrix):
+        # type: (Any) -> None
+        self.__matrix = matrix
+        self.__squared_norms = _squared_norms(matrix)
+
+    def query(self, matrix, k, exclude_self=False):
+        # type: (Any, int, bool) -> Tuple[numpy.ndarray, numpy.ndarray]
+        distances = []  # type: List[numpy.ndarray]
+        indices = []  # type: List[numpy.ndarray]
+        for start in range(0, matrix.shape[0], QUERY_BLOCK_SIZE):
+            block = matrix[start:start + QUERY_BLOCK_SIZE]
+            squared = _squared_distances(block, self.__matrix,
+                                         self.__squared_norms)
+            exclude = None
+            if exclude_self:
+                exclude = numpy.arange(start, start + block.shape[0])
+            d, i = _smallest(squared, k, exclude)
+            distances.append(numpy.sqrt(d))
+            indices.append(i)
+        return numpy.vstack(distances), numpy.vstack(indices)
+
+
+class TreeIndex(NeighborIndex):
+    """
+    Finds exact nearest neighbors using a ball tree or k-d tree provided by
+    sklearn, which are only effective for matrices with few columns.
+    """
+    def __init__(self, matrix, algorithm='ball_tree'):
+        # type: (Any, str) -> None
+        from sklearn.neighbors import NearestNeighbors
+        self.__index = NearestNeighbors(algorithm=algorithm)
+        self.__index.fit(_as_dense(matrix))
+
+    def query(self, matrix, k, exclude_self=False):
+        # type: (Any, int, bool) -> Tuple[numpy.ndarray, numpy.ndarray]
+        matrix = _as_dense(matrix)
+        if not exclude_self:
+            return self.__index.kneighbors(matrix, n_neighbors=k)
+        # the query rows are the indexed rows, and so each row is found to be
+        # its own nearest neighbor (unless it has duplicates)
+        distances, indices = self.__index.kneighbors(matrix, n_neighbors=k + 1)  # noqa: pycodestyle
+        return _drop_self(distances, indices, k)
+
+
+class RandomProjectionIndex(NeighborIndex):
+    """
+    Finds approximate nearest neighbors by ranking, by their exact distances,
+    the candidates found by a k-d tree over a random Gaussian projection.
+    """
+    def __init__(self, matrix, dimensions=32, candidates=4, seed=0,
+                 projection=None, eps=1.0):
+        # type: (Any, int, int, int, Optional[numpy.ndarray], float) -> None
+        """
+        Parameters:
+            matrix: the indexed rows.
+            dimensions: the number of random directions.
+            candidates: the number of candidates ranked per neighbor.
+            seed: the seed used to generate the random directions.
+            projection: the random directions, with a column per direction.
+            eps: the relative tolerance of the search of the tree.
+        """
+        from scipy.spatial import cKDTree
+        if projection is None:
+            rng = numpy.random.RandomState(seed)
+            projection = rng.normal(size=(matrix.shape[1], dimensions))
+            projection /= numpy.sqrt(dimensions)
+        self.__matrix = sparse.csr_matrix(matrix) if sparse.issparse(matrix) \
+            else numpy.asarray(matrix)
+        self.__candidates = candidates
+        self.__eps = eps
+        self.__projection = projection
+        self.__tree = cKDTree(self.project(matrix))
+        self.__squared_norms = _squared_norms(matrix)
+
+    @property
+    def projection(self):
+        # type: () -> numpy.ndarray
+        return self.__projection
+
+    @property
+    def candidates(self):
+        # type: () -> int
+        return self.__candidates
+
+    @property
+    def eps(self):
+        # type: () -> float
+        return self.__eps
+
+    def project(self, matrix):
+        # type: (Any) -> numpy.ndarray
+        if sparse.issparse(matrix):
+            return _as_dense(matrix.dot(self.__projection))
+        return numpy.asarray(matrix).dot(self.__projection)
+
+    def __rerank(self, queries, candidates):
+        # type: (Any, numpy.ndarray) -> numpy.ndarray
+        """
+        Computes the exact squared distance between each query row and each
+        of its candidates.
+        """
+        num_candidates = candidates.shape[1]
+        rows = self.__matrix[candidates.ravel()]
+        if sparse.issparse(rows):
+            repeated = sparse.csr_matrix(queries)[numpy.repeat(numpy.arange(queries.shape[0]), num_candidates)]  # noqa: pycodestyle
+            dots = numpy.asarray(rows.multiply(repeated).sum(axis=1))
+        else:
+            rows = rows.reshape(queries.shape[0], num_candidates, -1)
+            dots = numpy.einsum('qd,qcd->qc', _as_dense(queries), rows)
+        distances = _squared_norms(queries)[:, None] \
+            + self.__squared_norms[candidates] \
+            - 2.0 * dots.reshape(candidates.shape)
+        numpy.maximum(distances, 0.0, out=distances)
+        return distances
+
+    def query(self, matrix, k, exclude_self=False):
+        # type: (Any, int, bool) -> Tuple[numpy.ndarray, numpy.ndarray]
+        num_rows = self.__matrix.shape[0] - int(exclude_self)
+        k = min(k, num_rows)
+        num_candidates = min(k * self.__candidates, num_rows)
+        num_searched = num_candidates + int(exclude_self)
+        distances = []  # type: List[numpy.ndarray]
+        indices = []  # type: List[numpy.ndarray]
+        block_size = max(RERANK_BLOCK_SIZE // num_searched, 1)
+        for start in range(0, matrix.shape[0], block_size):
+            block = matrix[start:start + block_size]
+            found, candidates = self.__tree.query(self.project(block),
+                                                  num_searched,
+                                                  eps=self.__eps)
+            found = found.reshape(block.shape[0], num_searched)
+            candidates = candidates.reshape(block.shape[0], num_searched)
+            if exclude_self:
+                own = numpy.arange(start, start + block.shape[0])
+                _, candidates = _drop_self(found, candidates, num_candidates,
+                                           own)
+            d, i = _smallest(self.__rerank(block, candidates), k)
+            distances.append(numpy.sqrt(d))
+            indices.append(numpy.take_along_axis(candidates, i, axis=1))
+        return numpy.vstack(distances), numpy.vstack(indices)
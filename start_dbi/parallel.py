@@ -0,0 +1,171 @@
+__all__ = ['TraceResult', 'PORT_STRIDE', 'is_port', 'isolate_ports',
+           'generate_many']
+
+from typing import Optional
+import collections
+import copy
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import traceback
+
+from .trace import Trace
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the name of the environment variable that holds the index of the worker
+ENV_WORKER_INDEX = 'START_DBI_WORKER'
+
+# the offset between the ports of consecutive workers, which matches the
+# spacing of the ports used by consecutive ArduPilot SITL instances
+PORT_STRIDE = 10
+
+# describes the outcome of a single job: index gives the position of the job
+# within the sequence of jobs, trace holds the generated trace (or None if the
+# job failed), and error holds the formatted traceback for a failed job (or
+# None if the job succeeded).
+TraceResult = collections.namedtuple('TraceResult',
+                                     ['index', 'job', 'trace', 'error'])
+
+# the state of the current worker process
+_worker_index = None  # type: Optional[int]
+_worker_isolate = None  # type: Optional[Callable[[SITL, int], SITL]]
+_worker_shared = False
+
+
+def is_port(name):
+    # type: (str) -> bool
+    """
+    Determines whether an attribute with a given name holds a port.
+    """
+    name = name.lower()
+    return name == 'port' or name.endswith('_port')
+
+
+def _offset_ports(obj, offset):
+    # type: (Any, int) -> Tuple[Any, int]
+    """
+    Returns a copy of a given object whose port attributes (i.e., integer
+    attributes named port or ending in _port) are offset by a given amount,
+    together with the number of attributes that were offset.
+    """
+    if obj is None or not hasattr(obj, '__dict__'):
+        return obj, 0
+    obj = copy.copy(obj)
+    num_ports = 0
+    for (name, value) in list(vars(obj).items()):
+        if is_port(name) and isinstance(value, int) \
+                and not isinstance(value, bool):
+            setattr(obj, name, value + offset)
+            num_ports += 1
+    return obj, num_ports
+
+
+def isolate_ports(job, index, shared=True):
+    # type: (Dict[str, Any], int, bool) -> Dict[str, Any]
+    """
+    Returns a copy of a job whose SITL and attack use ports that are offset by
+    PORT_STRIDE times the index of a given worker. If the job is shared with
+    other workers, its SITL must expose at least one port attribute.
+    """
+    job = dict(job)
+    offset = PORT_STRIDE * index
+    job['sitl'], num_ports = _offset_ports(job['sitl'], offset)
+    if 'attack' in job:
+        job['attack'], _ = _offset_ports(job['attack'], offset)
+    if shared and num_ports == 0:
+        raise ValueError("cannot assign distinct ports to concurrent SITLs: no port attributes were found. Provide an isolate function instead.")  # noqa: pycodestyle
+    return job
+
+
+def _initialize_worker(indices, dir_base, isolate, shared):
+    # type: (multiprocessing.Queue, str, Optional[Callable[[SITL, int], SITL]], bool) -> None  # noqa: pycodestyle
+    """
+    Prepares a worker process by assigning it a unique index and giving it
+    its own temporary directory. The working directory is left unchanged, so
+    that relative paths within jobs refer to the same files in every worker.
+    """
+    global _worker_index, _worker_isolate, _worker_shared
+    _worker_index = indices.get()
+    _worker_isolate = isolate
+    _worker_shared = shared
+
+    dir_worker = os.path.join(dir_base, 'worker-{}'.format(_worker_index))
+    dir_tmp = os.path.join(dir_worker, 'tmp')
+    if not os.path.isdir(dir_tmp):
+        os.makedirs(dir_tmp)
+    os.environ['TMPDIR'] = dir_tmp
+    os.environ[ENV_WORKER_INDEX] = str(_worker_index)
+    tempfile.tempdir = dir_tmp
+    logger.debug("initialized worker %d: %s", _worker_index, dir_worker)
+
+
+def _run_job(indexed_job):
+    # type: (Tuple[int, Dict[str, Any]]) -> TraceResult
+    index, job = indexed_job
+    try:
+        kwargs = dict(job)
+        if _worker_isolate is not None:
+            kwargs['sitl'] = _worker_isolate(kwargs['sitl'], _worker_index)
+        else:
+            kwargs = isolate_ports(kwargs, _worker_index, _worker_shared)
+        trace = Trace.generate(**kwargs)
+        return TraceResult(index, job, trace, None)
+    except Exception:
+        logger.exception("worker %d failed to execute job %d",
+                         _worker_index, index)
+        return TraceResult(index, job, None, traceback.format_exc())
+
+
+def generate_many(jobs,             # type: Iterable[Dict[str, Any]]
+                  workers=None,     # type: Optional[int]
+                  isolate=None,     # type: Optional[Callable[[SITL, int], SITL]]  # noqa: pycodestyle
+                  dir_work=None     # type: Optional[str]
+                  ):                # type: (...) -> Iterator[TraceResult]
+    """
+    Generates an execution trace for each of a given sequence of jobs (i.e.,
+    keyword arguments for Trace.generate) using a pool of worker processes,
+    and yields the results in the order in which the jobs finish. The SITL
+    of each worker is given distinct ports by isolate(sitl, index), or else
+    by isolate_ports.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    jobs = iter(jobs)
+    first = next(jobs, None)
+    if first is None:
+        return
+    jobs = itertools.chain([first], jobs)
+    if isolate is None and workers > 1:
+        isolate_ports(first, 1)
+
+    using_temporary_dir = not dir_work
+    if using_temporary_dir:
+        dir_work = tempfile.mkdtemp(prefix='start_dbi.')
+    logger.debug("generating traces using %d workers: %s", workers, dir_work)
+
+    indices = multiprocessing.Queue()
+    for i in range(workers):
+        indices.put(i)
+    pool = multiprocessing.Pool(workers,
+                                initializer=_initialize_worker,
+                                initargs=(indices, dir_work, isolate,
+                                          workers > 1))
+    try:
+        for result in pool.imap_unordered(_run_job, enumerate(jobs)):
+            logger.debug("finished job %d (%s)", result.index,
+                         "failed" if result.error else "succeeded")
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if using_temporary_dir:
+            shutil.rmtree(dir_work, ignore_errors=True)
+    logger.debug("generated traces using %d workers", workers)
@@ -0,0 +1,327 @@
+"""
+Provides a cheap, vectorized first stage for checking traces against a model,
+which resolves traces that the SVM of the model is guaranteed to accept or
+reject, so that only the remaining traces need to be scored by the SVM.
+"""
+__all__ = ['Prefilter', 'NOMINAL', 'ANOMALOUS', 'AMBIGUOUS']
+
+from typing import Optional
+import logging
+import math
+
+import numpy
+from scipy import sparse
+
+from .compact import SupportVectorScorer
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the verdicts of the prefilter for each trace
+NOMINAL = 1
+ANOMALOUS = -1
+AMBIGUOUS = 0
+
+# scales the median absolute deviation to the standard deviation of a
+# normally distributed signal
+MAD_SCALE = 1.4826
+
+# the number of columns, or support vectors, that are made dense at once
+BLOCK_SIZE = 1024
+
+# the margin, relative to the sum of the dual coefficients, by which the
+# bound on the decision function must be positive, which absorbs rounding
+TOLERANCE = 1e-6
+
+# the names of the arrays that describe a prefilter
+ARRAYS = ('columns', 'median', 'spread', 'limit', 'nominal_lower',
+          'nominal_upper', 'support_lower', 'support_upper', 'weight',
+          'threshold')
+
+
+def _dense_blocks(matrix):
+    # type: (Any) -> Iterator[numpy.ndarray]
+    """
+    Yields the rows of a given matrix as dense blocks.
+    """
+    for start in range(0, matrix.shape[0], BLOCK_SIZE):
+        block = matrix[start:start + BLOCK_SIZE]
+        if sparse.issparse(block):
+            block = block.toarray()
+        yield numpy.asarray(block, dtype=numpy.float64)
+
+
+class Prefilter(object):
+    """
+    Classifies traces as nominal, anomalous or ambiguous via per-signal
+    bounds over which the decision function of the SVM of a model is
+    provably positive or negative.
+    """
+    @staticmethod
+    def fit(matrix,             # type: Any
+            scorer,             # type: Union[svm.OneClassSVM, SupportVectorScorer]  # noqa: pycodestyle
+            preprocessor=None,  # type: Optional[Preprocessor]
+            nominal_z=None      # type: Optional[float]
+            ):                  # type: (...) -> Prefilter
+        """
+        Fits a prefilter to the feature matrix of a set of nominal traces,
+        prior to preprocessing, and the SVM that was trained on them.
+
+        Parameters:
+            nominal_z: an optional limit on the robust z-score of each signal
+                within the nominal box.
+        """
+        if nominal_z is not None and nominal_z <= 0:
+            raise ValueError("nominal_z must be positive")
+        if preprocessor is not None:
+            columns = preprocessor.keep
+        else:
+            columns = numpy.arange(matrix.shape[1])
+        logger.debug("fitting prefilter to %d traces and %d signals",
+                     matrix.shape[0], len(columns))
+        if sparse.issparse(matrix):
+            matrix = sparse.csc_matrix(matrix)
+        median = numpy.zeros(len(columns))
+        spread = numpy.zeros(len(columns))
+        limit = 0.0
+        for start in range(0, len(columns), BLOCK_SIZE):
+            block = slice(start, start + BLOCK_SIZE)
+            values = matrix[:, columns[block]]
+            if sparse.issparse(values):
+                values = values.toarray()
+            values = numpy.asarray(values, dtype=numpy.float64)
+            center = numpy.median(values, axis=0)
+            deviation = numpy.abs(values - center)
+            scale = MAD_SCALE * numpy.median(deviation, axis=0)
+            # signals that take the same value in most traces are scaled by
+            # their standard deviation instead
+            scale = numpy.where(scale > 0, scale, values.std(axis=0))
+            scale = numpy.where(scale > 0, scale, 1.0)
+            median[block] = center
+            spread[block] = scale
+            if len(values):
+                limit = max(limit, float((deviation / scale).max()))
+        if nominal_z is not None:
+            limit = min(limit, nominal_z)
+        return Prefilter._derive(columns, median, spread, limit,
+                                 scorer, preprocessor)
+
+    @staticmethod
+    def _derive(columns,        # type: numpy.ndarray
+                median,         # type: numpy.ndarray
+                spread,         # type: numpy.ndarray
+                limit,          # type: float
+                scorer,         # type: Union[svm.OneClassSVM, SupportVectorScorer]  # noqa: pycodestyle
+                preprocessor    # type: Optional[Preprocessor]
+                ):              # type: (...) -> Prefilter
+        """
+        Derives the bounds of a prefilter for a given SVM.
+        """
+        if not isinstance(scorer, SupportVectorScorer):
+            scorer = SupportVectorScorer.from_svm(scorer)
+        if scorer.kernel not in ('rbf', 'linear'):
+            raise ValueError("a prefilter requires an rbf or linear kernel: {}".format(scorer.kernel))  # noqa: pycodestyle
+        if preprocessor is not None:
+            scale = preprocessor.scale
+            components = preprocessor.components
+        else:
+            scale = numpy.ones(len(columns))
+            components = None
+
+        dual = scorer.dual_coef_
+        intercept = float(scorer.intercept_[0])
+        tolerance = TOLERANCE * float(numpy.abs(dual).sum())
+        center = median * scale
+        radius = spread * scale
+        support = scorer.support_vectors_
+
+        # the nominal box has a half-width of z * radius, and z is chosen
+        # such that a lower bound on the decision function over the box is
+        # positive
+        if scorer.kernel == 'linear':
+            weights = numpy.asarray(support.T.dot(dual)).ravel()
+            if components is not None:
+                weights = components.T.dot(weights)
+            slope = float(numpy.abs(weights).dot(radius))
+            value = float(weights.dot(center)) + intercept - tolerance
+            z = limit if slope == 0 else value / slope
+            z = min(z, limit) if value > 0 else -1.0
+        else:
+            z = _rbf_nominal_z(support, dual, intercept, scorer.gamma,
+                               center, radius, components, limit, tolerance)
+        if z >= 0:
+            nominal_lower = median - z * spread
+            nominal_upper = median + z * spread
+        else:
+            nominal_lower = numpy.full(len(columns), numpy.inf)
+            nominal_upper = numpy.full(len(columns), -numpy.inf)
+        logger.debug("prefilter accepts signals within a robust z-score of %.3f",  # noqa: pycodestyle
+                     z)
+
+        # every support vector lies within the range of the support vectors,
+        # so a trace outside that range is at least the (weighted) distance
+        # to the range from each of them, which bounds each kernel term from
+        # above. This does not hold once signals are projected.
+        positive = float(dual[dual > 0].sum())
+        if scorer.kernel == 'rbf' and components is None \
+                and intercept < -tolerance:
+            support_lower = numpy.full(len(columns), numpy.inf)
+            support_upper = numpy.full(len(columns), -numpy.inf)
+            for block in _dense_blocks(support):
+                support_lower = numpy.minimum(support_lower, block.min(axis=0))  # noqa: pycodestyle
+                support_upper = numpy.maximum(support_upper, block.max(axis=0))  # noqa: pycodestyle
+            support_lower = support_lower / scale
+            support_upper = support_upper / scale
+            if positive > 0:
+                threshold = math.log(positive / (-intercept - tolerance)) / scorer.gamma  # noqa: pycodestyle
+                threshold = max(threshold, 0.0)
+            else:
+                threshold = -1.0
+        else:
+            support_lower = numpy.full(len(columns), -numpy.inf)
+            support_upper = numpy.full(len(columns), numpy.inf)
+            threshold = numpy.inf
+        return Prefilter(columns, median, spread, limit,
+                         nominal_lower, nominal_upper,
+                         support_lower, support_upper,
+                         scale * scale, threshold)
+
+    @staticmethod
+    def from_arrays(arrays):
+        # type: (Dict[str, numpy.ndarray]) -> Optional[Prefilter]
+        """
+        Constructs a prefilter from its arrays (see Prefilter.arrays), or
+        returns None if the given arrays do not describe a prefilter.
+        """
+        if not all(name in arrays for name in ARRAYS):
+            return None
+        return Prefilter(*(arrays[name] for name in ARRAYS))
+
+    def __init__(self,
+                 columns,           # type: numpy.ndarray
+                 median,            # type: numpy.ndarray
+                 spread,            # type: numpy.ndarray
+                 limit,             # type: float
+                 nominal_lower,     # type: numpy.ndarray
+                 nominal_upper,     # type: numpy.ndarray
+                 support_lower,     # type: numpy.ndarray
+                 support_upper,     # type: numpy.ndarray
+                 weight,            # type: numpy.ndarray
+                 threshold          # type: float
+                 ):                 # type: (...) -> None
+        self.__columns = numpy.asarray(columns, dtype=numpy.intp)
+        self.__median = numpy.asarray(median, dtype=numpy.float64)
+        self.__spread = numpy.asarray(spread, dtype=numpy.float64)
+        self.__limit = float(numpy.ravel(limit)[0])
+        self.__nominal_lower = numpy.asarray(nominal_lower, dtype=numpy.float64)  # noqa: pycodestyle
+        self.__nominal_upper = numpy.asarray(nominal_upper, dtype=numpy.float64)  # noqa: pycodestyle
+        self.__support_lower = numpy.asarray(support_lower, dtype=numpy.float64)  # noqa: pycodestyle
+        self.__support_upper = numpy.asarray(support_upper, dtype=numpy.float64)  # noqa: pycodestyle
+        self.__weight = numpy.asarray(weight, dtype=numpy.float64)
+        self.__threshold = float(numpy.ravel(threshold)[0])
+
+    @property
+    def arrays(self):
+        # type: () -> Dict[str, numpy.ndarray]
+        """
+        The arrays that describe this prefilter, indexed by name.
+        """
+        return {'columns': self.__columns,
+                'median': self.__median,
+                'spread': self.__spread,
+                'limit': numpy.array([self.__limit]),
+                'nominal_lower': self.__nominal_lower,
+                'nominal_upper': self.__nominal_upper,
+                'support_lower': self.__support_lower,
+                'support_upper': self.__support_upper,
+                'weight': self.__weight,
+                'threshold': numpy.array([self.__threshold])}
+
+    def refit(self, scorer, preprocessor=None):
+        # type: (Union[svm.OneClassSVM, SupportVectorScorer], Optional[Preprocessor]) -> Prefilter  # noqa: pycodestyle
+        """
+        Derives the bounds of this prefilter afresh for a retrained SVM.
+        """
+        return Prefilter._derive(self.__columns, self.__median, self.__spread,
+                                 self.__limit, scorer, preprocessor)
+
+    def classify(self, matrix):
+        # type: (Any) -> numpy.ndarray
+        """
+        Classifies each row of a given feature matrix, whose columns follow
+        the vocabulary of the model, as NOMINAL, ANOMALOUS or AMBIGUOUS.
+        """
+        values = matrix[:, self.__columns]
+        if sparse.issparse(values):
+            values = values.toarray()
+        nominal = ((values >= self.__nominal_lower) &
+                   (values <= self.__nominal_upper)).all(axis=1)
+        outside = numpy.maximum(self.__support_lower - values, 0.0) \
+            + numpy.maximum(values - self.__support_upper, 0.0)
+        anomalous = (outside * outside).dot(self.__weight) > self.__threshold
+        verdicts = numpy.full(len(values), AMBIGUOUS, dtype=numpy.int8)
+        verdicts[nominal] = NOMINAL
+        verdicts[anomalous] = ANOMALOUS
+        return verdicts
+
+
+def _rbf_nominal_z(support,     # type: Any
+                   dual,        # type: numpy.ndarray
+                   intercept,   # type: float
+                   gamma,       # type: float
+                   center,      # type: numpy.ndarray
+                   radius,      # type: numpy.ndarray
+                   components,  # type: Optional[numpy.ndarray]
+                   limit,       # type: float
+                   tolerance    # type: float
+                   ):           # type: (...) -> float
+    """
+    Finds the largest z, up to a given limit, for which the decision function
+    of an RBF SVM is provably positive over the box center +/- z * radius, or
+    returns -1 if there is no such z.
+    """
+    # the squared distance from each support vector to the farthest point of
+    # the box is bounded by a + 2bz + cz^2, and each term of the decision
+    # function by the kernel at that distance
+    if components is None:
+        a = numpy.zeros(support.shape[0])
+        b = numpy.zeros(support.shape[0])
+        start = 0
+        for block in _dense_blocks(support):
+            offset = numpy.abs(block - center)
+            a[start:start + len(block)] = numpy.einsum('ij,ij->i', offset, offset)  # noqa: pycodestyle
+            b[start:start + len(block)] = offset.dot(radius)
+            start += len(block)
+        c = float(radius.dot(radius))
+    else:
+        # the projection of the box lies within a ball around the projection
+        # of its center
+        norm = min(numpy.linalg.norm(components, 2) * numpy.linalg.norm(radius),  # noqa: pycodestyle
+                   float(numpy.linalg.norm(components, axis=0).dot(radius)))
+        distance = numpy.linalg.norm(
+            numpy.vstack(list(_dense_blocks(support))) - components.dot(center),  # noqa: pycodestyle
+            axis=1)
+        a = distance * distance
+        b = distance * norm
+        c = norm * norm
+    positive = dual > 0
+    negative = float(dual[~positive].sum())
+
+    def bound(z):
+        # type: (float) -> float
+        distances = a[positive] + 2.0 * b[positive] * z + c * z * z
+        return float(dual[positive].dot(numpy.exp(-gamma * distances))) \
+            + negative + intercept - tolerance
+
+    if bound(0.0) <= 0:
+        return -1.0
+    if bound(limit) > 0:
+        return limit
+    low, high = 0.0, limit
+    for _ in range(50):
+        middle = 0.5 * (low + high)
+        if bound(middle) > 0:
+            low = middle
+        else:
+            high = middle
+    return low
@@ -0,0 +1,143 @@
+__all__ = ['find_processes', 'terminate', 'process_usage', 'socket_states']
+
+from typing import Optional
+import errno
+import logging
+import os
+import signal
+import time
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# the names of the TCP states used by /proc/net/tcp
+TCP_STATES = {'01': 'ESTABLISHED', '0A': 'LISTEN'}
+
+
+def find_processes(marker):
+    # type: (str) -> List[int]
+    """
+    Returns the IDs of the processes whose command line contains a given
+    marker (e.g., the name of the signals file given to Valgrind).
+    """
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(os.path.join('/proc', name, 'cmdline'), 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode('utf-8', 'replace')  # noqa: pycodestyle
+        except (IOError, OSError):
+            continue
+        pid = int(name)
+        if marker in cmdline and pid != os.getpid():
+            pids.append(pid)
+    return pids
+
+
+def _is_alive(pid):
+    # type: (int) -> bool
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno == errno.EPERM
+    # zombies remain until they are reaped by their parent
+    try:
+        with open('/proc/{}/stat'.format(pid), 'r') as f:
+            state = f.read().rpartition(')')[2].split()[0]
+    except (IOError, OSError, IndexError):
+        return False
+    return state != 'Z'
+
+
+def terminate(pids, grace=5.0):
+    # type: (Iterable[int], float) -> None
+    """
+    Sends SIGTERM to each of a given set of processes, followed by SIGKILL
+    to any that remain alive after a grace period.
+    """
+    pids = list(pids)
+    for pid in pids:
+        logger.debug("terminating process: %d", pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+    deadline = time.time() + grace
+    while time.time() < deadline:
+        pids = [pid for pid in pids if _is_alive(pid)]
+        if not pids:
+            return
+        time.sleep(0.1)
+
+    for pid in pids:
+        logger.debug("killing process: %d", pid)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+def process_usage(pid):
+    # type: (int) -> Optional[Dict[str, float]]
+    """
+    Returns the CPU time (in seconds), resident set size and peak resident
+    set size (in bytes) of a given process, or None if the process no longer
+    exists.
+    """
+    try:
+        with open('/proc/{}/stat'.format(pid), 'r') as f:
+            fields = f.read().rpartition(')')[2].split()
+        with open('/proc/{}/status'.format(pid), 'r') as f:
+            status = f.read()
+    except (IOError, OSError):
+        return None
+    # utime and stime are the 14th and 15th fields of stat, counting from the
+    # pid, and hence the 12th and 13th fields following the command name
+    cpu_time = (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS)
+    usage = {'cpu_time': cpu_time, 'rss': 0, 'peak_rss': 0}
+    for line in status.splitlines():
+        name, _, value = line.partition(':')
+        if name == 'VmRSS':
+            usage['rss'] = int(value.split()[0]) * 1024
+        elif name == 'VmHWM':
+            usage['peak_rss'] = int(value.split()[0]) * 1024
+    return usage
+
+
+def socket_states(pid):
+    # type: (int) -> Set[str]
+    """
+    Returns the states (e.g., LISTEN or ESTABLISHED) of the TCP sockets that
+    are held open by a given process.
+    """
+    inodes = set()
+    dir_fd = '/proc/{}/fd'.format(pid)
+    try:
+        for fd in os.listdir(dir_fd):
+            try:
+                target = os.readlink(os.path.join(dir_fd, fd))
+            except OSError:
+                continue
+            if target.startswith('socket:['):
+                inodes.add(target[len('socket:['):-1])
+    except OSError:
+        return set()
+    if not inodes:
+        return set()
+
+    states = set()
+    for table in ('tcp', 'tcp6'):
+        try:
+            with open('/proc/{}/net/{}'.format(pid, table), 'r') as f:
+                lines = f.readlines()[1:]
+        except (IOError, OSError):
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) > 9 and fields[9] in inodes:
+                states.add(TCP_STATES.get(fields[3], fields[3]))
+    return states
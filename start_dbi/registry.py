@@ -0,0 +1,227 @@
+__all__ = ['ModelRegistry']
+
+from typing import Optional
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from .cache import locked_json
+from .model import Model, LOF
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+FN_INDEX = 'index.json'
+MODEL_EXTENSION = '.model'
+
+
+def _key(scenario, mission, revision=None):
+    # type: (str, str, Optional[str]) -> str
+    return '\0'.join([scenario, mission, revision or ''])
+
+
+def _signature(filename):
+    # type: (str) -> Tuple[int, int, int]
+    """
+    Returns the inode, modification time (in nanoseconds) and size of a given
+    file, which change when it is replaced, even within the resolution of
+    its modification time.
+    """
+    stat = os.stat(filename)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class ModelRegistry(object):
+    """
+    Provides a model for each scenario, mission and (optional) revision of
+    the ArduPilot binary, stored in a directory that may be shared by several
+    processes. Models are loaded on first use and released when unused.
+    """
+    def __init__(self, directory, capacity=16):
+        # type: (str, int) -> None
+        """
+        Parameters:
+            directory: the directory that holds the models.
+            capacity: the maximum number of models that are held in memory.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.__directory = directory
+        self.__capacity = capacity
+        self.__fn_index = os.path.join(directory, FN_INDEX)
+        self.__lock = threading.RLock()
+        # maps each key to its model and the signature of its file
+        self.__loaded = collections.OrderedDict()  # type: collections.OrderedDict  # noqa: pycodestyle
+        self.__stats = {'hits': 0, 'loads': 0, 'evictions': 0}
+        # the entries of the index, as of the given signature
+        self.__entries = {}  # type: Dict[str, Dict[str, Any]]
+        self.__entries_signature = None  # type: Optional[Tuple[int, int, int]]  # noqa: pycodestyle
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __index(self):
+        # type: () -> ContextManager[Dict[str, Any]]
+        return locked_json(self.__fn_index, lambda: {'entries': {}})
+
+    def register(self,
+                 model,         # type: Union[Model, LOF]
+                 scenario,      # type: str
+                 mission,       # type: str
+                 revision=None  # type: Optional[str]
+                 ):             # type: (...) -> str
+        """
+        Saves a given model to this registry for a given scenario, mission
+        and (optional) binary revision, replacing any existing model.
+
+        Returns:
+            the name of the file to which the model was saved.
+        """
+        key = _key(scenario, mission, revision)
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        filename = os.path.join(self.__directory, digest + MODEL_EXTENSION)
+        model.to_file(filename)
+        with self.__index() as index:
+            index['entries'][key] = {
+                'scenario': scenario,
+                'mission': mission,
+                'revision': revision,
+                'filename': os.path.basename(filename),
+                'kind': 'lof' if isinstance(model, LOF) else 'svm',
+                'registered': time.time()
+            }
+        logger.debug("registered model for scenario [%s], mission [%s] and revision [%s]: %s",  # noqa: pycodestyle
+                     scenario, mission, revision, filename)
+        return filename
+
+    def remove(self, scenario, mission, revision=None):
+        # type: (str, str, Optional[str]) -> None
+        """
+        Removes the model for a given scenario, mission and revision.
+        """
+        key = _key(scenario, mission, revision)
+        with self.__index() as index:
+            entry = index['entries'].pop(key, None)
+        if entry is None:
+            raise KeyError("no model registered for scenario [{}], mission [{}] and revision [{}]".format(scenario, mission, revision))  # noqa: pycodestyle
+        with self.__lock:
+            self.__loaded.pop(key, None)
+        try:
+            os.remove(os.path.join(self.__directory, entry['filename']))
+        except OSError:
+            pass
+
+    def __current_entries(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """
+        Returns the entries of the index. Since the index is replaced
+        atomically whenever it is changed, it is only read again when its
+        signature (see _signature) changes.
+        """
+        try:
+            signature = _signature(self.__fn_index)
+        except OSError:
+            return {}
+        with self.__lock:
+            if signature != self.__entries_signature:
+                with open(self.__fn_index, 'r') as f:
+                    self.__entries = json.load(f)['entries']
+                self.__entries_signature = signature
+            return self.__entries
+
+    def entries(self):
+        # type: () -> List[Dict[str, Any]]
+        """
+        Returns a description of each model within this registry.
+        """
+        return [dict(e) for e in self.__current_entries().values()]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.__current_entries())
+
+    def __find(self, scenario, mission, revision):
+        # type: (str, str, Optional[str]) -> Tuple[str, Dict[str, Any]]
+        entries = self.__current_entries()
+        for key in (_key(scenario, mission, revision),
+                    _key(scenario, mission)):
+            if key in entries:
+                return key, entries[key]
+        raise KeyError("no model registered for scenario [{}], mission [{}] and revision [{}]".format(scenario, mission, revision))  # noqa: pycodestyle
+
+    def get(self, scenario, mission, revision=None):
+        # type: (str, str, Optional[str]) -> Union[Model, LOF]
+        """
+        Returns the model for a given scenario, mission and revision, or else
+        the model registered without a revision, loading it if necessary.
+
+        Raises:
+            KeyError: if no suitable model has been registered.
+        """
+        key, entry = self.__find(scenario, mission, revision)
+        filename = os.path.join(self.__directory, entry['filename'])
+        signature = _signature(filename)
+        with self.__lock:
+            loaded = self.__loaded.get(key)
+            # models that have been re-registered since they were loaded are
+            # loaded again
+            if loaded is not None and loaded[1] == signature:
+                self.__loaded.pop(key)
+                self.__loaded[key] = loaded
+                self.__stats['hits'] += 1
+                return loaded[0]
+
+        logger.debug("loading model for scenario [%s], mission [%s] and revision [%s]",  # noqa: pycodestyle
+                     scenario, mission, revision)
+        if entry['kind'] == 'lof':
+            model = LOF.from_file(filename)
+        else:
+            model = Model.from_file(filename)
+
+        with self.__lock:
+            self.__loaded.pop(key, None)
+            self.__loaded[key] = (model, signature)
+            self.__stats['loads'] += 1
+            while len(self.__loaded) > self.__capacity:
+                evicted, _ = self.__loaded.popitem(last=False)
+                self.__stats['evictions'] += 1
+                logger.debug("released model from memory: %s",
+                             evicted.replace('\0', '/'))
+        return model
+
+    def check(self, trace, scenario, mission, revision=None):
+        # type: (Trace, str, str, Optional[str]) -> [bool, float]
+        """
+        Checks a given trace against the model for a given scenario, mission
+        and revision (see Model.check).
+        """
+        return self.get(scenario, mission, revision).check(trace)
+
+    def check_many(self,
+                   traces,          # type: Iterable[Trace]
+                   scenario,        # type: str
+                   mission,         # type: str
+                   revision=None,   # type: Optional[str]
+                   chunk_size=None  # type: Optional[int]
+                   ):               # type: (...) -> Tuple[numpy.ndarray, numpy.ndarray]  # noqa: pycodestyle
+        """
+        Checks a given sequence of traces against the model for a given
+        scenario, mission and revision (see Model.check_many).
+        """
+        model = self.get(scenario, mission, revision)
+        return model.check_many(traces, chunk_size=chunk_size)
+
+    @property
+    def stats(self):
+        # type: () -> Dict[str, int]
+        """
+        Returns the number of hits, loads and evictions for the models held
+        in memory, together with the number of models held in memory.
+        """
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['loaded'] = len(self.__loaded)
+        return stats
@@ -0,0 +1,448 @@
+__all__ = ['ScoringServer', 'ScoringClient']
+
+from typing import Optional, TYPE_CHECKING
+import base64
+import collections
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+import numpy
+
+from .trace import Trace
+from .model import Model
+
+if TYPE_CHECKING:
+    from .registry import ModelRegistry
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the number of recent requests whose latencies are used to compute the
+# latency percentiles reported by the server
+LATENCY_WINDOW = 4096
+
+
+class _Request(object):
+    """
+    Describes a single scoring request that is waiting to be batched.
+    """
+    def __init__(self, id_request, name_model, model, trace, time_received,
+                 respond):
+        # type: (Any, str, Model, Trace, float, Callable[[Dict[str, Any]], None]) -> None  # noqa: pycodestyle
+        self.id_request = id_request
+        self.name_model = name_model
+        self.model = model
+        self.trace = trace
+        self.time_received = time_received
+        self.respond = respond
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Handles a single client connection. Requests are scored concurrently,
+    and so responses may be returned out of order.
+    """
+    def handle(self):
+        # type: () -> None
+        lock = threading.Lock()
+
+        def respond(response):
+            # type: (Dict[str, Any]) -> None
+            line = (json.dumps(response) + '\n').encode('utf-8')
+            with lock:
+                try:
+                    self.wfile.write(line)
+                    self.wfile.flush()
+                except (IOError, OSError, ValueError):
+                    logger.debug("client disconnected before response was sent")  # noqa: pycodestyle
+
+        for line in self.rfile:
+            line = line.strip()
+            if line:
+                self.server.scoring_server._handle(line, respond)
+
+
+class _UnixStreamServer(socketserver.ThreadingMixIn,
+                        socketserver.UnixStreamServer):
+    daemon_threads = True
+    # connections to a Unix socket are refused, rather than retried, once
+    # the backlog is full, and so a large backlog is used
+    request_queue_size = 128
+
+
+class ScoringServer(object):
+    """
+    Serves verdicts for execution traces over a local Unix socket, using
+    newline-delimited JSON requests (see README.md). Requests that arrive at
+    around the same time are scored together by Model.check_many.
+    """
+    def __init__(self,
+                 filename_socket,       # type: str
+                 models=None,           # type: Optional[Dict[str, Model]]
+                 max_batch_size=64,     # type: int
+                 max_delay=0.005,       # type: float
+                 registry=None          # type: Optional[ModelRegistry]
+                 ):                     # type: (...) -> None
+        """
+        Parameters:
+            filename_socket: the path of the Unix socket.
+            models: the models served, indexed by name.
+            max_batch_size: the maximum number of traces in a batch.
+            max_delay: the maximum time, in seconds, to wait for a batch.
+            registry: an optional model registry (see start_dbi.registry).
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be positive")
+        self.__filename_socket = filename_socket
+        self.__models = dict(models or {})
+        self.__registry = registry
+        if not self.__models and registry is None:
+            raise ValueError("either models or a registry must be given")
+        self.__max_batch_size = max_batch_size
+        self.__max_delay = max_delay
+        self.__queue = queue.Queue()  # type: queue.Queue
+        self.__server = None  # type: Optional[_UnixStreamServer]
+        self.__thread_batcher = None  # type: Optional[threading.Thread]
+        self.__lock_metrics = threading.Lock()
+        self.__time_started = None  # type: Optional[float]
+        self.__num_requests = 0
+        self.__num_errors = 0
+        self.__num_batches = 0
+        self.__latencies = collections.deque(maxlen=LATENCY_WINDOW)  # type: Deque[float]  # noqa: pycodestyle
+
+    @staticmethod
+    def from_files(filename_socket, filenames, **kwargs):
+        # type: (str, Dict[str, str], **Any) -> ScoringServer
+        """
+        Constructs a server for a set of models that are loaded from a given
+        set of files, indexed by the name of the model.
+        """
+        models = {name: Model.from_file(fn) for (name, fn) in filenames.items()}  # noqa: pycodestyle
+        return ScoringServer(filename_socket, models, **kwargs)
+
+    @property
+    def models(self):
+        # type: () -> List[str]
+        """
+        Returns the names of the models served by this server.
+        """
+        return sorted(self.__models)
+
+    def __model(self, name):
+        # type: (Optional[str]) -> Tuple[str, Model]
+        if name is None:
+            if len(self.__models) != 1:
+                raise ValueError("no model specified")
+            name = next(iter(self.__models))
+        if name not in self.__models:
+            raise ValueError("unknown model: {}".format(name))
+        return name, self.__models[name]
+
+    def _handle(self, line, respond):
+        # type: (bytes, Callable[[Dict[str, Any]], None]) -> None
+        """
+        Parses a given request and submits it for scoring.
+        """
+        time_received = time.time()
+        id_request = None
+        try:
+            request = json.loads(line.decode('utf-8'))
+            id_request = request.get('id')
+            if request.get('command') == 'metrics':
+                respond({'id': id_request, 'metrics': self.metrics})
+                return
+            if 'scenario' in request:
+                if self.__registry is None:
+                    raise ValueError("server has no model registry")
+                model = self.__registry.get(request['scenario'],
+                                            request['mission'],
+                                            request.get('revision'))
+                name_model = '/'.join([request['scenario'],
+                                       request['mission'],
+                                       request.get('revision') or ''])
+            else:
+                name_model, model = self.__model(request.get('model'))
+            if 'trace' in request:
+                payload = base64.b64decode(request['trace'])
+                trace = Trace.from_bytes(payload)
+            elif 'path' in request:
+                trace = Trace.from_file(request['path'])
+            else:
+                raise ValueError("request must give either a path or a trace")
+        except Exception as err:
+            logger.debug("rejected request: %s", err)
+            with self.__lock_metrics:
+                self.__num_errors += 1
+            respond({'id': id_request, 'error': str(err)})
+            return
+        self.__queue.put(_Request(id_request, name_model, model, trace,
+                                  time_received, respond))
+
+    def __next_batch(self):
+        # type: () -> List[_Request]
+        """
+        Waits for the next request, then collects any further requests that
+        arrive within the maximum delay, up to the maximum batch size.
+        """
+        batch = [self.__queue.get()]
+        if batch[0] is None:
+            return batch
+        deadline = time.time() + self.__max_delay
+        while len(batch) < self.__max_batch_size:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    request = self.__queue.get(timeout=remaining)
+                else:
+                    request = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            if request is None:
+                break
+        return batch
+
+    def __score(self, requests):
+        # type: (List[_Request]) -> None
+        """
+        Scores a batch of requests for the same model.
+        """
+        model = requests[0].model
+        time_scored = time.time()
+        try:
+            verdicts, scores = model.check_many([r.trace for r in requests])
+        except Exception as err:
+            logger.exception("failed to score batch of %d traces",
+                             len(requests))
+            with self.__lock_metrics:
+                self.__num_errors += len(requests)
+            for request in requests:
+                request.respond({'id': request.id_request, 'error': str(err)})
+            return
+        time_finished = time.time()
+
+        latencies = [time_finished - r.time_received for r in requests]
+        # the metrics are recorded before responding, so that they account
+        # for every request whose response has been received
+        with self.__lock_metrics:
+            self.__num_requests += len(requests)
+            self.__num_batches += 1
+            self.__latencies.extend(latencies)
+        for (request, verdict, score, latency) in zip(requests, verdicts, scores, latencies):  # noqa: pycodestyle
+            request.respond({
+                'id': request.id_request,
+                'model': request.name_model,
+                'compromised': bool(verdict),
+                'score': float(score),
+                'batch_size': len(requests),
+                'latency': {'queue': time_scored - request.time_received,
+                            'total': latency}
+            })
+
+    def __batch_forever(self):
+        # type: () -> None
+        while True:
+            batch = self.__next_batch()
+            stop = batch[-1] is None
+            requests_by_model = collections.OrderedDict()  # type: Dict[str, List[_Request]]  # noqa: pycodestyle
+            for request in batch:
+                if request is not None:
+                    requests_by_model.setdefault(request.name_model, []).append(request)  # noqa: pycodestyle
+            for requests in requests_by_model.values():
+                self.__score(requests)
+            if stop:
+                return
+
+    @property
+    def metrics(self):
+        # type: () -> Dict[str, Any]
+        """
+        Returns the number of requests, errors and batches served by this
+        server, the mean batch size, and percentiles (in seconds) of the
+        latencies of recent requests.
+        """
+        with self.__lock_metrics:
+            latencies = numpy.array(self.__latencies)
+            metrics = {
+                'models': self.models,
+                'uptime': time.time() - self.__time_started if self.__time_started else 0.0,  # noqa: pycodestyle
+                'requests': self.__num_requests,
+                'errors': self.__num_errors,
+                'batches': self.__num_batches,
+                'mean_batch_size': float(self.__num_requests) / self.__num_batches if self.__num_batches else 0.0,  # noqa: pycodestyle
+                'queued': self.__queue.qsize()
+            }
+        if len(latencies) > 0:
+            p50, p90, p99 = numpy.percentile(latencies, [50, 90, 99])
+            metrics['latency'] = {'p50': float(p50),
+                                  'p90': float(p90),
+                                  'p99': float(p99),
+                                  'max': float(latencies.max())}
+        if self.__registry is not None:
+            metrics['registry'] = self.__registry.stats
+        return metrics
+
+    def start(self):
+        # type: () -> None
+        """
+        Starts serving requests in the background.
+        """
+        if os.path.exists(self.__filename_socket):
+            os.remove(self.__filename_socket)
+        self.__server = _UnixStreamServer(self.__filename_socket, _Handler)
+        self.__server.scoring_server = self
+        self.__time_started = time.time()
+        self.__thread_batcher = threading.Thread(target=self.__batch_forever)
+        self.__thread_batcher.daemon = True
+        self.__thread_batcher.start()
+        thread_server = threading.Thread(target=self.__server.serve_forever)
+        thread_server.daemon = True
+        thread_server.start()
+        logger.info("serving %d models on socket: %s",
+                    len(self.__models), self.__filename_socket)
+
+    def stop(self):
+        # type: () -> None
+        """
+        Stops serving requests, once any queued requests have been scored,
+        and removes the socket.
+        """
+        if self.__server is None:
+            return
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__queue.put(None)
+        self.__thread_batcher.join()
+        self.__server = None
+        if os.path.exists(self.__filename_socket):
+            os.remove(self.__filename_socket)
+        logger.info("stopped serving on socket: %s", self.__filename_socket)
+
+    def serve_forever(self):
+        # type: () -> None
+        """
+        Serves requests until interrupted.
+        """
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        # type: () -> ScoringServer
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        # type: (*Any) -> None
+        self.stop()
+
+
+class ScoringClient(object):
+    """
+    Sends requests to a scoring server, one at a time, over a single
+    connection.
+    """
+    def __init__(self, filename_socket, model=None, timeout=60.0):
+        # type: (str, Optional[str], Optional[float]) -> None
+        """
+        Parameters:
+            filename_socket: the path of the Unix socket of the server.
+            model: the name of the model that should be used, if the server
+                has more than one model.
+            timeout: the maximum time, in seconds, to wait for a response.
+        """
+        self.__model = model
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.settimeout(timeout)
+        self.__socket.connect(filename_socket)
+        self.__file = self.__socket.makefile('rb')
+        self.__next_id = 0
+
+    def __request(self, request):
+        # type: (Dict[str, Any]) -> Dict[str, Any]
+        request['id'] = self.__next_id
+        self.__next_id += 1
+        line = json.dumps(request) + '\n'
+        self.__socket.sendall(line.encode('utf-8'))
+        response = self.__file.readline()
+        if not response:
+            raise IOError("scoring server closed connection")
+        response = json.loads(response.decode('utf-8'))
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response
+
+    def score(self,
+              trace=None,       # type: Optional[Trace]
+              path=None,        # type: Optional[str]
+              scenario=None,    # type: Optional[str]
+              mission=None,     # type: Optional[str]
+              revision=None     # type: Optional[str]
+              ):                # type: (...) -> Dict[str, Any]
+        """
+        Scores either a given trace or the trace stored in a given file, and
+        returns the response of the server. If a scenario and mission are
+        given, the model registered for them is used.
+        """
+        request = {}  # type: Dict[str, Any]
+        if scenario is not None:
+            request.update(scenario=scenario, mission=mission,
+                           revision=revision)
+        elif self.__model is not None:
+            request['model'] = self.__model
+        if trace is not None:
+            request['trace'] = base64.b64encode(trace.to_bytes()).decode('ascii')  # noqa: pycodestyle
+        elif path is not None:
+            request['path'] = os.path.abspath(path)
+        else:
+            raise ValueError("either a trace or a path must be given")
+        return self.__request(request)
+
+    def check(self, trace):
+        # type: (Trace) -> [bool, float]
+        """
+        Determines whether a given execution trace is deemed to have been
+        produced by a compromised binary, in the same manner as Model.check.
+        """
+        response = self.score(trace=trace)
+        if response['compromised']:
+            return [True, response['score']]
+        return False
+
+    def metrics(self):
+        # type: () -> Dict[str, Any]
+        """
+        Returns the metrics for the server.
+        """
+        return self.__request({'command': 'metrics'})['metrics']
+
+    def close(self):
+        # type: () -> None
+        self.__file.close()
+        self.__socket.close()
+
+    def __enter__(self):
+        # type: () -> ScoringClient
+        return self
+
+    def __exit__(self, *args):
+        # type: (*Any) -> None
+        self.close()
@@ -0,0 +1,329 @@
+__all__ = ['TraceStore']
+
+from typing import Optional
+import logging
+import json
+import os
+import re
+import uuid as uuid_module
+
+import numpy
+
+from .trace import Trace
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the metadata that is recorded for each row of the store
+METADATA_FIELDS = ('scenario', 'mission', 'attack', 'patch', 'uuid')
+
+# matches the names of the trace files produced by examples/collect_signals.py
+# e.g., scenarioAIS-Scenario1_missionmission1_attack_patchfoo.diff_<uuid>.trace
+TRACE_FILENAME_PATTERN = re.compile(
+    r'^scenario(?P<scenario>.+?)_mission(?P<mission>.+?)'
+    r'_(?P<attack>attack|noattack)(?:_patch(?P<patch>.+))?'
+    r'_(?P<uuid>[0-9a-f]{32})\.b?trace$')
+
+FN_INDEX = 'index.json'
+FN_VALUES = 'values.f8'
+DTYPE = numpy.dtype('<f8')
+
+
+class TraceStore(object):
+    """
+    Stores a corpus of traces within a directory as a growable, memory-mapped
+    matrix with a row per trace and a column per signal, together with the
+    metadata of each trace and the name of each signal.
+    """
+    def __init__(self, directory, mode='a'):
+        # type: (str, str) -> None
+        """
+        Opens the trace store within a given directory, either for reading
+        ('r') or for appending ('a'), in which case it is created if needed.
+        """
+        if mode not in ('r', 'a'):
+            raise ValueError("unsupported mode: {}".format(mode))
+        self.__directory = directory
+        self.__mode = mode
+        self.__fn_index = os.path.join(directory, FN_INDEX)
+        self.__fn_values = os.path.join(directory, FN_VALUES)
+        self.__values = None  # type: Optional[numpy.memmap]
+
+        if os.path.exists(self.__fn_index):
+            logger.debug("opening trace store: %s", directory)
+            with open(self.__fn_index, 'r') as f:
+                index = json.load(f)
+            self.__signals = index['signals']  # type: List[str]
+            self.__rows = index['rows']  # type: List[Dict[str, Any]]
+            self.__row_capacity = index['row_capacity']  # type: int
+            self.__column_capacity = index['column_capacity']  # type: int
+        elif mode == 'a':
+            logger.debug("creating trace store: %s", directory)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.__signals = []
+            self.__rows = []
+            self.__row_capacity = 0
+            self.__column_capacity = 0
+            open(self.__fn_values, 'wb').close()
+            self.flush()
+        else:
+            raise IOError("trace store does not exist: {}".format(directory))
+
+        self.__signal_to_column = \
+            {n: i for (i, n) in enumerate(self.__signals)}
+        self.__map()
+
+    def __enter__(self):
+        # type: () -> TraceStore
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.__rows)
+
+    @property
+    def directory(self):
+        # type: () -> str
+        return self.__directory
+
+    @property
+    def signals(self):
+        # type: () -> List[str]
+        """
+        Returns the names of the signals within this store, in column order.
+        """
+        return list(self.__signals)
+
+    def metadata(self, row):
+        # type: (int) -> Dict[str, Any]
+        """
+        Returns the metadata for a given row.
+        """
+        return dict(self.__rows[row])
+
+    def name(self, row):
+        # type: (int) -> str
+        """
+        Returns a descriptive name for a given row, following the naming
+        convention used for trace files by examples/collect_signals.py.
+        """
+        md = self.__rows[row]
+        name = "scenario{}_mission{}_{}".format(
+            md['scenario'], md['mission'],
+            'attack' if md['attack'] else 'noattack')
+        if md['patch']:
+            name += "_patch{}".format(md['patch'])
+        return "{}_{}".format(name, md['uuid'])
+
+    def __map(self):
+        # type: () -> None
+        """
+        (Re-)creates the memory map for the values of the store.
+        """
+        self.__values = None
+        if self.__row_capacity == 0 or self.__column_capacity == 0:
+            return
+        mode = 'r' if self.__mode == 'r' else 'r+'
+        self.__values = numpy.memmap(self.__fn_values,
+                                     dtype=DTYPE,
+                                     mode=mode,
+                                     shape=(self.__row_capacity,
+                                            self.__column_capacity))
+
+    def __resize(self, num_rows, num_columns):
+        # type: (int, int) -> None
+        """
+        Ensures that the store can hold a given number of rows and columns,
+        doubling its capacities as necessary.
+        """
+        row_capacity = self.__row_capacity
+        column_capacity = self.__column_capacity
+        while row_capacity < num_rows:
+            row_capacity = max(16, 2 * row_capacity)
+        while column_capacity < num_columns:
+            column_capacity = max(1024, 2 * column_capacity)
+
+        if column_capacity != self.__column_capacity:
+            logger.debug("growing trace store columns: %d -> %d",
+                         self.__column_capacity, column_capacity)
+            fn_tmp = self.__fn_values + '.tmp'
+            values = numpy.memmap(fn_tmp,
+                                  dtype=DTYPE,
+                                  mode='w+',
+                                  shape=(row_capacity, column_capacity))
+            if self.__values is not None:
+                n = len(self.__rows)
+                m = self.__column_capacity
+                step = max(1, (1 << 24) // (m * DTYPE.itemsize))
+                for i in range(0, n, step):
+                    values[i:i + step, :m] = self.__values[i:i + step]
+            values.flush()
+            del values
+            self.__values = None
+            os.rename(fn_tmp, self.__fn_values)
+
+        elif row_capacity != self.__row_capacity:
+            logger.debug("growing trace store rows: %d -> %d",
+                         self.__row_capacity, row_capacity)
+            if self.__values is not None:
+                self.__values.flush()
+                self.__values = None
+            size = row_capacity * column_capacity * DTYPE.itemsize
+            with open(self.__fn_values, 'r+b') as f:
+                f.truncate(size)
+
+        self.__row_capacity = row_capacity
+        self.__column_capacity = column_capacity
+        self.__map()
+
+    def append(self,
+               trace,           # type: Trace
+               scenario=None,   # type: Optional[str]
+               mission=None,    # type: Optional[str]
+               attack=False,    # type: bool
+               patch=None,      # type: Optional[str]
+               uuid=None        # type: Optional[str]
+               ):               # type: (...) -> int
+        """
+        Appends a trace to this store.
+
+        Returns:
+            the index of the row that holds the trace.
+        """
+        if self.__mode == 'r':
+            raise IOError("trace store is read-only: {}".format(self.__directory))  # noqa: pycodestyle
+        for name in trace.signals:
+            if name not in self.__signal_to_column:
+                self.__signal_to_column[name] = len(self.__signals)
+                self.__signals.append(name)
+        columns = numpy.fromiter(
+            (self.__signal_to_column[n] for n in trace.signals),
+            dtype=numpy.intp)
+
+        row = len(self.__rows)
+        self.__resize(row + 1, len(self.__signals))
+        if len(columns) > 0:
+            self.__values[row, columns] = trace.array
+        metadata = {
+            'scenario': scenario,
+            'mission': mission,
+            'attack': bool(attack),
+            'patch': patch,
+            'uuid': uuid if uuid else uuid_module.uuid4().hex
+        }
+        # the metrics recorded whilst the trace was generated, if any, are
+        # kept alongside its metadata
+        if trace.metrics is not None:
+            metadata['metrics'] = trace.metrics.to_dict()
+        self.__rows.append(metadata)
+        return row
+
+    def import_directory(self, directory):
+        # type: (str) -> List[int]
+        """
+        Appends each trace file within a given directory to this store, using
+        the metadata given by its filename (see TRACE_FILENAME_PATTERN).
+
+        Returns:
+            the indices of the rows that hold the imported traces.
+        """
+        logger.debug("importing traces from directory: %s", directory)
+        rows = []
+        for fn in sorted(os.listdir(directory)):
+            if not fn.endswith(('.trace', '.btrace')):
+                continue
+            trace = Trace.from_file(os.path.join(directory, fn))
+            match = TRACE_FILENAME_PATTERN.match(fn)
+            if match:
+                md = match.groupdict()
+                md['attack'] = md['attack'] == 'attack'
+            else:
+                logger.warning("failed to obtain metadata from trace filename: %s", fn)  # noqa: pycodestyle
+                md = {}
+            rows.append(self.append(trace, **md))
+        logger.debug("imported %d traces from directory: %s",
+                     len(rows), directory)
+        return rows
+
+    def select(self, **criteria):
+        # type: (...) -> numpy.ndarray
+        """
+        Returns the indices of the rows whose metadata matches all of the
+        given criteria (e.g., `store.select(scenario='AIS-Scenario1',
+        attack=False, patch=None)`).
+        """
+        for field in criteria:
+            if field not in METADATA_FIELDS:
+                raise ValueError("unknown metadata field: {}".format(field))
+        rows = [i for (i, md) in enumerate(self.__rows)
+                if all(md[f] == v for (f, v) in criteria.items())]
+        return numpy.array(rows, dtype=numpy.intp)
+
+    def matrix(self, rows=None):
+        # type: (Optional[Sequence[int]]) -> numpy.ndarray
+        """
+        Returns a matrix of values for a given set of rows, or for every row
+        within the store if no rows are given. When all rows are requested,
+        the result is a view of the underlying memory map and no values are
+        copied.
+        """
+        shape = (len(self.__rows), len(self.__signals))
+        if self.__values is None:
+            view = numpy.zeros(shape, dtype=DTYPE)
+        else:
+            view = self.__values[:shape[0], :shape[1]]
+        if rows is None:
+            return view
+        return view[numpy.asarray(rows, dtype=numpy.intp)]
+
+    def trace(self, row):
+        # type: (int) -> Trace
+        """
+        Returns the trace stored at a given row. The values of the trace are
+        a view of the underlying memory map.
+        """
+        if not 0 <= row < len(self.__rows):
+            raise IndexError("row out of range: {}".format(row))
+        return Trace.from_arrays(self.__signals, self.matrix()[row])
+
+    def traces(self, rows=None):
+        # type: (Optional[Sequence[int]]) -> List[Trace]
+        """
+        Returns the traces stored at a given set of rows, or every trace
+        within the store if no rows are given.
+        """
+        if rows is None:
+            rows = range(len(self.__rows))
+        return [self.trace(int(r)) for r in rows]
+
+    def flush(self):
+        # type: () -> None
+        """
+        Writes any changes to this store to disk.
+        """
+        if self.__mode == 'r':
+            return
+        if self.__values is not None:
+            self.__values.flush()
+        index = {
+            'signals': self.__signals,
+            'rows': self.__rows,
+            'row_capacity': self.__row_capacity,
+            'column_capacity': self.__column_capacity
+        }
+        fn_tmp = self.__fn_index + '.tmp'
+        with open(fn_tmp, 'w') as f:
+            json.dump(index, f)
+        os.rename(fn_tmp, self.__fn_index)
+
+    def close(self):
+        # type: () -> None
+        """
+        Flushes and closes this store.
+        """
+        self.flush()
+        self.__values = None
@@ -0,0 +1,218 @@
+"""
+Provides out-of-core feature extraction, which reads traces one chunk at a
+time, for corpora whose feature matrix does not fit in memory.
+"""
+__all__ = ['DEFAULT_CHUNK_SIZE', 'reduce_traces']
+
+from typing import Optional
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy
+from scipy import sparse
+
+from .trace import Trace
+from .features import Vocabulary, FeatureStatistics, Preprocessor
+from .store import TraceStore
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class _Chunks(object):
+    """
+    Reads a TraceStore, a callable that returns a fresh iterable of traces, or
+    a single-use iterable of traces (which is spooled to disk) as a sequence
+    of sparse feature matrices that may be read more than once.
+    """
+    def __init__(self,
+                 source,        # type: Union[TraceStore, Callable[[], Iterable[Trace]], Iterable[Trace]]  # noqa: pycodestyle
+                 chunk_size,    # type: int
+                 rows=None,     # type: Optional[Sequence[int]]
+                 dir_spool=None  # type: Optional[str]
+                 ):              # type: (...) -> None
+        if chunk_size < 1:
+            raise ValueError("chunk size must be positive")
+        if rows is not None and not isinstance(source, TraceStore):
+            raise ValueError("rows may only be given for a TraceStore")
+        self.__source = source
+        self.__chunk_size = chunk_size
+        self.__rows = rows
+        self.__dir_spool = dir_spool
+        self.__spooled = None  # type: Optional[List[str]]
+        if isinstance(source, TraceStore):
+            self.__vocabulary = Vocabulary(source.signals)
+        else:
+            self.__vocabulary = Vocabulary()
+
+    @property
+    def vocabulary(self):
+        # type: () -> Vocabulary
+        return self.__vocabulary
+
+    def __store_chunks(self):
+        # type: () -> Iterator[sparse.csr_matrix]
+        store = self.__source  # type: TraceStore
+        rows = self.__rows
+        if rows is None:
+            rows = numpy.arange(len(store))
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        for start in range(0, len(rows), self.__chunk_size):
+            chunk = store.matrix(rows[start:start + self.__chunk_size])
+            yield sparse.csr_matrix(chunk, dtype=numpy.float64)
+
+    def __trace_chunks(self, traces, grow):
+        # type: (Iterable[Trace], bool) -> Iterator[sparse.csr_matrix]
+        transform = self.__vocabulary.fit_transform if grow \
+            else self.__vocabulary.transform
+        chunk = []  # type: List[Trace]
+        for trace in traces:
+            chunk.append(trace)
+            if len(chunk) == self.__chunk_size:
+                yield transform(chunk)
+                chunk = []
+        if chunk:
+            yield transform(chunk)
+
+    def scan(self):
+        # type: () -> Iterator[sparse.csr_matrix]
+        """
+        Performs the first pass over the source, which extends the vocabulary.
+        Chunks may have fewer columns than the final vocabulary.
+        """
+        if isinstance(self.__source, TraceStore):
+            for chunk in self.__store_chunks():
+                yield chunk
+            return
+        if callable(self.__source):
+            for chunk in self.__trace_chunks(self.__source(), grow=True):
+                yield chunk
+            return
+
+        self.__spooled = []
+        self.__dir_spool = tempfile.mkdtemp(prefix='start_dbi.streaming.',
+                                            dir=self.__dir_spool)
+        for chunk in self.__trace_chunks(self.__source, grow=True):
+            fn = os.path.join(self.__dir_spool,
+                              'chunk-{:09d}.npz'.format(len(self.__spooled)))
+            sparse.save_npz(fn, chunk, compressed=False)
+            self.__spooled.append(fn)
+            yield chunk
+        logger.debug("spooled %d chunks of traces to: %s",
+                     len(self.__spooled), self.__dir_spool)
+
+    def __iter__(self):
+        # type: () -> Iterator[sparse.csr_matrix]
+        """
+        Reads the scanned source, with columns that match the vocabulary.
+        """
+        if isinstance(self.__source, TraceStore):
+            for chunk in self.__store_chunks():
+                yield chunk
+        elif callable(self.__source):
+            for chunk in self.__trace_chunks(self.__source(), grow=False):
+                yield chunk
+        else:
+            if self.__spooled is None:
+                raise ValueError("source must be scanned before it is read")
+            num_columns = len(self.__vocabulary)
+            for fn in self.__spooled:
+                chunk = sparse.csr_matrix(sparse.load_npz(fn))
+                chunk.resize((chunk.shape[0], num_columns))
+                yield chunk
+
+    def close(self):
+        # type: () -> None
+        """
+        Removes any chunks that were spooled to disk.
+        """
+        if self.__spooled is not None:
+            shutil.rmtree(self.__dir_spool, ignore_errors=True)
+            self.__spooled = None
+
+
+def _fit_projection(chunks,         # type: Iterable[sparse.csr_matrix]
+                    preprocessor,   # type: Preprocessor
+                    n_components,   # type: int
+                    batch_size      # type: int
+                    ):              # type: (...) -> numpy.ndarray
+    """
+    Fits the projection via incremental PCA, one batch at a time. The
+    projection is not centered, which does not affect distances.
+    """
+    from sklearn.decomposition import IncrementalPCA
+    pca = IncrementalPCA(n_components=n_components)
+    batch_size = max(batch_size, n_components)
+    pending = []  # type: List[numpy.ndarray]
+    num_pending = 0
+    num_batches = 0
+    for chunk in chunks:
+        pending.append(preprocessor.transform(chunk).toarray())
+        num_pending += chunk.shape[0]
+        if num_pending >= batch_size:
+            pca.partial_fit(numpy.vstack(pending))
+            num_batches += 1
+            pending = []
+            num_pending = 0
+    # a final batch that is smaller than the number of components cannot be
+    # fit on its own, and is skipped unless nothing has been fit yet
+    if num_pending >= n_components or (pending and num_batches == 0):
+        pca.partial_fit(numpy.vstack(pending))
+        num_batches += 1
+    elif pending:
+        logger.debug("skipped final %d traces when fitting projection",
+                     num_pending)
+    logger.debug("fit projection onto %d components over %d batches",
+                 n_components, num_batches)
+    return pca.components_
+
+
+def reduce_traces(source,                           # type: Union[TraceStore, Callable[[], Iterable[Trace]], Iterable[Trace]]  # noqa: pycodestyle
+                  chunk_size=DEFAULT_CHUNK_SIZE,    # type: int
+                  min_variance=0.0,                 # type: float
+                  n_components=None,                # type: Optional[int]
+                  rows=None,                        # type: Optional[Sequence[int]]  # noqa: pycodestyle
+                  dir_spool=None                    # type: Optional[str]
+                  ):                                # type: (...) -> Tuple[Vocabulary, Preprocessor, Any]  # noqa: pycodestyle
+    """
+    Fits a vocabulary and preprocessor to a source of traces (see _Chunks),
+    holding at most chunk_size traces in memory at a time. If n_components
+    is None, the scaled signals are returned as a sparse matrix.
+
+    Returns:
+        a tuple of the form (vocabulary, preprocessor, matrix).
+    """
+    chunks = _Chunks(source, chunk_size, rows=rows, dir_spool=dir_spool)
+    try:
+        statistics = FeatureStatistics()
+        for chunk in chunks.scan():
+            statistics.update(chunk)
+        num_rows = statistics.num_rows
+        vocabulary = chunks.vocabulary
+        logger.debug("scanned %d traces with %d signals in chunks of %d",
+                     num_rows, len(vocabulary), chunk_size)
+        if num_rows == 0:
+            raise ValueError("no traces were provided")
+        preprocessor = Preprocessor.from_statistics(statistics, min_variance)
+
+        keep = preprocessor.keep
+        if n_components:
+            n_components = min(n_components, len(keep) - 1, num_rows - 1)
+        if n_components and n_components > 0:
+            components = _fit_projection(chunks, preprocessor, n_components,
+                                         batch_size=chunk_size)
+            preprocessor = Preprocessor(keep, preprocessor.scale, components)
+            matrix = numpy.vstack([preprocessor.transform(chunk)
+                                   for chunk in chunks])
+        else:
+            matrix = sparse.vstack([preprocessor.transform(chunk)
+                                    for chunk in chunks], format='csr')
+        logger.debug("reduced %d traces to %d features",
+                     matrix.shape[0], matrix.shape[1])
+        return vocabulary, preprocessor, matrix
+    finally:
+        chunks.close()
@@ -1,26 +1,41 @@
-__all__ = ['Trace']
+__all__ = ['Trace', 'convert_traces']
 
-from typing import Optional
 import logging
 import collections
+import hashlib
+import shutil
+import struct
 import tempfile
+import threading
+import time
 import os
 
-from start_core.attack import Attack
-from start_core.sitl import SITL
-from start_core.scenario import Scenario
-from start_core.mission import Mission
-from start_core.test import execute as execute_mission
+import numpy
+
+from .metrics import TraceMetrics, ChildWatcher
+
+# start_core is slow to import and is only needed to generate traces, and so
+# it is imported lazily by Trace.generate.
 
 logger = logging.getLogger(__name__)  # type: logging.Logger
 logger.setLevel(logging.DEBUG)
 
 VALGRIND_FLAGS_DEFAULT = \
     '--verbose --trace-children=yes --trace-children-skip=which,mavproxy,arduplane --tool=debgrind'
-#VALGRIND_FLAGS_DEFAULT = \
-#    '--tool=debgrind'
+# VALGRIND_FLAGS_DEFAULT = \
+#     '--tool=debgrind'
 VALGRIND_BINARY_DEFAULT = '/usr0/home/dskatz/Documents/customized-valgrind/valgrind-bin/bin/valgrind'
 
+# Binary traces consist of a fixed-size header, followed by a block of
+# little-endian float64 signal values, followed by a table of signal names
+# separated by newlines. The value block begins at a fixed offset so that it
+# may be memory-mapped directly.
+BINARY_EXTENSION = '.btrace'
+BINARY_MAGIC = b'STDBITRC'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<8sIIQQ')  # magic, version, flags, #signals, #bytes in names
+BINARY_DTYPE = numpy.dtype('<f8')
+
 
 class Trace(object):
     """
@@ -35,7 +50,14 @@ class Trace(object):
                  valgrind_binary=VALGRIND_BINARY_DEFAULT,   # type: str
                  valgrind_flags=VALGRIND_FLAGS_DEFAULT,     # type: str
                  attack=None,                               # type: Optional[Attack]
-                 fn_signals=None                            # type: Optional[str]
+                 fn_signals=None,                           # type: Optional[str]
+                 monitor=None,                              # type: Optional[Monitor]
+                 use_fifo=False,                            # type: bool
+                 dir_log=None,                              # type: Optional[str]
+                 cache=None,                                # type: Optional[TraceCache]
+                 metrics=None,                              # type: Optional[TraceMetrics]
+                 speedup=1,                                 # type: float
+                 normalize=False                            # type: bool
                  ):                                         # type: (...) -> Trace
         """
         Executes a given mission using a specified ArduPilot binary and
@@ -46,50 +68,197 @@ class Trace(object):
             mission: the mission that should be executed.
             valgrind_binary: the path to the Valgrind binary.
             valgrind_flags: the Valgrind flags that should be passed to the SITL.
+            monitor: an optional monitor (see start_dbi.monitor) that may
+                abort the mission, in which case its latest snapshot is used.
+            use_fifo: if True, the signals are read from a named pipe rather
+                than a file. Cannot be used with fn_signals or monitor.
+            dir_log: the directory for the Valgrind log (e.g., /dev/shm).
+            cache: an optional trace cache (see start_dbi.cache).
+            metrics: an optional TraceMetrics, which is attached to the trace.
+            speedup: the speedup at which the SITL is run.
+            normalize: if True, each signal is divided by the sum of all
+                signals (see Trace.normalized and start_dbi.acceleration).
         """
         logger.debug("obtaining an execution trace for mission [%s]", mission)
         using_temporary_signals = not fn_signals
+        if use_fifo and not using_temporary_signals:
+            raise ValueError("fn_signals cannot be used with use_fifo")
+        if use_fifo and monitor is not None:
+            raise ValueError("monitor cannot be used with use_fifo")
+
+        if metrics is None:
+            metrics = TraceMetrics()
 
+        if cache is not None:
+            with metrics.phase('cache_lookup'):
+                key = cache.key(sitl,
+                                mission,
+                                attack,
+                                valgrind_binary=valgrind_binary,
+                                valgrind_flags=valgrind_flags,
+                                timeout_mission=timeout_mission,
+                                timeout_connection=timeout_connection,
+                                timeout_liveness=timeout_liveness,
+                                speedup=speedup,
+                                normalize=normalize)
+                trace = cache.lookup(key)
+            if trace is not None:
+                logger.debug("obtained cached execution trace for mission [%s]", mission)  # noqa: pycodestyle
+                metrics.cached = True
+                metrics.speedup = speedup
+                trace.metrics = metrics
+                return trace
+
+        dir_tmp = None  # type: Optional[str]
+        reader = None  # type: Optional[_SignalsReader]
         try:
-            if using_temporary_signals:
-                _, fn_signals = tempfile.mkstemp('.signal', 'start')
-                logger.debug("saving signals data to temporary file: %s", fn_signals)  # noqa: pycodestyle
-            else:
-                logger.debug("saving signals data to specified file: %s", fn_signals)  # noqa: pycodestyle
-            log_fn = ("{}.log").format(fn_signals)
+            with metrics.phase('setup'):
+                if using_temporary_signals:
+                    dir_tmp = tempfile.mkdtemp('.signals', 'start')
+                    log_fn = os.path.join(dir_log if dir_log else dir_tmp,
+                                          "{}.log".format(os.path.basename(dir_tmp)))  # noqa: pycodestyle
+                    if use_fifo:
+                        fn_signals = os.path.join(dir_tmp, 'signals.fifo')
+                        os.mkfifo(fn_signals)
+                        reader = _SignalsReader(fn_signals)
+                        logger.debug("streaming signals data through named pipe: %s", fn_signals)  # noqa: pycodestyle
+                    else:
+                        fn_signals = os.path.join(dir_tmp, 'signals')
+                        logger.debug("saving signals data to temporary file: %s", fn_signals)  # noqa: pycodestyle
+                else:
+                    logger.debug("saving signals data to specified file: %s", fn_signals)  # noqa: pycodestyle
+                    log_fn = ("{}.log").format(fn_signals)
 
-            sitl_prefix = "{} --log-file='{}' {} --output-file='{}'"
-            sitl_prefix = sitl_prefix.format(valgrind_binary,
-                                             log_fn,
-                                             valgrind_flags,
-                                             fn_signals)
-            logger.debug("using SITL prefix: %s", sitl_prefix)
+                sitl_prefix = "{} --log-file='{}' {} --output-file='{}'"
+                sitl_prefix = sitl_prefix.format(valgrind_binary,
+                                                 log_fn,
+                                                 valgrind_flags,
+                                                 fn_signals)
+                logger.debug("using SITL prefix: %s", sitl_prefix)
+                from start_core.test import execute as execute_mission
 
             logger.debug("executing mission")
-            (passed, reason) = execute_mission(sitl,
-                                               mission,
-                                               attack,
-                                               speedup=1,
-                                               prefix=sitl_prefix,
-                                               timeout_mission=timeout_mission,
-                                               timeout_liveness=timeout_liveness,
-                                               timeout_connection=timeout_connection)
+            watcher = ChildWatcher(fn_signals)
+            if monitor is not None:
+                monitor.start(fn_signals)
+            watcher.start()
+            time_mission = time.time()
+            try:
+                with metrics.phase('mission'):
+                    (passed, reason) = execute_mission(sitl,
+                                                       mission,
+                                                       attack,
+                                                       speedup=speedup,
+                                                       prefix=sitl_prefix,
+                                                       timeout_mission=timeout_mission,
+                                                       timeout_liveness=timeout_liveness,
+                                                       timeout_connection=timeout_connection)
+            except Exception:
+                if monitor is None or not monitor.aborted:
+                    raise
+                logger.debug("mission was aborted by monitor")
+                (passed, reason) = (True, None)
+            finally:
+                watcher.stop()
+                metrics.record_child(watcher, time_mission, time.time())
+                if monitor is not None:
+                    monitor.stop()
+            if not passed:
+                logger.warning("mission [%s] failed: %s", mission, reason)
             logger.debug("finished executing mission")
 
-            logger.debug("attempting to read signals file")
-            trace = Trace.from_file(fn_signals)
-            logger.debug("successfully read signals file")
+            with metrics.phase('parse'):
+                if monitor is not None and monitor.aborted:
+                    logger.debug("using latest snapshot of signals file")
+                    trace = monitor.latest.trace
+                elif reader is not None:
+                    logger.debug("waiting for signals to be read from named pipe")  # noqa: pycodestyle
+                    trace = reader.finish()
+                    reader = None
+                    logger.debug("successfully read signals from named pipe")
+                else:
+                    logger.debug("attempting to read signals file")
+                    trace = Trace.from_file(fn_signals)
+                    logger.debug("successfully read signals file")
+
+                metrics.speedup = speedup
+                flight_time = metrics.flight_time()
+                if flight_time is not None:
+                    metrics.estimated_simulated_duration = flight_time * speedup  # noqa: pycodestyle
+                if normalize:
+                    logger.debug("normalizing trace by its total signal value")
+                    trace = trace.normalized()
         finally:
-            # os.remove(fn_signals)
-            pass
+            with metrics.phase('cleanup'):
+                if reader is not None:
+                    reader.cancel()
+                if dir_tmp is not None:
+                    logger.debug("removing temporary signals data")
+                    shutil.rmtree(dir_tmp, ignore_errors=True)
+                    if dir_log:
+                        try:
+                            os.remove(log_fn)
+                        except OSError:
+                            pass
 
+        if cache is not None and not (monitor is not None and monitor.aborted):
+            with metrics.phase('cache_add'):
+                cache.add(key, trace)
+
+        trace.metrics = metrics
         logger.debug("obtained execution trace for mission [%s]", mission)
         return trace
 
+    @staticmethod
+    def generate_many(jobs,             # type: Iterable[Dict[str, Any]]
+                      workers=None,     # type: Optional[int]
+                      isolate=None,     # type: Optional[Callable[[SITL, int], SITL]]  # noqa: pycodestyle
+                      dir_work=None     # type: Optional[str]
+                      ):                # type: (...) -> Iterator[TraceResult]
+        """
+        Generates execution traces for a sequence of jobs using a pool of
+        worker processes. See start_dbi.parallel.generate_many.
+        """
+        from .parallel import generate_many
+        return generate_many(jobs,
+                             workers=workers,
+                             isolate=isolate,
+                             dir_work=dir_work)
+
+    @staticmethod
+    def generate_async(sitl, mission, **kwargs):
+        # type: (SITL, Mission, **Any) -> Awaitable[Trace]
+        """
+        Returns a coroutine that generates an execution trace without
+        blocking the event loop. See start_dbi.aio.generate_async.
+        """
+        from .aio import generate_async
+        return generate_async(sitl, mission, **kwargs)
+
     @staticmethod
     def from_file(filename):
         # type: (str) -> Trace
+        """
+        Loads a trace from a given file. The format of the file (i.e., text or
+        binary) is detected automatically.
+        """
         logger.debug("loading trace from file: %s", filename)
+        try:
+            with open(filename, 'rb') as f:
+                is_binary = f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+        except IOError:
+            logger.exception("failed to open trace file: %s", filename)
+            raise
+        if is_binary:
+            trace = Trace._from_binary_file(filename)
+        else:
+            trace = Trace._from_text_file(filename)
+        logger.debug("loaded trace from file: %s", filename)
+        return trace
+
+    @staticmethod
+    def _from_text_file(filename):
+        # type: (str) -> Trace
         signal_to_value = collections.OrderedDict()
         try:
             with open(filename, 'r') as f:
@@ -102,13 +271,110 @@ class Trace(object):
         except Exception:
             logger.exception("an unexpected failure occurred when parsing trace file: %s", filename)  # noqa: pycodestyle
             raise
-        trace = Trace(signal_to_value)
-        logger.debug("loaded trace from file: %s", filename)
+        return Trace(signal_to_value)
+
+    @staticmethod
+    def _from_binary_file(filename):
+        # type: (str) -> Trace
+        """
+        Loads a binary trace file. The values of the trace are memory-mapped
+        rather than read into memory.
+        """
+        try:
+            with open(filename, 'rb') as f:
+                header = f.read(BINARY_HEADER.size)
+                _, version, _, num_signals, size_names = \
+                    BINARY_HEADER.unpack(header)
+                if version != BINARY_VERSION:
+                    msg = "unsupported binary trace version: {}"
+                    raise ValueError(msg.format(version))
+                f.seek(BINARY_HEADER.size + num_signals * BINARY_DTYPE.itemsize)
+                names = f.read(size_names).decode('utf-8')
+            if num_signals > 0:
+                signals = names.split('\n')
+                values = numpy.memmap(filename,
+                                      dtype=BINARY_DTYPE,
+                                      mode='r',
+                                      offset=BINARY_HEADER.size,
+                                      shape=(num_signals,))
+            else:
+                signals = []
+                values = numpy.zeros(0, dtype=BINARY_DTYPE)
+        except IOError:
+            logger.exception("failed to open trace file: %s", filename)
+            raise
+        except Exception:
+            logger.exception("an unexpected failure occurred when parsing trace file: %s", filename)  # noqa: pycodestyle
+            raise
+        if len(signals) != num_signals:
+            msg = "malformed binary trace file: {}".format(filename)
+            raise ValueError(msg)
+        return Trace.from_arrays(signals, values)
+
+    @staticmethod
+    def from_bytes(data):
+        # type: (bytes) -> Trace
+        """
+        Constructs a trace from the contents of a binary trace file (e.g., as
+        produced by to_bytes). The values of the trace are not copied.
+        """
+        magic, version, _, num_signals, size_names = \
+            BINARY_HEADER.unpack_from(data)
+        if magic != BINARY_MAGIC:
+            raise ValueError("not a binary trace")
+        if version != BINARY_VERSION:
+            msg = "unsupported binary trace version: {}"
+            raise ValueError(msg.format(version))
+        offset_names = BINARY_HEADER.size + num_signals * BINARY_DTYPE.itemsize
+        if len(data) < offset_names + size_names:
+            raise ValueError("malformed binary trace")
+        values = numpy.frombuffer(data,
+                                  dtype=BINARY_DTYPE,
+                                  count=num_signals,
+                                  offset=BINARY_HEADER.size)
+        names = data[offset_names:offset_names + size_names].decode('utf-8')
+        signals = names.split('\n') if num_signals > 0 else []
+        if len(signals) != num_signals:
+            raise ValueError("malformed binary trace")
+        return Trace.from_arrays(signals, values)
+
+    @staticmethod
+    def from_arrays(signals, values):
+        # type: (Sequence[str], Sequence[float]) -> Trace
+        """
+        Constructs a trace from a sequence of signal names and a corresponding
+        sequence of values. The values are not copied, allowing NumPy arrays
+        and memory maps to be used as the backing storage for the trace.
+        """
+        if len(signals) != len(values):
+            msg = "number of signals ({}) does not match number of values ({})"
+            raise ValueError(msg.format(len(signals), len(values)))
+        trace = Trace(collections.OrderedDict())
+        trace.__signals = list(signals)
+        trace.__values = values
         return trace
 
     def __init__(self, signal_to_value):
         # type: (collections.OrderedDict) -> None
-        self.__signal_to_value = signal_to_value
+        self.__signals = list(signal_to_value.keys())  # type: List[str]
+        self.__values = list(signal_to_value.values())  # type: Sequence[float]
+        self.__signal_to_index = None  # type: Optional[Dict[str, int]]
+        self.__metrics = None  # type: Optional[TraceMetrics]
+
+    @property
+    def metrics(self):
+        # type: () -> Optional[TraceMetrics]
+        """
+        The metrics that were recorded whilst this trace was generated, if
+        any. Metrics are saved next to the trace (see TraceMetrics) whenever
+        the trace is saved to a file.
+        """
+        return self.__metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        # type: (Optional[TraceMetrics]) -> None
+        self.__metrics = metrics
 
     @property
     def values(self):
@@ -117,7 +383,19 @@ class Trace(object):
         Returns a list of the values for the signals belonging to this trace,
         in the order that they were reported by Valgrind.
         """
-        return list(self.__signal_to_value.values())
+        if isinstance(self.__values, numpy.ndarray):
+            return self.__values.tolist()
+        return list(self.__values)
+
+    @property
+    def array(self):
+        # type: () -> numpy.ndarray
+        """
+        Returns the values for the signals belonging to this trace as a NumPy
+        array. No copy is made if the trace is backed by a NumPy array or
+        memory map (e.g., if the trace was loaded from a binary file).
+        """
+        return numpy.asarray(self.__values, dtype=numpy.float64)
 
     @property
     def signals(self):
@@ -125,16 +403,24 @@ class Trace(object):
         """
         Returns a list of the names of the signals contained within this trace.
         """
-        return list(self.__signal_to_value.keys())
+        return list(self.__signals)
 
-    def to_file(self, filename):
-        # type: (str) -> None
+    def to_file(self, filename, binary=None):
+        # type: (str, Optional[bool]) -> None
+        """
+        Saves this trace, and any metrics, to a given file. Unless specified,
+        the binary format is used if the filename ends with `.btrace`.
+        """
+        if binary is None:
+            binary = filename.endswith(BINARY_EXTENSION)
         logger.debug("saving trace to file: %s", filename)
-        contents = ["{} {}\n".format(n, v) for (n, v)
-                    in self.__signal_to_value.items()]
         try:
-            with open(filename, 'w') as f:
-                f.writelines(contents)
+            if binary:
+                self._to_binary_file(filename)
+            else:
+                self._to_text_file(filename)
+            if self.__metrics is not None:
+                self.__metrics.to_file(TraceMetrics.filename_for(filename))
         except IOError:
             logger.exception("failed to write trace to file: %s", filename)
             raise
@@ -143,9 +429,158 @@ class Trace(object):
             raise
         logger.debug("saved trace to file: %s", filename)
 
+    def normalized(self):
+        # type: () -> Trace
+        """
+        Returns a copy of this trace in which the value of each signal is
+        divided by the sum of all signals. Unlike a rate, the resulting share
+        of each signal does not depend on the simulated duration of the
+        mission, which is not known when the SITL falls behind its speedup.
+        """
+        total = float(self.array.sum())
+        if total <= 0:
+            raise ValueError("cannot normalize a trace without positive signals")  # noqa: pycodestyle
+        trace = Trace.from_arrays(self.__signals, self.array / total)
+        trace.metrics = self.__metrics
+        return trace
+
+    def _to_text_file(self, filename):
+        # type: (str) -> None
+        contents = ["{} {}\n".format(n, v) for (n, v)
+                    in zip(self.__signals, self.values)]
+        with open(filename, 'w') as f:
+            f.writelines(contents)
+
+    def to_bytes(self):
+        # type: () -> bytes
+        """
+        Returns the contents of the binary trace file for this trace.
+        """
+        names = '\n'.join(self.__signals).encode('utf-8')
+        values = numpy.asarray(self.__values, dtype=BINARY_DTYPE)
+        header = BINARY_HEADER.pack(BINARY_MAGIC,
+                                    BINARY_VERSION,
+                                    0,
+                                    len(self.__signals),
+                                    len(names))
+        return header + values.tobytes() + names
+
+    def digest(self):
+        # type: () -> str
+        """
+        Returns a SHA-256 digest of the signals and values of this trace,
+        which identifies the trace by its contents.
+        """
+        return hashlib.sha256(self.to_bytes()).hexdigest()
+
+    def _to_binary_file(self, filename):
+        # type: (str) -> None
+        # the trace is written to a temporary file that then replaces the
+        # given file, since the given file may be memory-mapped by a trace.
+        fn_tmp = filename + '.tmp'
+        with open(fn_tmp, 'wb') as f:
+            f.write(self.to_bytes())
+        os.rename(fn_tmp, filename)
+
     def __getitem__(self, name_signal):
         # type: (str) -> float
         """
         Fetches the value of a given signal.
         """
-        return self.__signal_to_value[name_signal]
+        if self.__signal_to_index is None:
+            self.__signal_to_index = \
+                {n: i for (i, n) in enumerate(self.__signals)}
+        return self.__values[self.__signal_to_index[name_signal]]
+
+
+class _SignalsReader(object):
+    """
+    Parses the signals that are written to a named pipe by Valgrind into a
+    trace, using a background thread.
+    """
+    def __init__(self, fn_fifo):
+        # type: (str) -> None
+        self.__fn_fifo = fn_fifo
+        self.__signal_to_value = collections.OrderedDict()
+        self.__error = None  # type: Optional[Exception]
+        self.__thread = threading.Thread(target=self.__read)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __read(self):
+        # type: () -> None
+        try:
+            with open(self.__fn_fifo, 'r') as f:
+                for line in f:
+                    name, val_as_string = line.strip().split()
+                    self.__signal_to_value[name] = float(val_as_string)
+        except Exception as err:
+            self.__error = err
+
+    def __unblock(self):
+        # type: () -> None
+        """
+        Ensures that the reader is not left waiting for a writer that never
+        opens the pipe (e.g., because the SITL failed to start), by briefly
+        opening the pipe for writing.
+        """
+        try:
+            fd = os.open(self.__fn_fifo, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            return
+        os.close(fd)
+
+    def finish(self, timeout=60.0):
+        # type: (float) -> Trace
+        """
+        Waits for the writer to close the pipe and returns the parsed trace.
+        """
+        self.__unblock()
+        self.__thread.join(timeout)
+        if self.__thread.is_alive():
+            raise IOError("timed out whilst reading signals from named pipe: {}".format(self.__fn_fifo))  # noqa: pycodestyle
+        if self.__error is not None:
+            logger.error("an unexpected failure occurred when parsing signals from named pipe: %s", self.__fn_fifo)  # noqa: pycodestyle
+            raise self.__error
+        return Trace(self.__signal_to_value)
+
+    def cancel(self):
+        # type: () -> None
+        """
+        Stops the reader without waiting for its result.
+        """
+        self.__unblock()
+        self.__thread.join(1.0)
+
+
+def convert_traces(directory,               # type: str
+                   output_directory=None,   # type: Optional[str]
+                   remove=False             # type: bool
+                   ):                       # type: (...) -> List[str]
+    """
+    Converts each text trace file (i.e., `.trace`) within a given directory
+    to the binary format, optionally removing the text files.
+
+    Returns:
+        a list of the names of the binary trace files that were written.
+    """
+    if output_directory is None:
+        output_directory = directory
+    if not os.path.isdir(output_directory):
+        os.makedirs(output_directory)
+
+    logger.debug("converting traces in directory: %s", directory)
+    filenames = []
+    for fn in sorted(os.listdir(directory)):
+        if not fn.endswith('.trace'):
+            continue
+        fn_text = os.path.join(directory, fn)
+        fn_binary = os.path.join(output_directory,
+                                 fn[:-len('.trace')] + BINARY_EXTENSION)
+        Trace.from_file(fn_text).to_file(fn_binary, binary=True)
+        filenames.append(fn_binary)
+        if remove:
+            os.remove(fn_text)
+    logger.debug("converted %d traces in directory: %s",
+                 len(filenames), directory)
+    return filenames
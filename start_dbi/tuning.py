@@ -0,0 +1,336 @@
+__all__ = ['TuningResult', 'tune', 'expand_grid', 'DEFAULT_GRID']
+
+from typing import Optional
+import collections
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import traceback
+
+import numpy
+from scipy import sparse
+from scipy.stats import rankdata
+
+from .features import Vocabulary, Preprocessor, Reservoir
+
+logger = logging.getLogger(__name__)  # type: logging.Logger
+logger.setLevel(logging.DEBUG)
+
+# the parameters of the one-class SVM that are searched by default
+DEFAULT_GRID = {
+    'kernel': ['rbf'],
+    'nu': [0.01, 0.05, 0.1, 0.2, 0.5],
+    'gamma': ['auto', 0.01, 0.1, 1.0]
+}
+
+# describes the outcome of a search: model is the best model, refit on the
+# nominal traces, params gives its SVM parameters, and table gives the scores
+# for every configuration, best first.
+TuningResult = collections.namedtuple('TuningResult',
+                                      ['model', 'params', 'table'])
+
+# the parameters of the one-class SVM that describe its kernel
+KERNEL_PARAMS = ('kernel', 'gamma', 'coef0', 'degree')
+
+# the matrices shared by the current worker process, indexed by name
+_worker_matrices = {}  # type: Dict[str, Any]
+
+
+def expand_grid(grid):
+    # type: (Union[Dict[str, Sequence[Any]], Sequence[Dict[str, Sequence[Any]]]]) -> List[Dict[str, Any]]  # noqa: pycodestyle
+    """
+    Expands a parameter grid, given either as a dictionary that maps each
+    parameter to a sequence of candidate values or as a sequence of such
+    dictionaries, into the list of configurations that it describes.
+    """
+    if isinstance(grid, dict):
+        grid = [grid]
+    configurations = []  # type: List[Dict[str, Any]]
+    for subgrid in grid:
+        names = sorted(subgrid)
+        for values in itertools.product(*(subgrid[n] for n in names)):
+            configurations.append(dict(zip(names, values)))
+    return configurations
+
+
+def _save_matrix(matrix, prefix):
+    # type: (Any, str) -> None
+    """
+    Saves a dense or sparse matrix to a set of .npy files, which share a
+    given prefix, so that it can be memory-mapped by other processes.
+    """
+    if sparse.issparse(matrix):
+        matrix = sparse.csr_matrix(matrix)
+        numpy.save(prefix + '.data.npy', matrix.data)
+        numpy.save(prefix + '.indices.npy', matrix.indices)
+        numpy.save(prefix + '.indptr.npy', matrix.indptr)
+        numpy.save(prefix + '.shape.npy', numpy.array(matrix.shape))
+    else:
+        numpy.save(prefix + '.npy', numpy.ascontiguousarray(matrix,
+                                                            dtype=numpy.float64))  # noqa: pycodestyle
+
+
+def _load_matrix(prefix):
+    # type: (str) -> Any
+    """
+    Memory-maps a matrix that was saved by _save_matrix.
+    """
+    if os.path.exists(prefix + '.npy'):
+        return numpy.load(prefix + '.npy', mmap_mode='r')
+    shape = tuple(numpy.load(prefix + '.shape.npy'))
+    return sparse.csr_matrix((numpy.load(prefix + '.data.npy', mmap_mode='r'),
+                              numpy.load(prefix + '.indices.npy', mmap_mode='r'),  # noqa: pycodestyle
+                              numpy.load(prefix + '.indptr.npy', mmap_mode='r')),  # noqa: pycodestyle
+                             shape=shape, copy=False)
+
+
+def _initialize_worker(prefixes):
+    # type: (Dict[str, str]) -> None
+    """
+    Prepares a worker process by memory-mapping the shared matrices, so that
+    every worker reads the same copy of each matrix from the page cache.
+    """
+    _worker_matrices.clear()
+    for (name, prefix) in prefixes.items():
+        _worker_matrices[name] = _load_matrix(prefix)
+    logger.debug("initialized tuning worker %d", os.getpid())
+
+
+def _auc(scores_nominal, scores_attack):
+    # type: (numpy.ndarray, numpy.ndarray) -> float
+    """
+    Returns the probability that a random attack trace is given a lower
+    decision function score than a random nominal trace (i.e., the area under
+    the ROC curve), with ties counted as one half.
+    """
+    ranks = rankdata(numpy.concatenate([-scores_nominal, -scores_attack]))
+    num_nominal = len(scores_nominal)
+    num_attack = len(scores_attack)
+    rank_sum = ranks[num_nominal:].sum()
+    return float((rank_sum - num_attack * (num_attack + 1) / 2.0)
+                 / (num_nominal * num_attack))
+
+
+def _evaluate(job):
+    # type: (Tuple[int, Dict[str, Any], str]) -> Dict[str, Any]
+    """
+    Fits a one-class SVM with a given configuration to the shared nominal
+    matrix (or precomputed kernel) with a given suffix, and scores it against
+    the holdout and attack matrices.
+    """
+    index, params, suffix = job
+    row = {'index': index, 'params': params}  # type: Dict[str, Any]
+    try:
+        from sklearn.svm import OneClassSVM
+        time_start = time.time()
+        svm_params = dict(params)
+        if suffix:
+            for name in KERNEL_PARAMS:
+                svm_params.pop(name, None)
+            svm_params['kernel'] = 'precomputed'
+        svm = OneClassSVM(**svm_params)
+        svm.fit(_worker_matrices['nominal' + suffix])
+        row['fit_time'] = time.time() - time_start
+        scores_holdout = numpy.ravel(svm.decision_function(_worker_matrices['holdout' + suffix]))  # noqa: pycodestyle
+        scores_attack = numpy.ravel(svm.decision_function(_worker_matrices['attack' + suffix]))  # noqa: pycodestyle
+        false_positive_rate = float((scores_holdout < 0).mean())
+        detection_rate = float((scores_attack < 0).mean())
+        row.update(false_positive_rate=false_positive_rate,
+                   detection_rate=detection_rate,
+                   balanced_accuracy=(detection_rate + 1.0 - false_positive_rate) / 2.0,  # noqa: pycodestyle
+                   auc=_auc(scores_holdout, scores_attack),
+                   support_vectors=len(svm.support_),
+                   error=None)
+    except Exception:
+        logger.exception("failed to evaluate configuration: %s", params)
+        row['error'] = traceback.format_exc()
+    return row
+
+
+def _rank_key(row, max_false_positive_rate):
+    # type: (Dict[str, Any], Optional[float]) -> Tuple[Any, ...]
+    """
+    Orders configurations from best to worst. Configurations that failed, or
+    that exceed the false positive budget, come last. Ties are broken in
+    favour of fewer support vectors, which are cheaper to score.
+    """
+    if row['error'] is not None:
+        return (2, 0.0, 0.0, 0, row['index'])
+    if max_false_positive_rate is not None:
+        within_budget = row['false_positive_rate'] <= max_false_positive_rate
+        return (0 if within_budget else 1,
+                -row['detection_rate'],
+                row['false_positive_rate'],
+                row['support_vectors'],
+                row['index'])
+    return (0,
+            -row['balanced_accuracy'],
+            -row['auc'],
+            row['support_vectors'],
+            row['index'])
+
+
+def tune(nominal,                       # type: Iterable[Trace]
+         holdout,                       # type: Iterable[Trace]
+         attack_traces,                 # type: Iterable[Trace]
+         grid=None,                     # type: Optional[Union[Dict[str, Sequence[Any]], Sequence[Dict[str, Sequence[Any]]]]]  # noqa: pycodestyle
+         workers=None,                  # type: Optional[int]
+         min_variance=0.0,              # type: float
+         n_components=None,             # type: Optional[int]
+         max_false_positive_rate=None,  # type: Optional[float]
+         dir_work=None,                 # type: Optional[str]
+         kernel_cache=None              # type: Optional[KernelCache]
+         ):                             # type: (...) -> TuningResult
+    """
+    Searches a grid of one-class SVM parameters (see expand_grid), in a pool
+    of workers that memory-map shared matrices, for the configuration that
+    best separates held-out nominal traces from attack traces.
+
+    Parameters:
+        nominal: the nominal traces used to train each model.
+        holdout: held-out nominal traces, for the false positive rate.
+        attack_traces: attack traces, for the detection rate.
+        grid: the grid that is searched. Defaults to DEFAULT_GRID.
+        workers: the number of worker processes.
+        min_variance: passed to Preprocessor.fit.
+        n_components: passed to Preprocessor.fit.
+        max_false_positive_rate: if given, configurations within this false
+            positive budget are ranked by detection rate, rather than by
+            balanced accuracy and AUC.
+        dir_work: the directory in which the shared matrices are saved.
+        kernel_cache: an optional kernel cache, whose features are used.
+
+    Returns:
+        the best model, its parameters, and the table of scores for every
+        configuration, ordered from best to worst.
+    """
+    from .model import Model
+    configurations = expand_grid(DEFAULT_GRID if grid is None else grid)
+    if not configurations:
+        raise ValueError("parameter grid is empty")
+
+    nominal = list(nominal)
+    if kernel_cache is None:
+        vocabulary = Vocabulary()
+        matrix = vocabulary.fit_transform(nominal)
+        preprocessor = Preprocessor.fit(matrix,
+                                        min_variance=min_variance,
+                                        n_components=n_components)
+        matrices = {'nominal': preprocessor.transform(matrix),
+                    'holdout': preprocessor.transform(vocabulary.transform(holdout)),  # noqa: pycodestyle
+                    'attack': preprocessor.transform(vocabulary.transform(attack_traces))}  # noqa: pycodestyle
+        jobs = [(i, c, '') for (i, c) in enumerate(configurations)]
+    else:
+        matrices, jobs = _precomputed_matrices(kernel_cache, nominal, holdout,
+                                               attack_traces, configurations)
+    sizes = {n: m.shape[0] for (n, m) in matrices.items()}
+    for name in ('holdout', 'attack'):
+        if not any(s > 0 for (n, s) in sizes.items() if n.startswith(name)):
+            raise ValueError("no {} traces were given".format(name))
+    logger.debug("tuning %d configurations on %d nominal traces",
+                 len(configurations), len(nominal))
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(min(workers, len(configurations)), 1)
+    using_temporary_dir = not dir_work
+    if using_temporary_dir:
+        dir_work = tempfile.mkdtemp(prefix='start_dbi.tune.')
+    elif not os.path.isdir(dir_work):
+        os.makedirs(dir_work)
+    try:
+        prefixes = {}  # type: Dict[str, str]
+        for (name, m) in matrices.items():
+            prefixes[name] = os.path.join(dir_work, name)
+            _save_matrix(m, prefixes[name])
+        del matrices
+
+        if workers == 1:
+            _initialize_worker(prefixes)
+            table = [_evaluate(job) for job in jobs]
+            _worker_matrices.clear()
+        else:
+            pool = multiprocessing.Pool(workers,
+                                        initializer=_initialize_worker,
+                                        initargs=(prefixes,))
+            try:
+                table = []
+                for row in pool.imap_unordered(_evaluate, jobs):
+                    logger.debug("evaluated configuration %d of %d: %s",
+                                 len(table) + 1, len(configurations),
+                                 row['params'])
+                    table.append(row)
+                pool.close()
+            except BaseException:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+
+        table.sort(key=lambda r: _rank_key(r, max_false_positive_rate))
+        best = table[0]
+        if best['error'] is not None:
+            raise ValueError("every configuration failed:\n{}".format(best['error']))  # noqa: pycodestyle
+        logger.debug("best configuration: %s (false positive rate: %.3f; detection rate: %.3f)",  # noqa: pycodestyle
+                     best['params'], best['false_positive_rate'],
+                     best['detection_rate'])
+
+        if kernel_cache is None:
+            from sklearn.svm import OneClassSVM
+            svm = OneClassSVM(**best['params'])
+            matrix = _load_matrix(prefixes['nominal'])
+            svm.fit(matrix)
+            reservoir = Reservoir()
+            reservoir.add(matrix)
+            model = Model(svm, vocabulary, preprocessor, reservoir=reservoir)
+        else:
+            model = Model.build(nominal, kernel_cache=kernel_cache,
+                                **best['params'])
+    finally:
+        if using_temporary_dir:
+            shutil.rmtree(dir_work, ignore_errors=True)
+
+    for row in table:
+        del row['index']
+    return TuningResult(model, dict(best['params']), table)
+
+
+def _precomputed_matrices(kernel_cache,     # type: KernelCache
+                          nominal,          # type: Sequence[Trace]
+                          holdout,          # type: Iterable[Trace]
+                          attack_traces,    # type: Iterable[Trace]
+                          configurations    # type: List[Dict[str, Any]]
+                          ):                # type: (...) -> Tuple[Dict[str, numpy.ndarray], List[Tuple[int, Dict[str, Any], str]]]  # noqa: pycodestyle
+    """
+    Obtains the kernel between the nominal, holdout and attack traces and
+    the nominal traces, for each distinct set of kernel parameters within a
+    given list of configurations. Only the nominal traces are added to the
+    given kernel cache.
+
+    Returns:
+        the shared matrices, indexed by name, and the job for each
+        configuration, which gives the suffix of its matrices.
+    """
+    rows = kernel_cache.add(nominal)
+    holdout = list(holdout)
+    attack_traces = list(attack_traces)
+
+    matrices = {}  # type: Dict[str, numpy.ndarray]
+    jobs = []  # type: List[Tuple[int, Dict[str, Any], str]]
+    suffixes = {}  # type: Dict[str, str]
+    for (index, configuration) in enumerate(configurations):
+        kernel = {n: v for (n, v) in configuration.items()
+                  if n in KERNEL_PARAMS}
+        key = repr(sorted(kernel_cache.params(**kernel).items()))
+        if key not in suffixes:
+            suffix = '.{}'.format(len(suffixes))
+            suffixes[key] = suffix
+            matrices['nominal' + suffix] = kernel_cache.gram(rows, **kernel)
+            matrices['holdout' + suffix] = kernel_cache.cross(holdout, rows, **kernel)  # noqa: pycodestyle
+            matrices['attack' + suffix] = kernel_cache.cross(attack_traces, rows, **kernel)  # noqa: pycodestyle
+        jobs.append((index, configuration, suffixes[key]))
+    return matrices, jobs
@@ -0,0 +1,15 @@
+import numpy
+import pytest
+
+from start_dbi.trace import Trace
+
+
+@pytest.fixture
+def gaussian_traces():
+    # synthetic traces whose signals, s0, s1, ..., are drawn from a normal
+    # distribution about 100 (plus a given shift)
+    def generate(rng, num_traces, shift=0.0, num_signals=10):
+        signals = ['s{}'.format(i) for i in range(num_signals)]
+        values = rng.normal(100.0 + shift, 10.0, size=(num_traces, num_signals))  # noqa: pycodestyle
+        return [Trace.from_arrays(signals, numpy.abs(v)) for v in values]
+    return generate
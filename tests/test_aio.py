@@ -0,0 +1,58 @@
+import asyncio
+
+import numpy
+import pytest
+
+from start_dbi import aio
+from start_dbi.model import Model
+from start_dbi.parallel import PORT_STRIDE
+from start_dbi.trace import Trace
+
+
+class Sitl(object):
+    def __init__(self, port=5760):
+        self.port = port
+
+
+class Portless(object):
+    pass
+
+
+def test_concurrent_runs_use_distinct_ports(monkeypatch):
+    running = set()
+    ports = []
+
+    async def generate_async(sitl, mission, timeout=None, **kwargs):
+        assert sitl.port not in running
+        running.add(sitl.port)
+        ports.append(sitl.port)
+        await asyncio.sleep(0.01)
+        running.remove(sitl.port)
+        return mission
+
+    monkeypatch.setattr(aio, 'generate_async', generate_async)
+    jobs = [dict(sitl=Sitl(), mission=i) for i in range(12)]
+    results = asyncio.run(aio.generate_many_async(jobs, concurrency=4))
+    assert [r.trace for r in results] == list(range(12))
+    assert all(r.error is None for r in results)
+    assert set(ports) == {5760 + i * PORT_STRIDE for i in range(4)}
+    assert jobs[0]['sitl'].port == 5760
+
+
+def test_concurrent_runs_require_ports():
+    jobs = [dict(sitl=Portless(), mission=None)]
+    with pytest.raises(ValueError):
+        asyncio.run(aio.generate_many_async(jobs, concurrency=2))
+
+
+def test_check_async_matches_check():
+    rng = numpy.random.RandomState(0)
+    signals = ['s{}'.format(i) for i in range(5)]
+    values = numpy.abs(rng.normal(100.0, 10.0, size=(100, len(signals))))
+    traces = [Trace.from_arrays(signals, v) for v in values]
+    model = Model.build(traces, nu=0.1)
+    attack = Trace.from_arrays(signals, values[0] + 100.0)
+
+    async def check():
+        return await model.check_async(attack)
+    assert asyncio.run(check())[0] is True
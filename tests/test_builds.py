@@ -0,0 +1,59 @@
+import contextlib
+import fcntl
+import os
+import subprocess
+
+import pytest
+
+from start_dbi.builds import BuildCache
+
+
+class FakeScenario(object):
+    def __init__(self, vehicle):
+        self.vehicle = vehicle
+
+    @contextlib.contextmanager
+    def build(self, dir_source, filename_patch=None):
+        fn_binary = os.path.join(dir_source, self.vehicle)
+        with open(os.path.join(dir_source, 'builds.log'), 'a') as f:
+            f.write(self.vehicle + '\n')
+        with open(fn_binary, 'w') as f:
+            f.write('binary')
+        yield {'binary': fn_binary}
+
+
+def checkout(directory):
+    os.makedirs(directory)
+    git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@test']
+    subprocess.check_call(['git', 'init', '--quiet'], cwd=directory)
+    with open(os.path.join(directory, 'README'), 'w') as f:
+        f.write('ardupilot')
+    subprocess.check_call(['git', 'add', 'README'], cwd=directory)
+    subprocess.check_call(git + ['commit', '--quiet', '-m', 'base'],
+                          cwd=directory)
+    return directory
+
+
+def test_build_is_cached_and_shared(tmp_path):
+    dir_cache = str(tmp_path / 'builds')
+    cache = BuildCache(dir_cache, checkout(str(tmp_path / 'ardupilot')))
+    scenario = FakeScenario('arducopter')
+    key = cache.key(cache.revision(), None, scenario)
+
+    for _ in range(2):
+        with cache.build(scenario) as sitl:
+            assert os.path.isfile(sitl['binary'])
+            # the entry is shared, rather than held exclusively, whilst in use
+            with open(os.path.join(dir_cache, key + '.lock'), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                with pytest.raises((IOError, OSError)):
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    fn_log = os.path.join(os.path.dirname(sitl['binary']), 'builds.log')
+    with open(fn_log) as f:
+        assert f.read().split() == ['arducopter']
+
+    with cache.build(FakeScenario('arduplane')) as sitl:
+        assert sitl['binary'].endswith('arduplane')
+    stats = cache.stats
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 2, 2)
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from start_dbi.cache import TraceCache, _fingerprint
+
+
+class Vehicle(object):
+    def __init__(self, name, port=5760):
+        self.name = name
+        self.port = port
+        self.options = {'speedup': 1, 'home': (1.0, 2.0)}
+        self.owner = self
+
+
+class Point(object):
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+def key(vehicle):
+    return TraceCache.key(vehicle, Point(1, 2), None, 'valgrind', '--flags',
+                          600, 60, 15)
+
+
+def test_fingerprint_does_not_depend_on_addresses():
+    assert _fingerprint(Vehicle('copter')) == \
+        _fingerprint(Vehicle('copter', port=5770))
+    assert _fingerprint(Vehicle('copter')) != _fingerprint(Vehicle('plane'))
+    assert _fingerprint(Point(1, 2)) == ['Point', [['x', 1], ['y', 2]]]
+    assert _fingerprint(Point(1, 2)) != _fingerprint(Point(2, 1))
+    assert _fingerprint({3, 1, 2}) == [1, 2, 3]
+    assert 'object at 0x' not in repr(_fingerprint(Vehicle('copter')))
+
+
+def test_key_is_stable_across_processes():
+    script = ('import sys; sys.path[:0] = {!r}; '
+              'from test_cache import Vehicle, key; '
+              'print(key(Vehicle("copter")))').format(sys.path)
+    output = subprocess.check_output([sys.executable, '-c', script],
+                                     cwd=os.path.dirname(__file__))
+    assert output.decode('utf-8').strip() == key(Vehicle('copter'))
+
+
+def test_deeply_nested_objects_cannot_be_fingerprinted():
+    nested = []
+    for _ in range(10):
+        nested = [nested]
+    with pytest.raises(ValueError):
+        _fingerprint(nested)
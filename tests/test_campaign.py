@@ -0,0 +1,93 @@
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+from start_dbi.campaign import Campaign, _is_dead
+
+
+def square(spec):
+    if spec.get('fail'):
+        raise RuntimeError("failed")
+    return spec['x'] ** 2
+
+
+def jobs(n):
+    return [('job/{}'.format(i), {'x': i}) for i in range(n)]
+
+
+def test_resume_skips_known_jobs(tmp_path):
+    filename = str(tmp_path / 'campaign.db')
+    campaign = Campaign(filename, backoff=0.0)
+    assert campaign.add_many(jobs(3)) == 3
+    claimed = campaign.claim()
+    campaign.complete(claimed[0], square(claimed[2]))
+    campaign.close()
+
+    # the campaign is resumed by enumerating its jobs again
+    campaign = Campaign(filename, backoff=0.0)
+    assert campaign.add_many(jobs(5)) == 2
+    assert campaign.work(square) == 4
+    results = {j['key']: j['result'] for j in campaign.jobs()}
+    assert results == {'job/{}'.format(i): i ** 2 for i in range(5)}
+
+
+def test_failed_jobs_are_retried(tmp_path):
+    campaign = Campaign(str(tmp_path / 'campaign.db'), max_attempts=2,
+                        backoff=0.0)
+    campaign.add('bad', {'x': 1, 'fail': True})
+    campaign.work(square)
+    failed, = campaign.jobs(status='failed')
+    assert failed['attempts'] == 2
+    assert 'RuntimeError' in failed['error']
+    assert campaign.retry_failed() == 1
+    assert campaign.stats()['pending'] == 1
+
+
+def test_run_with_workers(tmp_path):
+    campaign = Campaign(str(tmp_path / 'campaign.db'), backoff=0.0)
+    campaign.add_many(jobs(6))
+    stats = campaign.run(square, workers=2)
+    assert stats['done'] == 6
+    assert sorted(j['result'] for j in campaign.jobs()) == \
+        [i ** 2 for i in range(6)]
+
+
+def test_recovers_jobs_of_dead_workers(tmp_path):
+    campaign = Campaign(str(tmp_path / 'campaign.db'), backoff=0.0)
+    campaign.add_many(jobs(1))
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    owner = '{}:{}'.format(socket.gethostname(), process.pid)
+    assert _is_dead(owner)
+    campaign.claim()
+    db = campaign._Campaign__connect()
+    db.execute("UPDATE jobs SET owner = ?", (owner,))
+    assert campaign.work(square) == 1
+    assert campaign.stats()['done'] == 1
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self'), reason="requires procfs")  # noqa: pycodestyle
+def test_zombies_are_dead():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    try:
+        os.kill(process.pid, 0)
+        # wait for the child to exit without reaping it
+        while True:
+            with open('/proc/{}/stat'.format(process.pid)) as f:
+                if f.read().rpartition(')')[2].split()[0] == 'Z':
+                    break
+        assert _is_dead('{}:{}'.format(socket.gethostname(), process.pid))
+    finally:
+        process.wait()
+    assert not _is_dead('{}:{}'.format(socket.gethostname(), os.getpid()))
+
+
+def test_run_with_workers_and_relative_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    campaign = Campaign('campaign.db', backoff=0.0)
+    assert campaign.filename == str(tmp_path / 'campaign.db')
+    campaign.add_many(jobs(4))
+    assert campaign.run(square, workers=2)['done'] == 4
@@ -0,0 +1,50 @@
+import numpy
+import pytest
+from scipy import sparse
+from sklearn.svm import OneClassSVM
+
+from start_dbi import compact
+from start_dbi.model import Model
+
+
+@pytest.mark.parametrize('kernel', ['rbf', 'linear', 'poly', 'sigmoid'])
+def test_scorer_matches_svm(kernel):
+    rng = numpy.random.RandomState(0)
+    train = rng.normal(size=(200, 8))
+    test = rng.normal(scale=1.5, size=(50, 8))
+    svm = OneClassSVM(kernel=kernel, gamma=0.1, coef0=0.5, nu=0.2).fit(train)
+    scorer = compact.SupportVectorScorer.from_svm(svm)
+    expected = svm.decision_function(test)
+    numpy.testing.assert_allclose(scorer.decision_function(test), expected,
+                                  rtol=1e-6, atol=1e-8)
+    numpy.testing.assert_allclose(
+        scorer.decision_function(sparse.csr_matrix(test)), expected,
+        rtol=1e-6, atol=1e-8)
+    numpy.testing.assert_array_equal(scorer.predict(test), svm.predict(test))
+
+
+def test_saved_model_matches_model(tmp_path, gaussian_traces):
+    rng = numpy.random.RandomState(1)
+    traces = gaussian_traces(rng, 200)
+    tests = gaussian_traces(rng, 100) + gaussian_traces(rng, 20, shift=50.0)
+    filename = str(tmp_path / 'model.svm')
+    for params in ({'nu': 0.1}, {'nu': 0.2, 'n_components': 4}):
+        model = Model.build(traces, **params)
+        expected = model.check_many(tests)
+        model.to_file(filename)
+        assert compact.is_compact(filename)
+        verdicts, scores = Model.from_file(filename).check_many(tests)
+        numpy.testing.assert_allclose(scores, expected[1], atol=1e-8)
+        numpy.testing.assert_array_equal(verdicts, expected[0])
+
+
+def test_write_and_read_arrays(tmp_path):
+    filename = str(tmp_path / 'arrays')
+    arrays = {'a': numpy.arange(10, dtype=numpy.float64),
+              'b': numpy.arange(6, dtype=numpy.int32).reshape(2, 3)}
+    compact.write(filename, {'name': 'example'}, arrays)
+    description, loaded = compact.read(filename)
+    assert description['name'] == 'example'
+    for name in arrays:
+        numpy.testing.assert_array_equal(loaded[name], arrays[name])
+        assert loaded[name].dtype == arrays[name].dtype
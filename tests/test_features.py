@@ -0,0 +1,57 @@
+import numpy
+from scipy import sparse
+
+from start_dbi.features import FeatureStatistics, Preprocessor
+from start_dbi.model import Model
+from start_dbi.trace import Trace
+
+
+def test_identical_traces():
+    traces = [Trace.from_arrays(['a', 'b'], [3, 7]) for _ in range(10)]
+    model = Model.build(traces)
+    assert len(model.preprocessor.keep) == 1
+    verdicts, scores = model.check_many(traces)
+    assert verdicts.shape == (10,)
+
+
+def test_constant_and_zero_signals():
+    matrix = sparse.csr_matrix(numpy.array([[0.0, 5.0], [0.0, 5.0]]))
+    preprocessor = Preprocessor.fit(matrix)
+    numpy.testing.assert_array_equal(preprocessor.keep, [1])
+    numpy.testing.assert_allclose(preprocessor.transform(matrix).toarray(), 1.0)  # noqa: pycodestyle
+
+    zeros = numpy.zeros((3, 4))
+    preprocessor = Preprocessor.fit(zeros)
+    assert len(preprocessor.keep) == 1
+    assert preprocessor.transform(zeros).shape == (3, 1)
+
+
+def test_projection_needs_two_signals():
+    rng = numpy.random.RandomState(0)
+    matrix = numpy.hstack([rng.random_sample((20, 1)), numpy.ones((20, 3))])
+    preprocessor = Preprocessor.fit(matrix, n_components=5)
+    assert preprocessor.components is None
+    numpy.testing.assert_array_equal(preprocessor.keep, [0])
+
+    traces = [Trace.from_arrays(['a', 'b', 'c'], [i, 1, 2]) for i in range(20)]  # noqa: pycodestyle
+    model = Model.build(traces, n_components=2)
+    assert model.preprocessor.components is None
+
+
+def test_projection():
+    rng = numpy.random.RandomState(1)
+    matrix = rng.random_sample((30, 8))
+    preprocessor = Preprocessor.fit(matrix, n_components=3)
+    assert preprocessor.transform(matrix).shape == (30, 3)
+
+
+def test_statistics_match_dense():
+    rng = numpy.random.RandomState(2)
+    matrix = rng.random_sample((50, 6))
+    statistics = FeatureStatistics()
+    statistics.update(sparse.csr_matrix(matrix[:20, :4]))
+    statistics.update(matrix[20:])
+    expected = numpy.vstack([numpy.hstack([matrix[:20, :4], numpy.zeros((20, 2))]),  # noqa: pycodestyle
+                             matrix[20:]])
+    numpy.testing.assert_allclose(statistics.mean, expected.mean(axis=0))
+    numpy.testing.assert_allclose(statistics.max_abs, expected.max(axis=0))
@@ -0,0 +1,110 @@
+import numpy
+import pytest
+from sklearn.metrics.pairwise import rbf_kernel
+
+from start_dbi.kernels import KernelCache, kernel_params
+from start_dbi.model import Model
+
+
+def test_kernel_params():
+    assert kernel_params(gamma='auto', num_features=4)['gamma'] == 0.25
+    assert kernel_params(num_features=4, variance=0.5)['gamma'] == 0.5
+    assert kernel_params(gamma=0.3)['gamma'] == 0.3
+    with pytest.raises(ValueError):
+        kernel_params(num_features=4)
+    with pytest.raises(ValueError):
+        kernel_params(kernel='precomputed')
+
+
+def test_gram_is_extended_incrementally(tmp_path, gaussian_traces):
+    rng = numpy.random.RandomState(0)
+    traces = gaussian_traces(rng, 50)
+    cache = KernelCache.create(str(tmp_path / 'kernels'), traces[:30])
+    first = cache.gram(gamma=0.1)
+    assert first.shape == (30, 30)
+    rows = cache.add(traces)
+    numpy.testing.assert_array_equal(rows, numpy.arange(50))
+    assert len(cache.add(traces[:10])) == 10
+    gram = cache.gram(gamma=0.1)
+    features = cache.features()
+    numpy.testing.assert_allclose(gram, rbf_kernel(features, gamma=0.1))
+    numpy.testing.assert_allclose(gram[:30, :30], first)
+    subset = numpy.array([3, 40, 7])
+    numpy.testing.assert_allclose(cache.gram(subset, gamma=0.1),
+                                  gram[numpy.ix_(subset, subset)])
+    # the cache is shared with other processes via the directory
+    reopened = KernelCache(str(tmp_path / 'kernels'))
+    numpy.testing.assert_allclose(reopened.gram(gamma=0.1), gram)
+
+
+def test_cached_model_matches_model(tmp_path, gaussian_traces):
+    rng = numpy.random.RandomState(1)
+    traces = gaussian_traces(rng, 200)
+    tests = gaussian_traces(rng, 100) + gaussian_traces(rng, 20, shift=50.0)
+    cache = KernelCache.create(str(tmp_path / 'kernels'), traces)
+    for params in ({'nu': 0.1}, {'nu': 0.3, 'gamma': 'auto'}):
+        expected = Model.build(traces, **params).check_many(tests)
+        cached = Model.build(traces, kernel_cache=cache, **params)
+        verdicts, scores = cached.check_many(tests)
+        numpy.testing.assert_allclose(scores, expected[1], atol=1e-4)
+        assert (verdicts == expected[0]).mean() > 0.98
+
+
+def test_cross_does_not_add_traces(tmp_path, gaussian_traces):
+    rng = numpy.random.RandomState(2)
+    traces = gaussian_traces(rng, 40)
+    others = gaussian_traces(rng, 15, shift=20.0)
+    cache = KernelCache.create(str(tmp_path / 'kernels'), traces)
+    rows = numpy.arange(10, 40)
+    params = cache.params()
+    cross = cache.cross(others, rows)
+    assert len(cache) == 40
+    numpy.testing.assert_allclose(
+        cross, rbf_kernel(cache.transform(others), cache.features(rows),
+                          gamma=params['gamma']))
+    assert cache.cross([], rows).shape == (0, 30)
+
+
+def test_tuning_only_caches_nominal_traces(tmp_path, gaussian_traces):
+    rng = numpy.random.RandomState(3)
+    nominal = gaussian_traces(rng, 60)
+    holdout = gaussian_traces(rng, 20)
+    attacks = gaussian_traces(rng, 20, shift=50.0)
+    cache = KernelCache.create(str(tmp_path / 'kernels'), nominal)
+    Model.tune(nominal, holdout, attacks, grid={'nu': [0.1, 0.2]},
+               workers=1, dir_work=str(tmp_path / 'work'), kernel_cache=cache)
+    assert len(cache) == 60
+
+
+def test_scale_gram_is_extended_incrementally(tmp_path, gaussian_traces):
+    import glob
+    import json
+    import os
+    rng = numpy.random.RandomState(4)
+    traces = gaussian_traces(rng, 291)
+    directory = str(tmp_path / 'kernels')
+    cache = KernelCache.create(directory, traces[:290])
+    first = cache.gram()
+    gamma = cache.params()['gamma']
+    cache.add(traces[290:])
+    gram = cache.gram()
+    assert cache.params()['gamma'] == gamma
+    assert gram.shape == (291, 291)
+    numpy.testing.assert_allclose(gram[:290, :290], first)
+    numpy.testing.assert_allclose(gram, rbf_kernel(cache.features(),
+                                                   gamma=gamma))
+    assert len(glob.glob(directory + '/gram-*.npy')) == 1
+
+    # a Gram matrix for a gamma resolved by an earlier version is replaced
+    fn_index = directory + '/index.json'
+    with open(fn_index) as f:
+        index = json.load(f)
+    (key, entry), = index['grams'].items()
+    entry['params']['gamma'] = gamma * 2
+    os.rename(directory + '/' + entry['filename'], directory + '/gram-stale.npy')  # noqa: pycodestyle
+    entry['filename'] = 'gram-stale.npy'
+    index['grams']['stale'] = index['grams'].pop(key)
+    with open(fn_index, 'w') as f:
+        json.dump(index, f)
+    numpy.testing.assert_allclose(KernelCache(directory).gram(), gram)
+    assert glob.glob(directory + '/gram-*.npy') == [directory + '/gram-{}.npy'.format(key)]  # noqa: pycodestyle
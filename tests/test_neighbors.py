@@ -0,0 +1,67 @@
+import numpy
+import pytest
+from scipy import sparse
+
+from start_dbi.neighbors import BruteForceIndex, RandomProjectionIndex
+from start_dbi.model import LOF
+from start_dbi.trace import Trace
+
+
+def clustered(rng, num_rows, num_columns=100):
+    latent = rng.normal(size=(num_rows, 5))
+    mixing = rng.normal(size=(5, num_columns))
+    return numpy.abs(latent.dot(mixing) + 0.05 * rng.normal(size=(num_rows, num_columns)))  # noqa: pycodestyle
+
+
+def recall(expected, found):
+    return numpy.mean([len(set(e) & set(f)) / float(len(e))
+                       for (e, f) in zip(expected, found)])
+
+
+@pytest.mark.parametrize('as_sparse', [False, True])
+@pytest.mark.parametrize('exclude_self', [False, True])
+def test_approximate_matches_brute_force(as_sparse, exclude_self):
+    rng = numpy.random.RandomState(0)
+    matrix = clustered(rng, 3200)
+    if as_sparse:
+        matrix[matrix < 1.0] = 0.0
+        matrix = sparse.csr_matrix(matrix)
+    matrix, queries = matrix[:3000], matrix[3000:]
+    if exclude_self:
+        queries = matrix
+    exact_d, exact_i = BruteForceIndex(matrix).query(queries, 10, exclude_self)  # noqa: pycodestyle
+    index = RandomProjectionIndex(matrix)
+    d, i = index.query(queries, 10, exclude_self)
+    assert d.shape == i.shape == (queries.shape[0], 10)
+    assert (numpy.diff(d, axis=1) >= 0).all()
+    assert recall(exact_i, i) > 0.9
+    if exclude_self:
+        assert (i != numpy.arange(len(i))[:, None]).all()
+    # distances to the neighbors that are found are exact
+    numpy.testing.assert_allclose(d[:, 0], numpy.minimum(d[:, 0], exact_d[:, -1]))  # noqa: pycodestyle
+    rows = matrix[i[:, 0]]
+    delta = queries - rows
+    if sparse.issparse(delta):
+        delta = delta.toarray()
+    numpy.testing.assert_allclose(d[:, 0], numpy.sqrt((numpy.asarray(delta) ** 2).sum(axis=1)), rtol=1e-6, atol=1e-6)  # noqa: pycodestyle
+
+
+def test_small_index():
+    matrix = numpy.arange(6, dtype=numpy.float64).reshape(3, 2)
+    d, i = RandomProjectionIndex(matrix, candidates=10).query(matrix, 5, exclude_self=True)  # noqa: pycodestyle
+    assert i.shape == (3, 2)
+    numpy.testing.assert_allclose(d[:, 0], numpy.sqrt(8.0))
+    numpy.testing.assert_array_equal(i[[0, 2], 0], [1, 1])
+
+
+def test_approximate_lof_round_trip(tmp_path):
+    rng = numpy.random.RandomState(1)
+    signals = ['s{}'.format(j) for j in range(100)]
+    traces = [Trace.from_arrays(signals, row) for row in clustered(rng, 550)]
+    lof = LOF.build(traces[:500], algorithm='approximate', neighbors=10)
+    filename = str(tmp_path / 'model.lof')
+    lof.to_file(filename)
+    loaded = LOF.from_file(filename)
+    tests = traces[500:]
+    numpy.testing.assert_allclose(loaded.check_many(tests)[1],
+                                  lof.check_many(tests)[1])
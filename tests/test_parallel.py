@@ -0,0 +1,78 @@
+import pytest
+
+from start_dbi.parallel import PORT_STRIDE, isolate_ports, generate_many
+
+
+class Sitl(object):
+    def __init__(self, port=5760, sim_port=5501, name='copter'):
+        self.port = port
+        self.sim_port = sim_port
+        self.name = name
+
+
+class Portless(object):
+    pass
+
+
+def test_isolate_ports_offsets_copies():
+    sitl = Sitl()
+    attack = Sitl(port=14550)
+    job = isolate_ports({'sitl': sitl, 'attack': attack}, 3)
+    assert job['sitl'].port == 5760 + 3 * PORT_STRIDE
+    assert job['sitl'].sim_port == 5501 + 3 * PORT_STRIDE
+    assert job['sitl'].name == 'copter'
+    assert job['attack'].port == 14550 + 3 * PORT_STRIDE
+    assert sitl.port == 5760 and attack.port == 14550
+
+
+def test_isolate_ports_requires_ports_when_shared():
+    with pytest.raises(ValueError):
+        isolate_ports({'sitl': Portless()}, 1)
+    assert isinstance(isolate_ports({'sitl': Portless()}, 0, shared=False)['sitl'], Portless)  # noqa: pycodestyle
+
+
+def test_generate_many_refuses_colliding_workers():
+    jobs = [{'sitl': Portless(), 'mission': None, 'timeout_mission': 1}]
+    with pytest.raises(ValueError):
+        list(generate_many(jobs, workers=2))
+
+
+def test_generate_many_without_jobs():
+    assert list(generate_many([], workers=2)) == []
+
+
+def test_ports_do_not_change_cache_keys():
+    from start_dbi.cache import TraceCache
+    job = {'sitl': Sitl(), 'attack': Sitl(port=14550)}
+    isolated = isolate_ports(job, 2)
+
+    def key(job):
+        return TraceCache.key(job['sitl'], None, job['attack'], 'valgrind',
+                              '', 600, 60, 15)
+    assert key(job) == key(isolated)
+    assert key(job) != key({'sitl': Sitl(name='plane'), 'attack': None})
+
+
+def _worker_directories(_):
+    import os
+    import tempfile
+    return os.getcwd(), tempfile.gettempdir()
+
+
+def test_workers_keep_working_directory(tmp_path):
+    import multiprocessing
+    import os
+    from start_dbi.parallel import _initialize_worker
+    indices = multiprocessing.Queue()
+    for i in range(2):
+        indices.put(i)
+    pool = multiprocessing.Pool(2, initializer=_initialize_worker,
+                                initargs=(indices, str(tmp_path), None, True))
+    try:
+        directories = pool.map(_worker_directories, range(4))
+    finally:
+        pool.close()
+        pool.join()
+    for (cwd, dir_tmp) in directories:
+        assert cwd == os.getcwd()
+        assert dir_tmp.startswith(str(tmp_path))
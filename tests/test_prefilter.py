@@ -0,0 +1,106 @@
+import functools
+
+import numpy
+import pytest
+
+from start_dbi.model import Model
+from start_dbi.prefilter import Prefilter, NOMINAL, ANOMALOUS
+from start_dbi.trace import Trace
+
+SIGNALS = ['s{}'.format(i) for i in range(200)]
+
+
+@pytest.fixture
+def gaussian_traces(gaussian_traces):
+    return functools.partial(gaussian_traces, num_signals=len(SIGNALS))
+
+
+def svm_verdicts(model, traces):
+    plain = Model(model._Model__model, model.vocabulary, model.preprocessor)
+    return plain.check_many(traces)
+
+
+@pytest.mark.parametrize('params', [
+    {'nu': 0.5},
+    {'nu': 0.05},
+    {'nu': 0.05, 'gamma': 1e-3},
+    {'nu': 0.5, 'n_components': 10},
+    {'nu': 0.1, 'kernel': 'linear'},
+])
+def test_cascade_agrees_with_svm(params, gaussian_traces):
+    rng = numpy.random.RandomState(0)
+    train = gaussian_traces(rng, 300)
+    test = gaussian_traces(rng, 3000) + gaussian_traces(rng, 100, shift=80.0)
+    model = Model.build(train, prefilter=True, **params)
+    verdicts, scores = model.check_many(test)
+    expected, expected_scores = svm_verdicts(model, test)
+    numpy.testing.assert_array_equal(verdicts, expected)
+    scored = numpy.isfinite(scores)
+    numpy.testing.assert_allclose(scores[scored], expected_scores[scored])
+    stats = model.cascade_stats
+    assert sum(stats.values()) == len(test)
+
+
+def test_nominal_box_is_accepted_by_svm(gaussian_traces):
+    rng = numpy.random.RandomState(1)
+    train = gaussian_traces(rng, 300)
+    model = Model.build(train, prefilter=True, nu=0.05, gamma=1e-4)
+    arrays = model.prefilter.arrays
+    lower, upper = arrays['nominal_lower'], arrays['nominal_upper']
+    assert (lower <= upper).all()
+    # the corners of the box are its farthest points from the support vectors
+    corners = numpy.where(rng.random_sample((500, len(lower))) < 0.5,
+                          lower, upper)
+    traces = [Trace.from_arrays(SIGNALS, c) for c in corners]
+    assert (model.prefilter.classify(model.vocabulary.transform(traces)) == NOMINAL).all()  # noqa: pycodestyle
+    verdicts, _ = svm_verdicts(model, traces)
+    assert not verdicts.any()
+
+
+def test_anomalous_stage_resolves_distant_traces(gaussian_traces):
+    rng = numpy.random.RandomState(2)
+    model = Model.build(gaussian_traces(rng, 300), prefilter=True)
+    distant = gaussian_traces(rng, 50, shift=1000.0)
+    stages = model.prefilter.classify(model.vocabulary.transform(distant))
+    assert (stages == ANOMALOUS).all()
+    assert model.check(distant[0])[0] is True
+
+
+def test_check_returns_same_score_type_on_both_paths(gaussian_traces):
+    rng = numpy.random.RandomState(3)
+    model = Model.build(gaussian_traces(rng, 300), prefilter=True)
+    resolved = model.check(gaussian_traces(rng, 1, shift=1000.0)[0])
+    plain = Model(model._Model__model, model.vocabulary, model.preprocessor)
+    scored = plain.check(gaussian_traces(rng, 1, shift=1000.0)[0])
+    assert type(resolved[1]) is type(scored[1])
+    assert resolved[1].shape == scored[1].shape
+
+
+def test_prefilter_round_trip(tmp_path, gaussian_traces):
+    rng = numpy.random.RandomState(4)
+    model = Model.build(gaussian_traces(rng, 200), prefilter=True)
+    filename = str(tmp_path / 'model')
+    model.to_file(filename)
+    loaded = Model.from_file(filename)
+    for (name, array) in model.prefilter.arrays.items():
+        numpy.testing.assert_array_equal(loaded.prefilter.arrays[name], array)
+    test = gaussian_traces(rng, 100) + gaussian_traces(rng, 20, shift=1000.0)
+    numpy.testing.assert_array_equal(loaded.check_many(test)[0],
+                                     model.check_many(test)[0])
+
+
+def test_update_rederives_bounds(gaussian_traces):
+    rng = numpy.random.RandomState(5)
+    model = Model.build(gaussian_traces(rng, 200), prefilter=True, nu=0.2)
+    model.update(gaussian_traces(rng, 50, shift=5.0))
+    test = gaussian_traces(rng, 1000, shift=2.0)
+    numpy.testing.assert_array_equal(model.check_many(test)[0],
+                                     svm_verdicts(model, test)[0])
+
+
+def test_unsupported_kernel(gaussian_traces):
+    rng = numpy.random.RandomState(6)
+    with pytest.raises(ValueError):
+        Model.build(gaussian_traces(rng, 50), prefilter=True, kernel='poly')
+    with pytest.raises(ValueError):
+        Prefilter.fit(numpy.zeros((2, 2)), None, nominal_z=0.0)
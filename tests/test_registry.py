@@ -0,0 +1,77 @@
+import os
+
+import numpy
+import pytest
+
+from start_dbi.model import Model, LOF
+from start_dbi.registry import ModelRegistry
+
+
+@pytest.fixture
+def models(gaussian_traces):
+    rng = numpy.random.RandomState(0)
+    first = Model.build(gaussian_traces(rng, 100), nu=0.1)
+    second = Model.build(gaussian_traces(rng, 100, shift=30.0), nu=0.1)
+    tests = gaussian_traces(rng, 20, shift=15.0)
+    return first, second, tests
+
+
+def scores(model, traces):
+    return model.check_many(traces)[1]
+
+
+def test_reregistered_models_are_reloaded(tmp_path, models):
+    first, second, tests = models
+    registry = ModelRegistry(str(tmp_path))
+    filename = registry.register(first, 'scenario', 'mission')
+    numpy.testing.assert_allclose(
+        scores(registry.get('scenario', 'mission'), tests), scores(first, tests))  # noqa: pycodestyle
+    registry.get('scenario', 'mission')
+    assert registry.stats['loads'] == 1 and registry.stats['hits'] == 1
+
+    # another process replaces the model in the shared directory within the
+    # resolution of the modification time of the file
+    stat = os.stat(filename)
+    ModelRegistry(str(tmp_path)).register(second, 'scenario', 'mission')
+    os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    numpy.testing.assert_allclose(
+        scores(registry.get('scenario', 'mission'), tests), scores(second, tests))  # noqa: pycodestyle
+    assert registry.stats['loads'] == 2
+
+
+def test_revisions_fall_back_to_default(tmp_path, models):
+    first, second, tests = models
+    registry = ModelRegistry(str(tmp_path))
+    registry.register(first, 'scenario', 'mission')
+    registry.register(second, 'scenario', 'mission', revision='abc')
+    expected_first, expected_second = scores(first, tests), scores(second, tests)  # noqa: pycodestyle
+    numpy.testing.assert_allclose(
+        registry.check_many(tests, 'scenario', 'mission', revision='def')[1],
+        expected_first)
+    numpy.testing.assert_allclose(
+        registry.check_many(tests, 'scenario', 'mission', revision='abc')[1],
+        expected_second)
+    with pytest.raises(KeyError):
+        registry.get('scenario', 'other')
+    registry.remove('scenario', 'mission')
+    with pytest.raises(KeyError):
+        registry.get('scenario', 'mission', revision='def')
+    assert len(registry) == 1
+
+
+def test_least_recently_used_models_are_released(tmp_path, models,
+                                                 gaussian_traces):
+    first, second, tests = models
+    registry = ModelRegistry(str(tmp_path), capacity=2)
+    for mission in ('a', 'b', 'c'):
+        registry.register(first, 'scenario', mission)
+    lof = LOF.build(gaussian_traces(numpy.random.RandomState(1), 50),
+                    neighbors=5)
+    registry.register(lof, 'scenario', 'd')
+    for mission in ('a', 'b', 'a', 'c', 'd'):
+        registry.get('scenario', mission)
+    stats = registry.stats
+    assert stats['loaded'] == 2
+    assert stats['loads'] == 4 and stats['hits'] == 1
+    assert stats['evictions'] == 2
+    assert isinstance(registry.get('scenario', 'd'), LOF)
@@ -0,0 +1,88 @@
+import base64
+import json
+import threading
+
+import numpy
+import pytest
+
+from start_dbi.model import Model
+from start_dbi.server import ScoringServer, ScoringClient
+from start_dbi.trace import Trace
+
+SIGNALS = ['a', 'b', 'c', 'd']
+
+
+@pytest.fixture
+def model():
+    rng = numpy.random.RandomState(0)
+    traces = [Trace.from_arrays(SIGNALS, v)
+              for v in numpy.abs(rng.normal(100.0, 10.0, size=(100, 4)))]
+    return Model.build(traces, nu=0.1)
+
+
+@pytest.fixture
+def filename_socket(tmp_path):
+    return str(tmp_path / 'scoring.sock')
+
+
+def test_scores_match_model(model, filename_socket, tmp_path):
+    nominal = Trace.from_arrays(SIGNALS, [100, 100, 100, 100])
+    attack = Trace.from_arrays(SIGNALS, [1000, 0, 0, 1000])
+    fn_trace = str(tmp_path / 'attack.btrace')
+    attack.to_file(fn_trace)
+    with ScoringServer(filename_socket, {'nominal': model}):
+        with ScoringClient(filename_socket) as client:
+            response = client.score(trace=nominal)
+            assert response['compromised'] is False
+            assert response['model'] == 'nominal'
+            assert response['score'] == pytest.approx(model.check_many([nominal])[1][0])  # noqa: pycodestyle
+            assert client.score(path=fn_trace)['compromised'] is True
+            assert client.check(attack)[0] is True
+            assert client.check(nominal) is False
+
+
+def test_errors(model, filename_socket, tmp_path):
+    with ScoringServer(filename_socket, {'nominal': model}):
+        with ScoringClient(filename_socket, model='other') as client:
+            with pytest.raises(ValueError):
+                client.score(path=str(tmp_path / 'missing.btrace'))
+        with ScoringClient(filename_socket) as client:
+            with pytest.raises(ValueError):
+                client.score(path=str(tmp_path / 'missing.btrace'))
+            assert client.metrics()['errors'] == 2
+
+
+def test_metrics_count_every_response(model, filename_socket):
+    trace = Trace.from_arrays(SIGNALS, [100, 100, 100, 100])
+    num_clients, num_requests = 5, 10
+    with ScoringServer(filename_socket, {'nominal': model}):
+        def run():
+            with ScoringClient(filename_socket) as client:
+                for _ in range(num_requests):
+                    client.score(trace=trace)
+        threads = [threading.Thread(target=run) for _ in range(num_clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with ScoringClient(filename_socket) as client:
+            metrics = client.metrics()
+    assert metrics['requests'] == num_clients * num_requests
+    assert metrics['errors'] == 0
+    assert metrics['batches'] <= num_clients * num_requests
+    assert set(metrics['latency']) == {'p50', 'p90', 'p99', 'max'}
+
+
+def test_metrics_are_recorded_before_responding(model, filename_socket):
+    trace = Trace.from_arrays(SIGNALS, [100, 100, 100, 100])
+    done = threading.Event()
+    seen = []
+    with ScoringServer(filename_socket, {'nominal': model}) as server:
+        def respond(response):
+            seen.append(server.metrics['requests'])
+            done.set()
+        request = {'id': 0,
+                   'trace': base64.b64encode(trace.to_bytes()).decode('ascii')}
+        server._handle(json.dumps(request).encode('utf-8'), respond)
+        assert done.wait(10.0)
+    assert seen == [1]
@@ -0,0 +1,57 @@
+import os
+
+import numpy
+import pytest
+
+from start_dbi.model import Model, LOF
+from start_dbi.store import TraceStore
+from start_dbi.streaming import reduce_traces
+
+
+@pytest.fixture
+def corpus(gaussian_traces):
+    rng = numpy.random.RandomState(0)
+    traces = gaussian_traces(rng, 250)
+    tests = gaussian_traces(rng, 50) + gaussian_traces(rng, 10, shift=50.0)
+    return traces, tests
+
+
+def sources(traces, tmp_path):
+    store = TraceStore(str(tmp_path / 'store'))
+    for trace in traces:
+        store.append(trace)
+    return [lambda: iter(traces), (t for t in traces), store]
+
+
+def test_streaming_matches_build(tmp_path, corpus):
+    traces, tests = corpus
+    expected = Model.build(traces, nu=0.1).check_many(tests)
+    for source in sources(traces, tmp_path):
+        model = Model.build_streaming(source, chunk_size=40, nu=0.1)
+        verdicts, scores = model.check_many(tests)
+        numpy.testing.assert_array_equal(verdicts, expected[0])
+        numpy.testing.assert_allclose(scores, expected[1], rtol=1e-6)
+
+
+def test_lof_streaming_matches_build(tmp_path, corpus):
+    traces, tests = corpus
+    lof = LOF.build(traces, neighbors=5)
+    streamed = LOF.build_streaming(lambda: iter(traces), chunk_size=40,
+                                   neighbors=5)
+    numpy.testing.assert_array_equal(streamed.labels, lof.labels)
+    numpy.testing.assert_array_equal(streamed.check_many(tests)[0],
+                                     lof.check_many(tests)[0])
+
+
+def test_reduce_traces_projects_and_cleans_up(tmp_path, corpus):
+    traces, _ = corpus
+    dir_spool = str(tmp_path / 'spool')
+    os.makedirs(dir_spool)
+    vocabulary, preprocessor, matrix = \
+        reduce_traces((t for t in traces), chunk_size=40, n_components=4,
+                      dir_spool=dir_spool)
+    assert len(vocabulary) == 10
+    assert matrix.shape == (250, 4)
+    assert os.listdir(dir_spool) == []
+    with pytest.raises(ValueError):
+        reduce_traces(lambda: iter([]))
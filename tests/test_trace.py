@@ -0,0 +1,67 @@
+import numpy
+import pytest
+
+from start_dbi.metrics import TraceMetrics
+from start_dbi.trace import Trace, convert_traces
+
+
+def example():
+    signals = ['s{}'.format(i) for i in range(20)]
+    values = numpy.random.RandomState(0).exponential(100.0, size=20)
+    return Trace.from_arrays(signals, values)
+
+
+def test_binary_file_round_trip(tmp_path):
+    trace = example()
+    filename = str(tmp_path / 'a.btrace')
+    trace.to_file(filename)
+    loaded = Trace.from_file(filename)
+    assert loaded.signals == trace.signals
+    numpy.testing.assert_array_equal(loaded.array, trace.array)
+    assert loaded.digest() == trace.digest()
+    # the file may be overwritten whilst it is memory-mapped
+    Trace.from_arrays(trace.signals, trace.array * 2).to_file(filename)
+    numpy.testing.assert_array_equal(Trace.from_file(filename).array,
+                                     trace.array * 2)
+
+
+def test_bytes_round_trip():
+    trace = example()
+    loaded = Trace.from_bytes(trace.to_bytes())
+    assert loaded.signals == trace.signals
+    assert loaded.values == trace.values
+    empty = Trace.from_bytes(Trace.from_arrays([], []).to_bytes())
+    assert empty.signals == [] and empty.values == []
+    with pytest.raises(ValueError):
+        Trace.from_bytes(b'NOTATRACE' + trace.to_bytes()[9:])
+    with pytest.raises(ValueError):
+        Trace.from_bytes(trace.to_bytes()[:-1])
+
+
+def test_convert_text_traces(tmp_path):
+    trace = example()
+    trace.to_file(str(tmp_path / 'a.trace'))
+    filenames = convert_traces(str(tmp_path), str(tmp_path / 'binary'),
+                               remove=True)
+    assert len(filenames) == 1 and filenames[0].endswith('a.btrace')
+    assert not (tmp_path / 'a.trace').exists()
+    loaded = Trace.from_file(filenames[0])
+    assert loaded.signals == trace.signals
+    numpy.testing.assert_allclose(loaded.array, trace.array)
+
+
+def test_normalized_does_not_depend_on_duration():
+    trace = example()
+    longer = Trace.from_arrays(trace.signals, trace.array * 3)
+    normalized = trace.normalized()
+    assert normalized.array.sum() == pytest.approx(1.0)
+    numpy.testing.assert_allclose(longer.normalized().array, normalized.array)
+    with pytest.raises(ValueError):
+        Trace.from_arrays(['a'], [0.0]).normalized()
+
+
+def test_metrics_read_legacy_simulated_duration():
+    metrics = TraceMetrics.from_dict({'phases': [], 'simulated_duration': 4.0})
+    assert metrics.estimated_simulated_duration == 4.0
+    metrics = TraceMetrics.from_dict(metrics.to_dict())
+    assert metrics.estimated_simulated_duration == 4.0
@@ -0,0 +1,58 @@
+import functools
+
+import numpy
+import pytest
+
+from start_dbi.features import Reservoir
+from start_dbi.model import Model
+
+SIGNALS = ['s{}'.format(i) for i in range(20)]
+
+
+@pytest.fixture
+def gaussian_traces(gaussian_traces):
+    return functools.partial(gaussian_traces, num_signals=len(SIGNALS))
+
+
+def false_positive_rate(model, traces):
+    return model.check_many(traces)[0].mean()
+
+
+def test_update_does_not_drift(gaussian_traces):
+    rng = numpy.random.RandomState(0)
+    holdout = gaussian_traces(rng, 2000)
+    for reservoir_size in (2000, 200):
+        model = Model.build(gaussian_traces(rng, 400), nu=0.5,
+                            reservoir_size=reservoir_size)
+        initial = false_positive_rate(model, holdout)
+        for _ in range(5):
+            model.update(gaussian_traces(rng, 100))
+            assert abs(false_positive_rate(model, holdout) - initial) < 0.1
+
+
+def test_update_survives_round_trip(tmp_path, gaussian_traces):
+    rng = numpy.random.RandomState(1)
+    model = Model.build(gaussian_traces(rng, 300), nu=0.3)
+    filename = str(tmp_path / 'model')
+    model.update(gaussian_traces(rng, 100), filename=filename)
+    loaded = Model.from_file(filename)
+    updates = gaussian_traces(rng, 100)
+    model.update(updates)
+    loaded.update(updates)
+    holdout = gaussian_traces(rng, 500)
+    numpy.testing.assert_allclose(loaded.check_many(holdout)[1],
+                                  model.check_many(holdout)[1])
+
+
+def test_reservoir_is_uniform():
+    reservoir = Reservoir(500)
+    rows = numpy.arange(10000, dtype=numpy.float64).reshape(-1, 1)
+    for chunk in numpy.array_split(rows, 7):
+        reservoir.add(chunk)
+    assert reservoir.matrix.shape == (500, 1)
+    assert reservoir.num_seen == 10000
+    sample = reservoir.matrix.ravel()
+    assert len(numpy.unique(sample)) == 500
+    for quarter in range(4):
+        inside = (sample >= quarter * 2500) & (sample < (quarter + 1) * 2500)
+        assert abs(inside.sum() - 125) < 40